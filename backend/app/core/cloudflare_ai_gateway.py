@@ -7,10 +7,36 @@ as specified in the project documentation.
 
 import httpx
 import os
-from typing import Dict, Any, Optional, AsyncGenerator
+from typing import Dict, Any, List, Optional, AsyncGenerator, AsyncIterator, Union
+import time
 from pydantic import BaseModel
-import json
 import asyncio
+import logging
+
+from .gateway_batching import EmbeddingBatcher
+from .embedding_store import EmbeddingStore
+from .gateway_cache import ResponseCache, canonical_json, payload_key
+from . import gateway_metrics as metrics
+from .gateway_resilience import LatencyBudgetExceeded, RequestExecutor, is_retryable, latency_budget
+from .gateway_routing import EndpointRouter, GatewayEndpoint
+from .gateway_scheduler import BACKGROUND, GatewayScheduler, request_priority
+from .gateway_singleflight import SingleFlight
+from .prompt_budget import PromptBudgeter, message_text
+from .semantic_cache import SemanticCache
+from .sse import SSEParser, StreamAccumulator
+from .stream_fanout import StreamHub
+
+try:
+    import h2  # noqa: F401 - required by httpx for HTTP/2
+    _HTTP2_AVAILABLE = True
+except ImportError:  # pragma: no cover - falls back to HTTP/1.1
+    _HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Keyword arguments of `chat_completion` that steer the gateway itself rather
+# than the model; proxies must not let clients set them through the request body.
+GATEWAY_OPTIONS = frozenset({"stream", "use_cache", "accumulator", "latency_budget", "priority"})
 
 
 class CloudflareAIGatewayConfig(BaseModel):
@@ -18,23 +44,138 @@ class CloudflareAIGatewayConfig(BaseModel):
     account_id: str
     api_token: str
     gateway_url: str = "https://api.cloudflare.com/client/v4/accounts/{account_id}/ai/v1"
+    endpoints: List[GatewayEndpoint] = []
+    breaker_failure_threshold: int = 5
+    breaker_reset_timeout: float = 30.0
+    request_timeout: float = 30.0
+    http2: bool = True
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    warmup_connections: int = 2
+    latency_budget: Optional[float] = None
+    max_retries: int = 2
+    retry_backoff_base: float = 0.2
+    retry_backoff_max: float = 5.0
+    hedge_enabled: bool = False
+    hedge_percentile: float = 95.0
+    hedge_min_delay: float = 0.05
+    max_concurrency: int = 64
+    model_rate_limit: Optional[float] = None
+    model_rate_limits: Dict[str, float] = {}
+    account_rate_limit: Optional[float] = None
+    known_models: List[str] = []
+    max_model_labels: int = 64
+    interactive_weight: int = 4
+    prompt_token_budget: Optional[int] = None
+    prompt_accounting: bool = False
+    prompt_summary_model: Optional[str] = None
+    cache_enabled: bool = False
+    cache_ttl: float = 300.0
+    cache_max_entries: int = 1024
+    cache_redis_url: Optional[str] = None
+    coalesce_requests: bool = False
+    stream_fanout: bool = False
+    stream_fanout_buffer: int = 4096
+    embedding_batch_enabled: bool = False
+    embedding_batch_max_size: int = 64
+    embedding_batch_max_wait: float = 0.005
+    embedding_store_path: Optional[str] = None
+    semantic_cache_enabled: bool = False
+    semantic_cache_embedding_model: str = "openai/text-embedding-3-small"
+    semantic_cache_threshold: float = 0.95
+    semantic_cache_max_entries: int = 10000
+    semantic_cache_ttl: float = 3600.0
+    semantic_cache_max_namespaces: int = 1024
+    semantic_cache_max_total_entries: int = 1000000
+    semantic_cache_ivf_threshold: int = 100000
     
     @property
     def base_url(self) -> str:
         return self.gateway_url.format(account_id=self.account_id)
+    
+    def endpoint_pool(self) -> List[GatewayEndpoint]:
+        """Configured endpoints, or the single `gateway_url` endpoint."""
+        if not self.endpoints:
+            return [GatewayEndpoint(name="default", base_url=self.base_url)]
+        return [
+            endpoint.model_copy(update={"base_url": endpoint.base_url.format(account_id=self.account_id)})
+            for endpoint in self.endpoints
+        ]
 
 
 class CloudflareAIGateway:
     """Client for Cloudflare AI Gateway integration."""
     
-    def __init__(self, config: CloudflareAIGatewayConfig):
+    def __init__(self, config: CloudflareAIGatewayConfig, client: Optional[httpx.AsyncClient] = None):
         self.config = config
-        self.client = httpx.AsyncClient(
-            headers={
-                "Authorization": f"Bearer {config.api_token}",
-                "Content-Type": "application/json"
-            },
-            timeout=30.0
+        self._owns_client = client is None
+        self.client = client if client is not None else create_gateway_http_client(config)
+        self.router = EndpointRouter(
+            config.endpoint_pool(),
+            failure_threshold=config.breaker_failure_threshold,
+            reset_timeout=config.breaker_reset_timeout
+        )
+        self.scheduler = GatewayScheduler(
+            max_concurrency=config.max_concurrency,
+            model_rate=config.model_rate_limit,
+            model_rates=config.model_rate_limits,
+            account_rate=config.account_rate_limit,
+            interactive_weight=config.interactive_weight
+        )
+        self.executor = RequestExecutor(
+            max_retries=config.max_retries,
+            backoff_base=config.retry_backoff_base,
+            backoff_max=config.retry_backoff_max,
+            hedge_enabled=config.hedge_enabled,
+            hedge_percentile=config.hedge_percentile,
+            hedge_min_delay=config.hedge_min_delay
+        )
+        self.cache: Optional[ResponseCache] = None
+        if config.cache_enabled:
+            self.cache = ResponseCache(
+                ttl=config.cache_ttl,
+                max_entries=config.cache_max_entries,
+                redis_url=config.cache_redis_url
+            )
+        self.singleflight: Optional[SingleFlight] = SingleFlight() if config.coalesce_requests else None
+        self.stream_hub: Optional[StreamHub] = None
+        if config.stream_fanout:
+            self.stream_hub = StreamHub(max_buffer=config.stream_fanout_buffer)
+        self.embedding_batcher: Optional[EmbeddingBatcher] = None
+        if config.embedding_batch_enabled:
+            self.embedding_batcher = EmbeddingBatcher(
+                self._embedding_list,
+                max_batch_size=config.embedding_batch_max_size,
+                max_wait=config.embedding_batch_max_wait
+            )
+        self.embedding_store: Optional[EmbeddingStore] = None
+        if config.embedding_store_path:
+            self.embedding_store = EmbeddingStore(config.embedding_store_path)
+        self.malformed_chunks = 0
+        self.prompt_budgeter: Optional[PromptBudgeter] = None
+        if config.prompt_token_budget is not None or config.prompt_accounting:
+            self.prompt_budgeter = PromptBudgeter(
+                budget=config.prompt_token_budget,
+                summarizer=self._summarize_turns if config.prompt_summary_model else None
+            )
+        self.semantic_cache: Optional[SemanticCache] = None
+        if config.semantic_cache_enabled:
+            self.semantic_cache = SemanticCache(
+                threshold=config.semantic_cache_threshold,
+                max_entries=config.semantic_cache_max_entries,
+                ttl=config.semantic_cache_ttl,
+                max_namespaces=config.semantic_cache_max_namespaces,
+                max_total_entries=config.semantic_cache_max_total_entries,
+                ivf_threshold=config.semantic_cache_ivf_threshold
+            )
+        metrics.STATS_COLLECTOR.add(self)
+        # Model names are client input: metrics, routing stats and rate-limit buckets are
+        # keyed by their bounded label, so unknown models cannot grow them without limit.
+        metrics.MODEL_LABELS.configure(
+            [*config.known_models, *config.model_rate_limits],
+            allow_list=bool(config.known_models),
+            limit=config.max_model_labels,
         )
     
     async def chat_completion(
@@ -42,8 +183,12 @@ class CloudflareAIGateway:
         model: str,
         messages: list,
         stream: bool = False,
+        use_cache: bool = True,
+        accumulator: Optional[StreamAccumulator] = None,
+        latency_budget: Optional[float] = None,
+        priority: Optional[str] = None,
         **kwargs
-    ) -> Dict[str, Any]:
+    ) -> Union[Dict[str, Any], AsyncGenerator[Dict[str, Any], None]]:
         """
         Create a chat completion using Cloudflare AI Gateway.
         
@@ -51,11 +196,23 @@ class CloudflareAIGateway:
             model: The model to use (e.g., "openai/gpt-4", "anthropic/claude-3-sonnet")
             messages: List of messages in OpenAI format
             stream: Whether to stream the response
+            use_cache: Whether a non-streaming call may be served from the response
+                or semantic cache
+            accumulator: When streaming, collects the chunks into the final message
+            latency_budget: Seconds a non-streaming call may take, retries and
+                hedges included (defaults to the configured budget)
+            priority: Scheduling lane, "interactive" (default) or "background"
             **kwargs: Additional parameters for the model
         
         Returns:
-            Response from the AI model
+            Response from the AI model, or an async generator of response
+            chunks when streaming
+        
+        Raises:
+            PromptTooLarge: If a prompt token budget is configured and the
+                messages cannot be trimmed to fit it
         """
+        messages = await self._fit_prompt(model, messages)
         payload = {
             "model": model,
             "messages": messages,
@@ -64,45 +221,265 @@ class CloudflareAIGateway:
         }
         
         if stream:
-            return await self._stream_completion(payload)
+            return self._stream_completion(payload, accumulator, priority)
         else:
+            with self._budget(latency_budget), request_priority(priority):
+                return await self._cached_completion(payload, use_cache)
+    
+    async def _fit_prompt(self, model: str, messages: list) -> list:
+        """Apply the prompt token budget (if any) and record the prompt size."""
+        if self.prompt_budgeter is None:
+            return messages
+        messages, report = await self.prompt_budgeter.fit(model, messages)
+        metrics.PROMPT_TOKENS.labels(metrics.MODEL_LABELS(model)).observe(report.final_tokens)
+        logger.debug(
+            f"Prompt for {model}: {report.final_tokens} tokens "
+            f"({report.original_tokens} before trimming, {report.dropped_messages} messages dropped)"
+        )
+        return messages
+    
+    async def _cached_completion(self, payload: Dict[str, Any], use_cache: bool) -> Dict[str, Any]:
+        """Non-streaming completion served through the response caches and single-flight layer."""
+        cache = self.cache if use_cache else None
+        semantic_cache = self.semantic_cache if use_cache else None
+        if cache is None and semantic_cache is None and self.singleflight is None:
             return await self._completion(payload)
+        
+        key = payload_key(payload, "chat")
+        if cache is not None:
+            cached = await cache.get(key)
+            if cached is not None:
+                return cached
+        
+        prompt_vector = None
+        namespace = None
+        if semantic_cache is not None:
+            prompt_vector = await self._prompt_embedding(payload["messages"])
+            if prompt_vector is not None:
+                namespace = _semantic_namespace(payload)
+                cached = semantic_cache.lookup(namespace, prompt_vector)
+                if cached is not None:
+                    return cached
+        
+        async def fetch() -> Dict[str, Any]:
+            response = await self._completion(payload)
+            if cache is not None:
+                await cache.set(key, response)
+            if prompt_vector is not None:
+                semantic_cache.add(namespace, prompt_vector, response)
+            return response
+        
+        return await self._coalesce(key, fetch)
+    
+    async def _summarize_turns(self, turns: List[Dict[str, Any]]) -> str:
+        """Summarize conversation turns dropped by the prompt budgeter."""
+        transcript = "\n".join(f"{turn.get('role')}: {message_text(turn)}" for turn in turns)
+        payload = {
+            "model": self.config.prompt_summary_model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": "Summarize this conversation in a few sentences. "
+                               "Keep facts, decisions and open questions."
+                },
+                {"role": "user", "content": transcript[-16000:]}
+            ],
+            "stream": False
+        }
+        # Not routed through chat_completion: the summary request must not be budgeted itself.
+        response = await self._cached_completion(payload, use_cache=True)
+        return response["choices"][0]["message"]["content"]
+    
+    async def _prompt_embedding(self, messages: list) -> Optional[List[float]]:
+        """Embed the final user message for the semantic cache; None if unavailable."""
+        text = _last_user_text(messages)
+        if not text:
+            return None
+        try:
+            response = await self.embedding(self.config.semantic_cache_embedding_model, text)
+            return response["data"][0]["embedding"]
+        except Exception as e:
+            logger.warning(f"Semantic cache skipped, prompt embedding failed: {e}")
+            return None
+    
+    async def _coalesce(self, key: str, fn) -> Dict[str, Any]:
+        """Share one upstream call between concurrent identical requests when enabled."""
+        if self.singleflight is None:
+            return await fn()
+        return await self.singleflight.do(key, fn)
     
     async def _completion(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         """Non-streaming completion."""
-        url = f"{self.config.base_url}/chat/completions"
-        
         try:
-            response = await self.client.post(url, json=payload)
-            response.raise_for_status()
-            return response.json()
+            return await self._post_json("/chat/completions", payload, "chat")
+        except LatencyBudgetExceeded as e:
+            metrics.observe_budget_exceeded("chat", metrics.MODEL_LABELS(str(payload.get("model"))))
+            raise Exception(f"Cloudflare AI Gateway request exceeded its latency budget: {e}") from e
         except httpx.HTTPError as e:
-            raise Exception(f"Cloudflare AI Gateway request failed: {e}")
+            raise Exception(f"Cloudflare AI Gateway request failed: {e}") from e
     
-    async def _stream_completion(self, payload: Dict[str, Any]) -> AsyncGenerator[str, None]:
+    async def _post_json(self, path: str, payload: Dict[str, Any], kind: str) -> Dict[str, Any]:
+        """POST a JSON payload with routing, retries, hedging and the current latency budget."""
+        model = metrics.MODEL_LABELS(str(payload.get("model")))
+        tried: List[str] = []
+        
+        async def attempt() -> Dict[str, Any]:
+            # Each attempt (retry or hedge) prefers an endpoint this call has not tried yet.
+            endpoint = self.router.choose(model, exclude=tried)
+            tried.append(endpoint.name)
+            try:
+                async with self.scheduler.slot(model, endpoint.name):
+                    started = time.monotonic()
+                    try:
+                        response = await self.client.post(
+                            f"{endpoint.base_url}{path}",
+                            json=payload,
+                            headers=_endpoint_headers(endpoint)
+                        )
+                        response.raise_for_status()
+                        result = response.json()
+                    except Exception as e:
+                        elapsed = time.monotonic() - started
+                        self.router.record(endpoint, model, elapsed, ok=not is_retryable(e))
+                        metrics.observe_attempt(kind, model, endpoint.name, elapsed, e)
+                        raise
+            finally:
+                self.router.release(endpoint)
+            elapsed = time.monotonic() - started
+            self.router.record(endpoint, model, elapsed, ok=True)
+            metrics.observe_attempt(kind, model, endpoint.name, elapsed, None)
+            return result
+        
+        return await self.executor.run(f"{kind}:{model}", attempt)
+    
+    def _budget(self, seconds: Optional[float]):
+        """Latency budget context for one public call."""
+        return latency_budget(seconds if seconds is not None else self.config.latency_budget)
+    
+    async def stream_chat_completion_raw(
+        self,
+        model: str,
+        messages: list,
+        priority: Optional[str] = None,
+        **kwargs
+    ) -> AsyncGenerator[bytes, None]:
+        """
+        Stream a chat completion as raw SSE frames, without decoding them.
+        
+        Intended for proxies: each yielded item is one complete
+        `data: ...` event (including its terminating blank line) exactly as
+        the gateway sent it. The closing `[DONE]` event is not yielded.
+        With stream fan-out enabled, identical concurrent requests share
+        one upstream stream and late subscribers replay it from the start.
+        
+        Args:
+            model: The model to use
+            messages: List of messages in OpenAI format
+            priority: Scheduling lane, "interactive" (default) or "background"
+            **kwargs: Additional parameters for the model
+        
+        Raises:
+            PromptTooLarge: If a prompt token budget is configured and the
+                messages cannot be trimmed to fit it
+        """
+        payload = {
+            "model": model,
+            "messages": await self._fit_prompt(model, messages),
+            "stream": True,
+            **kwargs
+        }
+        async for event in self._shared_events(payload, priority):
+            yield event.raw
+    
+    async def _stream_completion(
+        self,
+        payload: Dict[str, Any],
+        accumulator: Optional[StreamAccumulator] = None,
+        priority: Optional[str] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
         """Streaming completion."""
-        url = f"{self.config.base_url}/chat/completions"
+        async for event in self._shared_events(payload, priority):
+            try:
+                chunk = event.json()
+            except ValueError:
+                self.malformed_chunks += 1
+                logger.warning(f"Skipping malformed stream chunk: {event.data[:200]!r}")
+                continue
+            if accumulator is not None:
+                accumulator.add(chunk)
+            yield chunk
+    
+    def _shared_events(self, payload: Dict[str, Any], priority: Optional[str] = None) -> AsyncIterator[Any]:
+        """Stream events, shared with identical concurrent streams when fan-out is enabled."""
+        if self.stream_hub is None:
+            return self._stream_events(payload, priority)
+        return self.stream_hub.subscribe(
+            payload_key(payload, "chat_stream"),
+            lambda: self._stream_events(payload, priority)
+        )
+    
+    async def _stream_events(
+        self,
+        payload: Dict[str, Any],
+        priority: Optional[str] = None
+    ) -> AsyncGenerator[Any, None]:
+        """Parsed SSE events of a streaming completion, up to `[DONE]`."""
+        model = metrics.MODEL_LABELS(str(payload.get("model")))
+        endpoint = self.router.choose(model)
+        parser = SSEParser()
         
         try:
-            async with self.client.stream("POST", url, json=payload) as response:
-                response.raise_for_status()
-                async for line in response.aiter_lines():
-                    if line.startswith("data: "):
-                        data = line[6:]  # Remove "data: " prefix
-                        if data.strip() == "[DONE]":
-                            break
-                        try:
-                            chunk = json.loads(data)
-                            yield chunk
-                        except json.JSONDecodeError:
-                            continue
+            # The scheduler slot is held for the whole stream.
+            await self.scheduler.acquire(model, endpoint.name, priority)
+        except BaseException:
+            self.router.release(endpoint)
+            raise
+        started = time.monotonic()
+        timer = metrics.StreamTimer(model, endpoint.name, started)
+        
+        try:
+            async with self.client.stream(
+                "POST",
+                f"{endpoint.base_url}/chat/completions",
+                json=payload,
+                headers=_endpoint_headers(endpoint)
+            ) as response:
+                try:
+                    response.raise_for_status()
+                except httpx.HTTPStatusError as e:
+                    self.router.record(endpoint, model, time.monotonic() - started, ok=not is_retryable(e))
+                    metrics.observe_attempt("chat_stream", model, endpoint.name, time.monotonic() - started, e)
+                    await response.aread()  # so callers can relay the error body
+                    raise
+                self.router.record(endpoint, model, time.monotonic() - started, ok=True)
+                async for data in response.aiter_bytes():
+                    for event in parser.feed(data):
+                        if event.is_done:
+                            return
+                        timer.event(time.monotonic())
+                        yield event
+                for event in parser.flush():
+                    if event.is_done:
+                        return
+                    timer.event(time.monotonic())
+                    yield event
+        except httpx.TransportError as e:
+            self.router.record(endpoint, model, time.monotonic() - started, ok=False)
+            metrics.observe_attempt("chat_stream", model, endpoint.name, time.monotonic() - started, e)
+            raise Exception(f"Cloudflare AI Gateway streaming request failed: {e}") from e
         except httpx.HTTPError as e:
-            raise Exception(f"Cloudflare AI Gateway streaming request failed: {e}")
+            raise Exception(f"Cloudflare AI Gateway streaming request failed: {e}") from e
+        finally:
+            timer.finish()
+            self.scheduler.release()
+            self.router.release(endpoint)
     
     async def embedding(
         self,
         model: str,
         input_text: str,
+        latency_budget: Optional[float] = None,
+        priority: Optional[str] = None,
         **kwargs
     ) -> Dict[str, Any]:
         """
@@ -111,6 +488,8 @@ class CloudflareAIGateway:
         Args:
             model: The embedding model to use
             input_text: Text to embed
+            latency_budget: Seconds the call may take, retries included
+            priority: Scheduling lane, "interactive" (default) or "background"
             **kwargs: Additional parameters
         
         Returns:
@@ -122,18 +501,138 @@ class CloudflareAIGateway:
             **kwargs
         }
         
-        url = f"{self.config.base_url}/embeddings"
+        namespace = _embedding_namespace(model, kwargs)
+        if self.embedding_store is not None:
+            vector = self.embedding_store.get(namespace, input_text)
+            if vector is not None:
+                return _embedding_response(model, [vector.tolist()])
+        
+        async def fetch() -> Dict[str, Any]:
+            if self.embedding_batcher is not None:
+                response = await self.embedding_batcher.submit(model, input_text, **kwargs)
+            else:
+                response = await self._embedding(payload)
+            self._remember_embeddings(namespace, [input_text], response)
+            return response
+        
+        with self._budget(latency_budget), request_priority(priority):
+            if self.singleflight is None:
+                return await fetch()
+            return await self._coalesce(payload_key(payload, "embeddings"), fetch)
+    
+    async def embeddings(
+        self,
+        model: str,
+        inputs: List[str],
+        latency_budget: Optional[float] = None,
+        priority: Optional[str] = BACKGROUND,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """
+        Create embeddings for many texts with as few upstream calls as possible.
+        
+        Texts already in the embedding store are served locally; the rest are
+        sent as list requests of at most `embedding_batch_max_size` texts
+        each, issued concurrently.
+        
+        Args:
+            model: The embedding model to use
+            inputs: Texts to embed
+            latency_budget: Seconds the call may take, retries included
+            priority: Scheduling lane; bulk embedding defaults to "background"
+            **kwargs: Additional parameters
+        
+        Returns:
+            Embedding response with one "data" item per input, in input order
+        """
+        namespace = _embedding_namespace(model, kwargs)
+        vectors: List[Any] = [None] * len(inputs)
+        if self.embedding_store is not None:
+            for i, vector in enumerate(self.embedding_store.get_many(namespace, inputs)):
+                if vector is not None:
+                    vectors[i] = vector.tolist()
+        
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        size = max(1, self.config.embedding_batch_max_size)
+        chunks = [missing[i:i + size] for i in range(0, len(missing), size)]
+        with self._budget(latency_budget), request_priority(priority):
+            responses = await asyncio.gather(
+                *(self._embedding_list(model, [inputs[i] for i in chunk], kwargs) for chunk in chunks)
+            )
+        
+        usage: Dict[str, int] = {}
+        for chunk, response in zip(chunks, responses):
+            for item in response.get("data") or []:
+                vectors[chunk[item.get("index", 0)]] = item["embedding"]
+            for name, value in (response.get("usage") or {}).items():
+                if isinstance(value, int):
+                    usage[name] = usage.get(name, 0) + value
+            self._remember_embeddings(namespace, [inputs[i] for i in chunk], response)
         
+        result = _embedding_response(model, vectors)
+        if usage:
+            result["usage"] = usage
+        return result
+    
+    async def _embedding_list(self, model: str, inputs: List[str], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Send one list-input embedding request."""
+        return await self._embedding({"model": model, "input": inputs, **kwargs})
+    
+    def _remember_embeddings(self, namespace: str, texts: List[str], response: Dict[str, Any]) -> None:
+        """Persist float vectors from an upstream response into the embedding store."""
+        if self.embedding_store is None:
+            return
+        items = sorted(response.get("data") or [], key=lambda item: item.get("index", 0))
+        vectors = [item.get("embedding") for item in items]
+        if len(vectors) != len(texts) or not all(isinstance(v, list) for v in vectors):
+            return  # e.g. base64 encoded output; nothing we can store
+        self.embedding_store.put_many(namespace, texts, vectors)
+    
+    async def _embedding(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Embedding request sent upstream."""
         try:
-            response = await self.client.post(url, json=payload)
-            response.raise_for_status()
-            return response.json()
+            return await self._post_json("/embeddings", payload, "embeddings")
+        except LatencyBudgetExceeded as e:
+            metrics.observe_budget_exceeded("embeddings", metrics.MODEL_LABELS(str(payload.get("model"))))
+            raise Exception(f"Cloudflare AI Gateway embedding request exceeded its latency budget: {e}") from e
         except httpx.HTTPError as e:
-            raise Exception(f"Cloudflare AI Gateway embedding request failed: {e}")
+            raise Exception(f"Cloudflare AI Gateway embedding request failed: {e}") from e
+    
+    async def warmup(self) -> int:
+        """
+        Open pooled connections to every endpoint ahead of the first real call.
+        
+        Issues `warmup_connections` concurrent lightweight requests per
+        endpoint so DNS, TCP and TLS setup happen at startup. Any HTTP
+        response counts; connection errors are logged and ignored. The
+        prompt budgeter's tokenizers are loaded at the same time.
+        
+        Returns:
+            Number of warmup requests that reached an endpoint
+        """
+        async def probe(endpoint: GatewayEndpoint) -> bool:
+            try:
+                await self.client.head(endpoint.base_url, headers=_endpoint_headers(endpoint))
+                return True
+            except httpx.HTTPError as e:
+                logger.warning(f"AI gateway warmup to {endpoint.name} failed: {e}")
+                return False
+        
+        if self.prompt_budgeter is not None:
+            await self.prompt_budgeter.preload()
+        results = await asyncio.gather(*(
+            probe(endpoint)
+            for endpoint in self.router.endpoints
+            for _ in range(max(0, self.config.warmup_connections))
+        ))
+        return sum(results)
     
     async def close(self):
-        """Close the HTTP client."""
-        await self.client.aclose()
+        """Close the HTTP client (unless it was passed in by the caller)."""
+        if self._owns_client:
+            await self.client.aclose()
+        if self.cache is not None:
+            await self.cache.close()
     
     async def __aenter__(self):
         return self
@@ -142,6 +641,90 @@ class CloudflareAIGateway:
         await self.close()
 
 
+def create_gateway_http_client(config: CloudflareAIGatewayConfig) -> httpx.AsyncClient:
+    """
+    Create the pooled HTTP client used for gateway calls.
+    
+    Uses HTTP/2 (one multiplexed connection per endpoint) when the `h2`
+    package is installed, and the configured connection pool limits.
+    """
+    http2 = config.http2 and _HTTP2_AVAILABLE
+    if config.http2 and not http2:
+        logger.warning("h2 package not installed; AI gateway client falls back to HTTP/1.1")
+    return httpx.AsyncClient(
+        headers={
+            "Authorization": f"Bearer {config.api_token}",
+            "Content-Type": "application/json"
+        },
+        timeout=config.request_timeout,
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry
+        )
+    )
+
+
+def _endpoint_headers(endpoint: GatewayEndpoint) -> Optional[Dict[str, str]]:
+    """Per-request auth override for endpoints that belong to another account."""
+    if endpoint.api_token:
+        return {"Authorization": f"Bearer {endpoint.api_token}"}
+    return None
+
+
+def _last_user_text(messages: list) -> str:
+    """Text of the last user message (string or OpenAI content parts)."""
+    for message in reversed(messages):
+        if isinstance(message, dict) and message.get("role") == "user":
+            content = message.get("content")
+            if isinstance(content, str):
+                return content
+            if isinstance(content, list):
+                return "\n".join(
+                    part.get("text", "") for part in content
+                    if isinstance(part, dict) and part.get("type") == "text"
+                )
+            return ""
+    return ""
+
+
+def _semantic_namespace(payload: Dict[str, Any]) -> str:
+    """
+    Semantic cache namespace for a chat payload.
+
+    Only the last user message is compared by similarity, so everything else
+    that shapes the answer (system prompt, earlier turns, sampling
+    parameters, tools, response format) must match exactly: it is hashed
+    into the namespace alongside the model.
+    """
+    messages = list(payload.get("messages") or [])
+    for i in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[i], dict) and messages[i].get("role") == "user":
+            del messages[i]
+            break
+    context = {k: v for k, v in payload.items() if k not in ("messages", "stream")}
+    context["messages"] = messages
+    return f"{payload['model']}|{payload_key(context)[:16]}"
+
+
+def _embedding_namespace(model: str, kwargs: Dict[str, Any]) -> str:
+    """Embedding store namespace: the model plus any parameters that change the output."""
+    return f"{model}|{canonical_json(kwargs)}" if kwargs else model
+
+
+def _embedding_response(model: str, vectors: List[Any]) -> Dict[str, Any]:
+    """Build an OpenAI-style embedding response from local vectors."""
+    return {
+        "object": "list",
+        "data": [
+            {"object": "embedding", "index": i, "embedding": vector}
+            for i, vector in enumerate(vectors)
+        ],
+        "model": model
+    }
+
+
 def create_cloudflare_ai_gateway() -> CloudflareAIGateway:
     """
     Create a Cloudflare AI Gateway client from environment variables.
@@ -155,6 +738,17 @@ def create_cloudflare_ai_gateway() -> CloudflareAIGateway:
     account_id = os.getenv("CLOUDFLARE_ACCOUNT_ID")
     api_token = os.getenv("SECRET_CF_AI_TOKEN")
     gateway_url = os.getenv("APP_AI_GATEWAY_URL")
+    cache_enabled = os.getenv("AI_GATEWAY_CACHE_ENABLED", "false").lower() == "true"
+    coalesce_requests = os.getenv("AI_GATEWAY_COALESCE_REQUESTS", "false").lower() == "true"
+    stream_fanout = os.getenv("AI_GATEWAY_STREAM_FANOUT", "false").lower() == "true"
+    embedding_batch_enabled = os.getenv("AI_GATEWAY_EMBEDDING_BATCH_ENABLED", "false").lower() == "true"
+    semantic_cache_enabled = os.getenv("AI_GATEWAY_SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    hedge_enabled = os.getenv("AI_GATEWAY_HEDGE_ENABLED", "false").lower() == "true"
+    latency_budget = os.getenv("AI_GATEWAY_LATENCY_BUDGET")
+    model_rate_limit = os.getenv("AI_GATEWAY_MODEL_RATE_LIMIT")
+    prompt_token_budget = os.getenv("AI_GATEWAY_PROMPT_TOKEN_BUDGET")
+    account_rate_limit = os.getenv("AI_GATEWAY_ACCOUNT_RATE_LIMIT")
+    known_models = [m.strip() for m in os.getenv("AI_GATEWAY_KNOWN_MODELS", "").split(",") if m.strip()]
     
     if not account_id:
         raise ValueError("CLOUDFLARE_ACCOUNT_ID environment variable is required")
@@ -165,10 +759,52 @@ def create_cloudflare_ai_gateway() -> CloudflareAIGateway:
     if not gateway_url:
         gateway_url = f"https://api.cloudflare.com/client/v4/accounts/{account_id}/ai/v1"
     
+    gateway_urls = [url.strip() for url in os.getenv("APP_AI_GATEWAY_URLS", "").split(",") if url.strip()]
+    endpoints = [GatewayEndpoint(name=url, base_url=url) for url in gateway_urls]
+    
     config = CloudflareAIGatewayConfig(
         account_id=account_id,
         api_token=api_token,
-        gateway_url=gateway_url
+        gateway_url=gateway_url,
+        endpoints=endpoints,
+        request_timeout=float(os.getenv("AI_GATEWAY_REQUEST_TIMEOUT", "30")),
+        http2=os.getenv("AI_GATEWAY_HTTP2", "true").lower() == "true",
+        max_connections=int(os.getenv("AI_GATEWAY_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("AI_GATEWAY_MAX_KEEPALIVE_CONNECTIONS", "20")),
+        keepalive_expiry=float(os.getenv("AI_GATEWAY_KEEPALIVE_EXPIRY", "30")),
+        warmup_connections=int(os.getenv("AI_GATEWAY_WARMUP_CONNECTIONS", "2")),
+        latency_budget=float(latency_budget) if latency_budget else None,
+        max_retries=int(os.getenv("AI_GATEWAY_MAX_RETRIES", "2")),
+        hedge_enabled=hedge_enabled,
+        hedge_percentile=float(os.getenv("AI_GATEWAY_HEDGE_PERCENTILE", "95")),
+        max_concurrency=int(os.getenv("AI_GATEWAY_MAX_CONCURRENCY", "64")),
+        model_rate_limit=float(model_rate_limit) if model_rate_limit else None,
+        account_rate_limit=float(account_rate_limit) if account_rate_limit else None,
+        known_models=known_models,
+        max_model_labels=int(os.getenv("AI_GATEWAY_MAX_MODEL_LABELS", "64")),
+        prompt_token_budget=int(prompt_token_budget) if prompt_token_budget else None,
+        prompt_accounting=os.getenv("AI_GATEWAY_PROMPT_ACCOUNTING", "false").lower() == "true",
+        prompt_summary_model=os.getenv("AI_GATEWAY_PROMPT_SUMMARY_MODEL") or None,
+        cache_enabled=cache_enabled,
+        cache_ttl=float(os.getenv("AI_GATEWAY_CACHE_TTL", "300")),
+        cache_max_entries=int(os.getenv("AI_GATEWAY_CACHE_MAX_ENTRIES", "1024")),
+        cache_redis_url=os.getenv("AI_GATEWAY_CACHE_REDIS_URL") or None,
+        coalesce_requests=coalesce_requests,
+        stream_fanout=stream_fanout,
+        stream_fanout_buffer=int(os.getenv("AI_GATEWAY_STREAM_FANOUT_BUFFER", "4096")),
+        embedding_batch_enabled=embedding_batch_enabled,
+        embedding_batch_max_size=int(os.getenv("AI_GATEWAY_EMBEDDING_BATCH_MAX_SIZE", "64")),
+        embedding_batch_max_wait=float(os.getenv("AI_GATEWAY_EMBEDDING_BATCH_MAX_WAIT_MS", "5")) / 1000,
+        embedding_store_path=os.getenv("AI_GATEWAY_EMBEDDING_STORE_PATH") or None,
+        semantic_cache_enabled=semantic_cache_enabled,
+        semantic_cache_embedding_model=os.getenv(
+            "AI_GATEWAY_SEMANTIC_CACHE_MODEL", "openai/text-embedding-3-small"
+        ),
+        semantic_cache_threshold=float(os.getenv("AI_GATEWAY_SEMANTIC_CACHE_THRESHOLD", "0.95")),
+        semantic_cache_max_entries=int(os.getenv("AI_GATEWAY_SEMANTIC_CACHE_MAX_ENTRIES", "10000")),
+        semantic_cache_max_namespaces=int(os.getenv("AI_GATEWAY_SEMANTIC_CACHE_MAX_NAMESPACES", "1024")),
+        semantic_cache_max_total_entries=int(os.getenv("AI_GATEWAY_SEMANTIC_CACHE_MAX_TOTAL_ENTRIES", "1000000")),
+        semantic_cache_ivf_threshold=int(os.getenv("AI_GATEWAY_SEMANTIC_CACHE_IVF_THRESHOLD", "100000"))
     )
     
     return CloudflareAIGateway(config)
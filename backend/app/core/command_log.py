@@ -0,0 +1,215 @@
+"""Bounded Command Logs for E2B Sessions
+
+Each session keeps only its most recent command entries in memory (or in a
+capped Redis list). When the ring overflows, its oldest half is spilled,
+gzip-compressed. The in-memory store spills to an append-only log on disk:
+
+    <dir>/<session_id>.log.gz   concatenated gzip members, one per spill
+    <dir>/<session_id>.idx      one line per member: first_seq last_seq offset length
+
+The Redis store spills into Redis itself (`RedisSpillLog`), so every node
+can read any session's history: one sorted set per session, with one
+member per spill, scored by its first seq.
+
+Entries carry a per-session sequence number starting at 1, so history can
+be paged by cursor: the sparse index locates the gzip member holding a
+sequence range without decompressing the rest of the log. Disk appends take
+an exclusive flock, so workers sharing the directory can spill into the
+same session log.
+"""
+from __future__ import annotations
+
+import base64
+import bisect
+import fcntl
+import gzip
+import json
+import os
+import tempfile
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_RING_SIZE = 256
+DEFAULT_SPILL_DIR = os.path.join(tempfile.gettempdir(), "cua-e2b-commands")
+
+
+class SpillLog:
+    """Append-only compressed command log of one session, with a sparse seq index."""
+
+    def __init__(self, directory: str, session_id: str):
+        self.log_path = os.path.join(directory, f"{session_id}.log.gz")
+        self.index_path = os.path.join(directory, f"{session_id}.idx")
+        self.directory = directory
+
+    def append(self, entries: List[Dict[str, Any]]) -> None:
+        if not entries:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        body = "".join(json.dumps(e, separators=(",", ":")) + "\n" for e in entries)
+        member = gzip.compress(body.encode("utf-8"), compresslevel=6)
+        with open(self.log_path, "ab") as log:
+            fcntl.flock(log, fcntl.LOCK_EX)
+            try:
+                offset = log.seek(0, os.SEEK_END)
+                log.write(member)
+                log.flush()
+                with open(self.index_path, "a", encoding="utf-8") as index:
+                    index.write(f"{entries[0]['seq']} {entries[-1]['seq']} {offset} {len(member)}\n")
+            finally:
+                fcntl.flock(log, fcntl.LOCK_UN)
+
+    def _index(self) -> List[Tuple[int, int, int, int]]:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as index:
+                return [tuple(map(int, line.split())) for line in index if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def read(self, lo: int, hi: int) -> List[Dict[str, Any]]:
+        """Spilled entries with lo <= seq <= hi, in seq order."""
+        index = self._index()
+        if not index:
+            return []
+        # Members are appended in seq order; start at the last one beginning at or before `lo`.
+        start = max(0, bisect.bisect_right([first for first, _, _, _ in index], lo) - 1)
+        entries: List[Dict[str, Any]] = []
+        with open(self.log_path, "rb") as log:
+            for first, last, offset, length in index[start:]:
+                if first > hi:
+                    break
+                if last < lo:
+                    continue
+                log.seek(offset)
+                for line in gzip.decompress(log.read(length)).splitlines():
+                    entry = json.loads(line)
+                    if lo <= entry["seq"] <= hi:
+                        entries.append(entry)
+        return entries
+
+    def remove(self) -> None:
+        for path in (self.log_path, self.index_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class RedisSpillLog:
+    """
+    Spilled command entries of one session in a Redis sorted set (asyncio client).
+
+    Each member is "<last_seq> <base64 gzip of JSON lines>", scored by the
+    spill's first seq, so a seq range is found with two range queries.
+    """
+
+    def __init__(self, client: Any, key: str):
+        self.redis = client
+        self.key = key
+
+    @staticmethod
+    def member(lines: List[str]) -> Tuple[str, int]:
+        """The sorted-set member and score for a spill of JSON-encoded entries, in seq order."""
+        member = gzip.compress("\n".join(lines).encode("utf-8"), compresslevel=6)
+        first, last = json.loads(lines[0])["seq"], json.loads(lines[-1])["seq"]
+        return f"{last} {base64.b64encode(member).decode('ascii')}", first
+
+    async def read(self, lo: int, hi: int) -> List[Dict[str, Any]]:
+        """Spilled entries with lo <= seq <= hi, in seq order."""
+        pipe = self.redis.pipeline()
+        pipe.zrevrangebyscore(self.key, lo, "-inf", start=0, num=1)  # the spill holding `lo`, if any
+        pipe.zrangebyscore(self.key, f"({lo}", hi)
+        head, rest = await pipe.execute()
+        entries: List[Dict[str, Any]] = []
+        for member in head + rest:
+            last, blob = member.split(" ", 1)
+            if int(last) < lo:
+                continue
+            for line in gzip.decompress(base64.b64decode(blob)).splitlines():
+                entry = json.loads(line)
+                if lo <= entry["seq"] <= hi:
+                    entries.append(entry)
+        return entries
+
+
+class CommandLog:
+    """In-memory ring of recent entries backed by a `SpillLog`."""
+
+    __slots__ = ("ring", "count", "ring_size", "session_id", "spill_dir")
+
+    def __init__(self, session_id: str, ring_size: int = DEFAULT_RING_SIZE, spill_dir: str = DEFAULT_SPILL_DIR):
+        self.ring: List[Dict[str, Any]] = []
+        self.count = 0
+        self.ring_size = ring_size
+        self.session_id = session_id
+        self.spill_dir = spill_dir
+
+    @property
+    def spill(self) -> SpillLog:
+        # Built on demand: most sessions never spill, and the paths cost more than the log itself.
+        return SpillLog(self.spill_dir, self.session_id)
+
+    def append(self, entry: Dict[str, Any]) -> int:
+        self.count += 1
+        self.ring.append({"seq": self.count, **entry})
+        if len(self.ring) > self.ring_size:
+            spilled = max(1, self.ring_size // 2)
+            self.spill.append(self.ring[:spilled])
+            del self.ring[:spilled]
+        return self.count
+
+    def read(self, lo: int, hi: int) -> List[Dict[str, Any]]:
+        return read_range(self.ring, self.spill, lo, hi)
+
+
+def read_range(ring: List[Dict[str, Any]], spill: SpillLog, lo: int, hi: int) -> List[Dict[str, Any]]:
+    """Entries lo..hi from the spill log (below the ring) and the ring."""
+    ring_first = ring[0]["seq"] if ring else hi + 1
+    entries = spill.read(lo, min(hi, ring_first - 1)) if lo < ring_first else []
+    entries.extend(e for e in ring if lo <= e["seq"] <= hi)
+    return entries
+
+
+def page_range(count: int, cursor: Optional[int], limit: int, descending: bool) -> Tuple[int, int, Optional[int]]:
+    """
+    Seq range [lo, hi] of a page (empty when lo > hi) and the cursor of the page after it.
+
+    Raises:
+        ValueError: `cursor` is negative
+    """
+    if cursor is not None and cursor < 0:
+        raise ValueError(f"cursor must be >= 0, got {cursor}")
+    if descending:
+        hi = min(count, cursor - 1) if cursor is not None else count
+        lo = max(1, hi - limit + 1)
+        return lo, hi, lo if lo > 1 else None
+    lo = (cursor or 0) + 1
+    hi = min(count, lo + limit - 1)
+    return lo, hi, hi if hi < count else None
+
+
+def paginate(
+    read: Callable[[int, int], List[Dict[str, Any]]],
+    count: int,
+    cursor: Optional[int] = None,
+    limit: int = 50,
+    descending: bool = False,
+) -> Dict[str, Any]:
+    """
+    One page of a command log.
+
+    Args:
+        read: Returns the entries with seq in [lo, hi]
+        count: Number of entries ever appended (highest seq)
+        cursor: `next_cursor` of the previous page; None starts at the oldest
+            (or, descending, the newest) entry
+        limit: Page size
+        descending: Newest first
+
+    Returns:
+        {"items": [...], "next_cursor": int | None, "total": count}
+
+    Raises:
+        ValueError: `cursor` is negative
+    """
+    lo, hi, next_cursor = page_range(count, cursor, limit, descending)
+    items = read(lo, hi) if lo <= hi else []
+    return {"items": items[::-1] if descending else items, "next_cursor": next_cursor, "total": count}
@@ -0,0 +1,537 @@
+"""Sandbox Execution Backends for E2B Sessions
+
+The e2b endpoints run session commands through a `SandboxBackend`:
+  - StubSandboxBackend: the simulated execution of `e2b_stub` (default)
+  - LocalSandboxBackend: real commands in local asyncio subprocesses
+
+Session state (TTL, status, command log) stays in `e2b_stub` and its
+session store either way; a backend only decides how commands and file
+writes are carried out.
+
+The local backend gives each session its own working directory under
+E2B_LOCAL_ROOT. Commands run through the shell in that directory, in their
+own process group, with a minimal environment (the backend's own secrets
+are not inherited). Every command has a timeout, after which its whole
+process group is killed, and stdout/stderr are each kept up to a size cap
+(the rest is read and discarded, so a chatty command cannot stall on a full
+pipe). Commands are ordered per session and capped at E2B_EXEC_WORKERS at
+once by a `SessionScheduler` (see session_scheduler.py). Nothing blocks the event loop: processes are awaited, and
+file and directory work runs in worker threads.
+
+`exec_stream()` yields output chunks as the process produces them. Only one
+read per pipe is outstanding, so a slow consumer applies backpressure to
+the process instead of buffering its output; what is kept for the command
+log is capped like any other command. A consumer that stops iterating
+kills the command.
+
+The command log only keeps a preview of each command's output (the first
+E2B_EXEC_LOG_PREVIEW bytes of stdout and stderr) plus their full byte
+counts; the complete (capped) output is returned to the caller only.
+
+It runs commands on the host with the backend's privileges: use it for
+development and benchmarks, not for untrusted input.
+
+The backend is chosen with E2B_BACKEND=stub|local.
+"""
+from __future__ import annotations
+
+import asyncio
+import codecs
+import logging
+import os
+import shutil
+import signal
+import tempfile
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from . import e2b_stub
+from .session_scheduler import SessionScheduler, SlotTiming
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROOT = os.path.join(tempfile.gettempdir(), "cua-e2b-sandboxes")
+_READ_CHUNK = 64 * 1024
+_POLL_INTERVAL = 0.5  # how often a blocked read checks whether the process already exited
+
+
+class SandboxBackend(ABC):
+    """
+    Execution contract of the e2b endpoints; mirrors the `e2b_stub` contract with coroutines.
+
+    Commands and file writes go through `scheduler`: in order within a
+    session, at most `workers` at a time overall, fairly across users.
+    Results carry `queued_ms` and `run_ms`.
+    """
+
+    def __init__(self, workers: int = 8):
+        self.workers = workers
+        self.scheduler = SessionScheduler(workers)
+
+    async def create_session(self, user_id: Optional[str] = None) -> Dict[str, Any]:
+        """Provision a sandbox and open a session on it (a cold start)."""
+        return await self.activate(await self.provision(), user_id)
+
+    async def provision(self) -> str:
+        """Prepare a sandbox ahead of its session (the slow part of a cold start); returns its session id."""
+        return str(uuid.uuid4())
+
+    async def activate(self, session_id: str, user_id: Optional[str] = None) -> Dict[str, Any]:
+        """Open the session on a provisioned sandbox; its TTL starts now."""
+        return await e2b_stub.create_session(user_id=user_id, session_id=session_id)
+
+    async def release(self, session_id: str) -> None:
+        """Discard a provisioned sandbox that never became a session."""
+
+    @asynccontextmanager
+    async def _turn(self, session_id: str) -> AsyncIterator[SlotTiming]:
+        """Wait for the session's turn in the scheduler; raises KeyError if the session does not exist."""
+        sess = await e2b_stub.get_session(session_id)
+        async with self.scheduler.slot(session_id, sess["user_id"]) as timing:
+            yield timing
+
+    async def exec_command(self, session_id: str, command: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Run `command` in the session; raises KeyError if the session does not exist."""
+        async with self._turn(session_id) as timing:
+            return await self._exec(session_id, command, timeout, timing)
+
+    @abstractmethod
+    async def _exec(self, session_id: str, command: str, timeout: Optional[float], timing: SlotTiming) -> Dict[str, Any]:
+        """Run `command` while holding the session's turn."""
+
+    async def exec_stream(
+        self, session_id: str, command: str, timeout: Optional[float] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Run `command`, yielding its output as it is produced.
+
+        Yields:
+            ("stdout" | "stderr", text) chunks, then ("exit", result): the
+            `exec_command` result without the output already streamed (or an
+            error such as session_inactive)
+
+        Raises:
+            KeyError: The session does not exist
+        """
+        # Backends without live output stream the whole result at once.
+        result = await self.exec_command(session_id, command, timeout=timeout)
+        for name in ("stdout", "stderr"):
+            if result.get(name):
+                yield name, result[name]
+        yield "exit", _without_output(result)
+
+    async def write_file(self, session_id: str, path: str, content: str) -> Dict[str, Any]:
+        async with self._turn(session_id) as timing:
+            return await self._write(session_id, path, content, timing)
+
+    @abstractmethod
+    async def _write(self, session_id: str, path: str, content: str, timing: SlotTiming) -> Dict[str, Any]:
+        """Write the file while holding the session's turn."""
+
+    async def run_batch(
+        self, session_id: str, steps: List[Dict[str, Any]], stop_on_error: bool = True
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Run `steps` in order within a single turn of the session.
+
+        Steps are queued once for the whole batch, and no other command of
+        the session runs between them.
+
+        Args:
+            session_id: Session to run in
+            steps: {"action": "exec", "command": ..., "timeout": ...} or
+                {"action": "write", "path": ..., "content": ...}
+            stop_on_error: Skip the remaining steps after a failed one (an
+                error or a non-zero exit code); otherwise carry on
+
+        Yields:
+            ("step", result with its `index` and `ok`) as each step finishes,
+            then ("done", summary)
+
+        Raises:
+            KeyError: The session does not exist
+        """
+        completed = failed = 0
+        stopped = False
+        async with self._turn(session_id) as timing:
+            for index, step in enumerate(steps):
+                step_timing = SlotTiming()
+                step_timing.started = step_timing.enqueued  # the batch already holds the turn
+                if step["action"] == "write":
+                    result = await self._write(session_id, step["path"], step.get("content", ""), step_timing)
+                else:
+                    result = await self._exec(session_id, step["command"], step.get("timeout"), step_timing)
+                ok = "error" not in result and not result.get("exit_code")
+                completed += 1
+                failed += not ok
+                yield "step", {"index": index, "ok": ok, **result}
+                # An inactive session fails every later step as well.
+                if not ok and (stop_on_error or result.get("error") == "session_inactive"):
+                    stopped = completed < len(steps)
+                    break
+        yield "done", {
+            "steps": len(steps),
+            "completed": completed,
+            "failed": failed,
+            "stopped": stopped,
+            **timing.as_dict(),
+        }
+
+    @abstractmethod
+    async def close_session(self, session_id: str) -> Dict[str, Any]:
+        """Close the session and free its sandbox."""
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": type(self).__name__, "scheduler": self.scheduler.stats()}
+
+
+class StubSandboxBackend(SandboxBackend):
+    """Simulated execution; every call completes immediately."""
+
+    def __init__(self, workers: int = 8, provision_delay: float = 0.0):
+        """
+        Args:
+            workers: Commands allowed to run at the same time
+            provision_delay: Simulated seconds to provision a sandbox (to exercise the warm pool)
+        """
+        super().__init__(workers)
+        self.provision_delay = provision_delay
+
+    async def provision(self) -> str:
+        if self.provision_delay:
+            await asyncio.sleep(self.provision_delay)
+        return await super().provision()
+
+    async def _exec(self, session_id: str, command: str, timeout: Optional[float], timing: SlotTiming) -> Dict[str, Any]:
+        return {**await e2b_stub.exec_command(session_id, command), **timing.as_dict()}
+
+    async def _write(self, session_id: str, path: str, content: str, timing: SlotTiming) -> Dict[str, Any]:
+        return {**await e2b_stub.write_file(session_id, path, content), **timing.as_dict()}
+
+    async def close_session(self, session_id: str) -> Dict[str, Any]:
+        return await e2b_stub.close_session(session_id)
+
+
+class _Capture:
+    """Keeps the first `cap` bytes of a process pipe; decodes chunks for live streaming."""
+
+    __slots__ = ("cap", "data", "total", "_decoder")
+
+    def __init__(self, cap: int):
+        self.cap = cap
+        self.data = bytearray()
+        self.total = 0
+        # Incremental, so a UTF-8 sequence split across two chunks is not mangled.
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def add(self, chunk: bytes, decode: bool = False) -> str:
+        self.total += len(chunk)
+        room = self.cap - len(self.data)
+        if room > 0:
+            self.data += chunk[:room]
+        return self._decoder.decode(chunk) if decode else ""
+
+    def flush(self) -> str:
+        return self._decoder.decode(b"", final=True)
+
+    @property
+    def truncated(self) -> bool:
+        return self.total > len(self.data)
+
+    def text(self, limit: Optional[int] = None) -> str:
+        return bytes(self.data[:limit]).decode("utf-8", errors="replace")
+
+
+class LocalSandboxBackend(SandboxBackend):
+    """Runs session commands as local subprocesses, one working directory per session."""
+
+    def __init__(
+        self,
+        root: str = DEFAULT_ROOT,
+        timeout: float = 30.0,
+        max_output: int = 1024 * 1024,
+        workers: int = 8,
+        log_preview: int = 4096,
+    ):
+        """
+        Args:
+            root: Directory holding the per-session working directories
+            timeout: Default and maximum seconds a command may run
+            max_output: Bytes of stdout (and, separately, stderr) kept per command
+            workers: Commands allowed to run at the same time
+            log_preview: Bytes of stdout (and, separately, stderr) kept in the command log
+        """
+        self.root = os.path.realpath(root)
+        self.timeout = timeout
+        self.max_output = max_output
+        self.log_preview = log_preview
+        super().__init__(workers)
+        self._running: Dict[str, Set[asyncio.subprocess.Process]] = {}
+        self._stats = {"executed": 0, "timed_out": 0, "truncated": 0, "cancelled": 0}
+        e2b_stub.on_evict(self._evicted)
+
+    @classmethod
+    def from_env(cls) -> "LocalSandboxBackend":
+        return cls(
+            root=os.getenv("E2B_LOCAL_ROOT", DEFAULT_ROOT),
+            timeout=float(os.getenv("E2B_EXEC_TIMEOUT", "30")),
+            max_output=int(os.getenv("E2B_EXEC_MAX_OUTPUT", str(1024 * 1024))),
+            workers=int(os.getenv("E2B_EXEC_WORKERS", "8")),
+            log_preview=int(os.getenv("E2B_EXEC_LOG_PREVIEW", "4096")),
+        )
+
+    def workdir(self, session_id: str) -> str:
+        return os.path.join(self.root, session_id)
+
+    def _environment(self, workdir: str) -> Dict[str, str]:
+        return {
+            "PATH": os.environ.get("PATH", os.defpath),
+            "HOME": workdir,
+            "LANG": os.environ.get("LANG", "C.UTF-8"),
+            "TERM": "dumb",
+        }
+
+    async def provision(self) -> str:
+        session_id = await super().provision()
+        await asyncio.to_thread(os.makedirs, self.workdir(session_id), exist_ok=True)
+        return session_id
+
+    async def release(self, session_id: str) -> None:
+        await asyncio.to_thread(shutil.rmtree, self.workdir(session_id), True)
+
+    async def _exec(self, session_id: str, command: str, timeout: Optional[float], timing: SlotTiming) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+        async for event, payload in self._execute(session_id, command, timeout, live=False, timing=timing):
+            result = payload  # only the final "exit" event is produced when not live
+        return result
+
+    async def exec_stream(
+        self, session_id: str, command: str, timeout: Optional[float] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        async for event, payload in self._execute(session_id, command, timeout, live=True):
+            yield event, (_without_output(payload) if event == "exit" else payload)
+
+    async def _execute(
+        self, session_id: str, command: str, timeout: Optional[float], live: bool, timing: Optional[SlotTiming] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """Run `command`, waiting for the session's turn unless the caller holds it (`timing`)."""
+        if timing is None:
+            sess = await e2b_stub.get_session(session_id)
+            async with self.scheduler.slot(session_id, sess["user_id"]) as timing:
+                async for event in self._execute(session_id, command, timeout, live, timing):
+                    yield event
+            return
+        # Re-read inside the slot: the session may have been closed while this command queued.
+        sess = await e2b_stub.get_session(session_id)
+        if sess["status"] != "active":
+            yield "exit", {"error": "session_inactive", "status": sess["status"]}
+            return
+        timeout = min(timeout, self.timeout) if timeout else self.timeout
+        workdir = self.workdir(session_id)
+        await asyncio.to_thread(os.makedirs, workdir, exist_ok=True)
+        async for event in self._run(session_id, command, workdir, timeout, live, timing):
+            yield event
+
+    async def _run(
+        self, session_id: str, command: str, workdir: str, timeout: float, live: bool, timing: SlotTiming
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """Run the process; when `live`, yield its output chunks as they are read, then ("exit", result)."""
+        proc = await asyncio.create_subprocess_shell(
+            command,
+            cwd=workdir,
+            env=self._environment(workdir),
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,  # own process group, so a timeout kills its children too
+        )
+        running = self._running.setdefault(session_id, set())
+        running.add(proc)
+        pipes = {"stdout": proc.stdout, "stderr": proc.stderr}
+        captures = {name: _Capture(self.max_output) for name in pipes}
+        timed_out = False
+
+        def expire() -> None:
+            nonlocal timed_out
+            timed_out = True
+            _kill(proc)
+
+        killer = asyncio.get_running_loop().call_later(timeout, expire)
+        # Only one read per pipe is in flight, so a slow consumer slows the process down
+        # (its pipe fills up) instead of output piling up in memory.
+        reads = {asyncio.ensure_future(pipe.read(_READ_CHUNK)): name for name, pipe in pipes.items()}
+        finished = False
+        try:
+            grace = None
+            while reads:
+                done, _ = await asyncio.wait(reads, timeout=_POLL_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+                for read in done:
+                    name = reads.pop(read)
+                    chunk = read.result()
+                    if not chunk:
+                        continue
+                    reads[asyncio.ensure_future(pipes[name].read(_READ_CHUNK))] = name
+                    text = captures[name].add(chunk, decode=live)
+                    if text:
+                        yield name, text
+                if not done and proc.returncode is not None:
+                    # Exited, but a detached grandchild still holds the pipes open.
+                    grace = grace or time.monotonic() + 1.0
+                    if time.monotonic() > grace:
+                        break
+            await proc.wait()
+            finished = True
+        finally:
+            killer.cancel()
+            for read in reads:
+                read.cancel()
+            running.discard(proc)
+            if not running:
+                self._running.pop(session_id, None)
+            if not finished:
+                # The consumer went away (e.g. a streaming client disconnected): stop the command.
+                _kill(proc)
+                self._stats["cancelled"] += 1
+                entry = self._log_entry(self._result(command, captures, None, timing, timed_out), captures)
+                entry["cancelled"] = True
+                try:
+                    await e2b_stub.get_store().append_command(session_id, entry)
+                except KeyError:
+                    pass  # the session was evicted meanwhile: there is no log to record it in
+
+        if live:
+            for name, capture in captures.items():
+                tail = capture.flush()
+                if tail:
+                    yield name, tail
+        self._stats["executed"] += 1
+        self._stats["timed_out"] += timed_out
+        result = self._result(command, captures, proc.returncode, timing, timed_out)
+        self._stats["truncated"] += "truncated" in result
+        seq = await e2b_stub.get_store().append_command(session_id, self._log_entry(result, captures))
+        result = {"seq": seq, **result}
+        await e2b_stub.touch(session_id)
+        yield "exit", result
+
+    @staticmethod
+    def _result(
+        command: str, captures: Dict[str, _Capture], exit_code: Optional[int], timing: SlotTiming, timed_out: bool
+    ) -> Dict[str, Any]:
+        stdout, stderr = captures["stdout"], captures["stderr"]
+        result = {
+            "command": command,
+            "stdout": stdout.text(),
+            "stderr": stderr.text(),
+            "exit_code": exit_code,
+            "ts": time.time(),
+            **timing.as_dict(),
+        }
+        if timed_out:
+            result["timed_out"] = True
+        if stdout.truncated or stderr.truncated:
+            result["truncated"] = {"stdout_bytes": stdout.total, "stderr_bytes": stderr.total}
+        return result
+
+    def _log_entry(self, result: Dict[str, Any], captures: Dict[str, _Capture]) -> Dict[str, Any]:
+        """The command log copy of a result: an output preview and byte counts instead of the full output."""
+        stdout, stderr = captures["stdout"], captures["stderr"]
+        return {
+            **result,
+            "stdout": stdout.text(self.log_preview),
+            "stderr": stderr.text(self.log_preview),
+            "stdout_bytes": stdout.total,
+            "stderr_bytes": stderr.total,
+        }
+
+    def _resolve(self, session_id: str, path: str) -> Optional[str]:
+        """Absolute path of `path` inside the session's directory, or None if it escapes it."""
+        workdir = self.workdir(session_id)
+        target = os.path.realpath(os.path.join(workdir, path))
+        return target if target.startswith(workdir + os.sep) else None
+
+    async def _write(self, session_id: str, path: str, content: str, timing: SlotTiming) -> Dict[str, Any]:
+        sess = await e2b_stub.get_session(session_id)
+        if sess["status"] != "active":
+            return {"error": "session_inactive", "status": sess["status"]}
+        target = self._resolve(session_id, path)
+        if target is None:
+            return {"error": "path_outside_workdir", "path": path}
+        data = content.encode("utf-8")
+        await asyncio.to_thread(_write, target, data)
+        entry = {
+            "action": "write_file",
+            "path": path,
+            "bytes": len(data),
+            "ts": time.time(),
+            **timing.as_dict(),
+        }
+        entry = {"seq": await e2b_stub.get_store().append_command(session_id, entry), **entry}
+        await e2b_stub.touch(session_id)
+        return {"ok": True, **entry}
+
+    async def close_session(self, session_id: str) -> Dict[str, Any]:
+        result = await e2b_stub.close_session(session_id)
+        for proc in list(self._running.get(session_id, ())):
+            _kill(proc)
+        await asyncio.to_thread(shutil.rmtree, self.workdir(session_id), True)
+        return result
+
+    def _evicted(self, session_ids: List[str]) -> None:
+        """Remove the working directories of sessions the reaper evicted."""
+        paths = [self.workdir(session_id) for session_id in session_ids]
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            _remove_all(paths)
+        else:
+            loop.run_in_executor(None, _remove_all, paths)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self).__name__,
+            "running": sum(len(procs) for procs in self._running.values()),
+            **self._stats,
+            "scheduler": self.scheduler.stats(),
+        }
+
+
+def _without_output(result: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in result.items() if key not in ("stdout", "stderr")}
+
+
+def _kill(proc: asyncio.subprocess.Process) -> None:
+    if proc.returncode is not None:
+        return
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _write(target: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, "wb") as f:
+        f.write(data)
+
+
+def _remove_all(paths: List[str]) -> None:
+    for path in paths:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def create_sandbox_backend() -> SandboxBackend:
+    """The backend selected by E2B_BACKEND (stub or local)."""
+    kind = os.getenv("E2B_BACKEND", "stub").lower()
+    if kind == "local":
+        backend = LocalSandboxBackend.from_env()
+        logger.info(f"e2b sessions execute locally under {backend.root} ({backend.workers} workers)")
+        return backend
+    if kind != "stub":
+        raise ValueError(f"Unknown E2B_BACKEND: {kind}")
+    return StubSandboxBackend(
+        workers=int(os.getenv("E2B_EXEC_WORKERS", "8")),
+        provision_delay=float(os.getenv("E2B_STUB_PROVISION_DELAY", "0")),
+    )
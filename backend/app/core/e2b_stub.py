@@ -6,31 +6,68 @@ orchestrator layers to integrate early without requiring the real E2B infra.
 
 Replace this with a real client when the E2B endpoint becomes available.
 
-Contract:
-  - create_session(user_id: str | None) -> Session dict
+Contract (coroutines, since the session store may be remote):
+  - create_session(user_id: str | None, session_id: str | None) -> Session dict
   - exec_command(session_id: str, command: str) -> result dict
   - write_file(session_id: str, path: str, content: str) -> result dict
   - close_session(session_id: str) -> result dict
-
-State is in-memory only and NOT for production use.
+  - command_history(session_id: str, cursor, limit, order) -> page of the command log
+
+Sessions live in a pluggable `SessionStore` (see session_store.py): in
+memory by default, or in Redis so several workers share them. Execution
+here is simulated and NOT for production use; e2b_local.py runs the same
+contract against real local subprocesses.
+
+Lifecycle: a session expires `E2B_SESSION_TTL` seconds after its last
+activity (commands and file writes extend it unless
+E2B_SESSION_EXTEND_ON_ACTIVITY=false). Expired and closed sessions stay
+readable for `E2B_SESSION_RETENTION` seconds and are then evicted by
+`reap()`, which the application runs periodically.
 """
 from __future__ import annotations
 
+import asyncio
+import logging
+import os
 import time
 import uuid
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, List, Optional
+
+from .session_store import DESKTOP_URL_TEMPLATE, SessionStore, create_session_store
+
+logger = logging.getLogger(__name__)
 
-_SESSIONS: Dict[str, Dict[str, Any]] = {}
-_DEFAULT_SESSION_TTL = 30 * 60  # 30 minutes
+_STORE: Optional[SessionStore] = None
+_DEFAULT_SESSION_TTL = float(os.getenv("E2B_SESSION_TTL", str(30 * 60)))  # 30 minutes
+_RETENTION = float(os.getenv("E2B_SESSION_RETENTION", str(5 * 60)))
+_EXTEND_ON_ACTIVITY = os.getenv("E2B_SESSION_EXTEND_ON_ACTIVITY", "true").lower() == "true"
+
+_STATS = {"created": 0, "closed": 0, "evicted": 0}
+_EVICTION_LISTENERS: List[Callable[[List[str]], None]] = []
 
 
 def _now() -> float:
     return time.time()
 
 
-def create_session(user_id: Optional[str] = None) -> Dict[str, Any]:
-    session_id = str(uuid.uuid4())
-    desktop_url = f"wss://pending-e2b-endpoint/session/{session_id}"  # placeholder
+def get_store() -> SessionStore:
+    """The session store, created from the environment on first use."""
+    global _STORE
+    if _STORE is None:
+        _STORE = create_session_store()
+    return _STORE
+
+
+def set_store(store: SessionStore) -> None:
+    """Replace the session store (e.g. with a shared Redis store at startup)."""
+    global _STORE
+    _STORE = store
+
+
+async def create_session(user_id: Optional[str] = None, session_id: Optional[str] = None) -> Dict[str, Any]:
+    """Register a new session; `session_id` is given when its sandbox was provisioned ahead of time."""
+    session_id = session_id or str(uuid.uuid4())
+    desktop_url = DESKTOP_URL_TEMPLATE.format(session_id=session_id)
     data = {
         "session_id": session_id,
         "user_id": user_id,
@@ -38,23 +75,25 @@ def create_session(user_id: Optional[str] = None) -> Dict[str, Any]:
         "created_at": _now(),
         "expires_at": _now() + _DEFAULT_SESSION_TTL,
         "status": "active",
-        "commands": [],
+        "command_count": 0,
     }
-    _SESSIONS[session_id] = data
+    await get_store().put(data, evict_at=data["expires_at"] + _RETENTION)
+    _STATS["created"] += 1
     return data
 
 
-def get_session(session_id: str) -> Dict[str, Any]:
-    sess = _SESSIONS.get(session_id)
+async def get_session(session_id: str) -> Dict[str, Any]:
+    sess = await get_store().get(session_id)
     if not sess:
         raise KeyError("session_not_found")
-    if sess["expires_at"] < _now():
+    if sess["expires_at"] < _now() and sess["status"] != "expired":
         sess["status"] = "expired"
+        await get_store().update(session_id, {"status": "expired"})
     return sess
 
 
-def exec_command(session_id: str, command: str) -> Dict[str, Any]:
-    sess = get_session(session_id)
+async def exec_command(session_id: str, command: str) -> Dict[str, Any]:
+    sess = await get_session(session_id)
     if sess["status"] != "active":
         return {"error": "session_inactive", "status": sess["status"]}
     # Simulated execution result
@@ -65,35 +104,110 @@ def exec_command(session_id: str, command: str) -> Dict[str, Any]:
         "exit_code": 0,
         "ts": _now(),
     }
-    sess["commands"].append(result)
+    result = {"seq": await get_store().append_command(session_id, result), **result}
+    await touch(session_id)
     return result
 
 
-def write_file(session_id: str, path: str, content: str) -> Dict[str, Any]:
-    sess = get_session(session_id)
+async def write_file(session_id: str, path: str, content: str) -> Dict[str, Any]:
+    sess = await get_session(session_id)
     if sess["status"] != "active":
         return {"error": "session_inactive", "status": sess["status"]}
-    # We only simulate persistence by appending to commands log
+    # We only simulate persistence by appending to the command log
     entry = {
         "action": "write_file",
         "path": path,
         "bytes": len(content.encode("utf-8")),
         "ts": _now(),
     }
-    sess["commands"].append(entry)
+    entry = {"seq": await get_store().append_command(session_id, entry), **entry}
+    await touch(session_id)
     return {"ok": True, **entry}
 
 
-def close_session(session_id: str) -> Dict[str, Any]:
-    sess = get_session(session_id)
-    sess["status"] = "closed"
+async def close_session(session_id: str) -> Dict[str, Any]:
+    await get_session(session_id)
+    now = _now()
+    await get_store().update(session_id, {"status": "closed", "closed_at": now}, evict_at=now + _RETENTION)
+    _STATS["closed"] += 1
     return {"ok": True, "session_id": session_id, "status": "closed"}
 
 
-def list_sessions() -> Dict[str, Any]:
+async def command_history(
+    session_id: str, cursor: Optional[int] = None, limit: int = 50, order: str = "asc"
+) -> Dict[str, Any]:
+    """Page through a session's command log, oldest first ("asc") or newest first ("desc")."""
+    await get_session(session_id)
+    return await get_store().command_page(session_id, cursor, limit, descending=order == "desc")
+
+
+async def list_sessions(
+    user_id: Optional[str] = None,
+    status: Optional[str] = None,
+    cursor: Optional[int] = None,
+    limit: int = 100,
+) -> Dict[str, Any]:
+    """
+    One page of sessions in creation order, optionally for one user and/or status.
+
+    `count` is the total number of stored sessions; pass `next_cursor` back
+    as `cursor` for the following page. Sessions past their TTL are shown
+    (and filtered) as "expired", even before their stored status is updated.
+    """
+    store = get_store()
+    now = _now()
+    items, next_cursor = await store.page(cursor=cursor, limit=limit, user_id=user_id, status=status, now=now)
+    for sess in items:
+        if sess["expires_at"] < now and sess["status"] == "active":
+            sess["status"] = "expired"
     return {
-        "count": len(_SESSIONS),
-        "items": [
-            {k: v for k, v in s.items() if k != "commands"} for s in _SESSIONS.values()
-        ],
+        "count": await store.count(),
+        "items": items,
+        "next_cursor": next_cursor,
     }
+
+
+async def touch(session_id: str) -> None:
+    """Extend an active session's TTL after activity."""
+    if not _EXTEND_ON_ACTIVITY:
+        return
+    expires_at = _now() + _DEFAULT_SESSION_TTL
+    await get_store().update(session_id, {"expires_at": expires_at}, evict_at=expires_at + _RETENTION)
+
+
+def on_evict(listener: Callable[[List[str]], None]) -> None:
+    """Call `listener(session_ids)` after `reap()` evicts sessions (e.g. to free their resources)."""
+    _EVICTION_LISTENERS.append(listener)
+
+
+async def reap(now: Optional[float] = None, batch_size: int = 1000) -> int:
+    """Evict sessions whose TTL plus retention (or retention after close) has passed."""
+    store = get_store()
+    now = _now() if now is None else now
+    evicted = 0
+    while True:
+        session_ids = await store.due(now, limit=batch_size)
+        if not session_ids:
+            return evicted
+        await store.delete(session_ids)
+        for listener in _EVICTION_LISTENERS:
+            listener(session_ids)
+        evicted += len(session_ids)
+        _STATS["evicted"] += len(session_ids)
+
+
+async def run_reaper(interval: float = 30.0) -> None:
+    """Call `reap()` every `interval` seconds until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            evicted = await reap()
+            if evicted:
+                logger.info(f"Evicted {evicted} expired or closed e2b sessions")
+        except Exception as e:
+            logger.warning(f"e2b session reaper failed: {e}")
+
+
+async def session_stats() -> Dict[str, Any]:
+    """Live session count plus this process's lifecycle counters."""
+    return {"live": await get_store().count(), **_STATS}
@@ -0,0 +1,183 @@
+"""
+Persistent Embedding Store
+
+Content-addressed, on-disk cache of embedding vectors keyed by
+(namespace, sha256(text)). The namespace is normally the embedding model,
+optionally combined with request parameters that change the output.
+
+Each namespace is a shard of three files inside the store directory:
+  - <slug>.json: metadata (namespace name and vector dimension)
+  - <slug>.keys: packed 32-byte SHA-256 digests, one per row
+  - <slug>.f32:  contiguous little-endian float32 rows
+
+Vectors are read through a read-only memory map, so a warm store serves
+lookups without loading every vector into the Python heap; only the digest
+index (32 bytes per entry) is kept in memory. Appends take an exclusive
+file lock so several workers can share one store directory.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+_DIGEST_SIZE = 32
+
+
+def text_digest(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class _Shard:
+    """Vectors of a single namespace."""
+
+    def __init__(self, root: str, namespace: str):
+        slug = hashlib.sha256(namespace.encode("utf-8")).hexdigest()[:16]
+        self.namespace = namespace
+        self.meta_path = os.path.join(root, f"{slug}.json")
+        self.keys_path = os.path.join(root, f"{slug}.keys")
+        self.vectors_path = os.path.join(root, f"{slug}.f32")
+        self.dim: Optional[int] = None
+        self._rows: Dict[bytes, int] = {}
+        self._keys_size = 0
+        self._mmap: Optional[np.memmap] = None
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Pick up rows appended since the last refresh (possibly by other workers)."""
+        if self.dim is None:
+            if not os.path.exists(self.meta_path):
+                return
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+        try:
+            size = os.path.getsize(self.keys_path)
+        except FileNotFoundError:
+            return
+        size -= size % _DIGEST_SIZE
+        if size <= self._keys_size:
+            return
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._keys_size)
+            blob = f.read(size - self._keys_size)
+        row = self._keys_size // _DIGEST_SIZE
+        for offset in range(0, len(blob), _DIGEST_SIZE):
+            self._rows.setdefault(blob[offset:offset + _DIGEST_SIZE], row)
+            row += 1
+        self._keys_size = size
+
+    def get(self, digest: bytes) -> Optional[np.ndarray]:
+        row = self._rows.get(digest)
+        if row is None:
+            self.refresh()
+            row = self._rows.get(digest)
+            if row is None:
+                return None
+        if self._mmap is None or row >= self._mmap.shape[0]:
+            rows = self._keys_size // _DIGEST_SIZE
+            self._mmap = np.memmap(self.vectors_path, dtype="<f4", mode="r", shape=(rows, self.dim))
+        return self._mmap[row]
+
+    def put_many(self, items: List[tuple]) -> None:
+        """Append (digest, vector) pairs that are not stored yet."""
+        if self.dim is None:
+            self.dim = len(items[0][1])
+            with open(self.meta_path, "w", encoding="utf-8") as f:
+                json.dump({"namespace": self.namespace, "dim": self.dim}, f)
+
+        with open(self.keys_path, "ab") as keys_file:
+            fcntl.flock(keys_file, fcntl.LOCK_EX)
+            try:
+                self.refresh()
+                fresh = {}
+                for digest, vector in items:
+                    if digest not in self._rows and digest not in fresh:
+                        fresh[digest] = vector
+                if not fresh:
+                    return
+                matrix = np.asarray(list(fresh.values()), dtype="<f4")
+                if matrix.shape[1] != self.dim:
+                    raise ValueError(
+                        f"Embedding dimension {matrix.shape[1]} does not match store dimension {self.dim}"
+                    )
+                rows = self._keys_size // _DIGEST_SIZE
+                with open(self.vectors_path, "ab") as vectors_file:
+                    # Drop rows left behind by a writer that died before recording its keys.
+                    expected = rows * self.dim * 4
+                    if vectors_file.tell() != expected:
+                        vectors_file.truncate(expected)
+                    vectors_file.write(matrix.tobytes())
+                    vectors_file.flush()
+                keys_file.write(b"".join(fresh.keys()))
+                keys_file.flush()
+                for digest in fresh:
+                    self._rows[digest] = rows
+                    rows += 1
+                self._keys_size = rows * _DIGEST_SIZE
+            finally:
+                fcntl.flock(keys_file, fcntl.LOCK_UN)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+class EmbeddingStore:
+    """Directory of memory-mapped embedding shards, one per namespace."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._shards: Dict[str, _Shard] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _shard(self, namespace: str) -> _Shard:
+        shard = self._shards.get(namespace)
+        if shard is None:
+            shard = self._shards[namespace] = _Shard(self.path, namespace)
+        return shard
+
+    def get(self, namespace: str, text: str) -> Optional[np.ndarray]:
+        """
+        Look up a stored vector.
+
+        Args:
+            namespace: Store namespace (usually the embedding model)
+            text: The embedded text
+
+        Returns:
+            Read-only float32 vector backed by the memory map, or None
+        """
+        shard = self._shard(namespace)
+        vector = shard.get(text_digest(text))
+        if vector is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return vector
+
+    def get_many(self, namespace: str, texts: Iterable[str]) -> List[Optional[np.ndarray]]:
+        return [self.get(namespace, text) for text in texts]
+
+    def put(self, namespace: str, text: str, vector: Iterable[float]) -> None:
+        self.put_many(namespace, [text], [vector])
+
+    def put_many(self, namespace: str, texts: List[str], vectors: List[Iterable[float]]) -> None:
+        """Persist vectors for texts; already stored texts are skipped."""
+        if not texts:
+            return
+        items = [(text_digest(text), list(vector)) for text, vector in zip(texts, vectors)]
+        self._shard(namespace).put_many(items)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "namespaces": len(self._shards),
+            "vectors": sum(len(shard) for shard in self._shards.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
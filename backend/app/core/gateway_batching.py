@@ -0,0 +1,122 @@
+"""
+Embedding Micro-Batcher
+
+Collects concurrent single-text embedding requests for a short window and
+sends them upstream as one list request. Each caller receives a response
+shaped exactly like a single-input embedding call.
+
+A batch is flushed as soon as it reaches `max_batch_size` texts or when the
+oldest queued text has waited `max_wait` seconds, whichever comes first.
+Requests are only grouped with others for the same model and parameters.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .gateway_cache import canonical_json
+
+SendBatch = Callable[[str, List[str], Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class _PendingBatch:
+    __slots__ = ("model", "kwargs", "texts", "positions", "waiters", "timer")
+
+    def __init__(self, model: str, kwargs: Dict[str, Any]):
+        self.model = model
+        self.kwargs = kwargs
+        self.texts: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self.waiters: List[Tuple[int, "asyncio.Future[Dict[str, Any]]"]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+def split_embedding_response(response: Dict[str, Any], count: int) -> List[Dict[str, Any]]:
+    """
+    Split a list-input embedding response into per-input responses.
+
+    Args:
+        response: Upstream response whose "data" holds one item per input
+        count: Number of inputs that were sent
+
+    Returns:
+        One single-input response per input, in input order
+    """
+    data = response.get("data") or []
+    if len(data) != count:
+        raise ValueError(f"Embedding response has {len(data)} items for {count} inputs")
+    items = sorted(data, key=lambda item: item.get("index", 0))
+    envelope = {k: v for k, v in response.items() if k not in ("data", "usage")}
+    return [{**envelope, "data": [{**item, "index": 0}]} for item in items]
+
+
+class EmbeddingBatcher:
+    """Coalesces concurrent single-text embedding calls into list requests."""
+
+    def __init__(self, send: SendBatch, max_batch_size: int = 64, max_wait: float = 0.005):
+        self._send = send
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending: Dict[str, _PendingBatch] = {}
+        self._tasks: "set[asyncio.Task[None]]" = set()
+        self.requests = 0
+        self.batches = 0
+        self.deduplicated = 0
+        self.texts_sent = 0
+
+    async def submit(self, model: str, text: str, **kwargs) -> Dict[str, Any]:
+        """Queue one text and wait for its share of the batched response."""
+        group = f"{model}|{canonical_json(kwargs)}"
+        batch = self._pending.get(group)
+        if batch is None:
+            batch = _PendingBatch(model, kwargs)
+            self._pending[group] = batch
+            batch.timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush, group)
+
+        position = batch.positions.get(text)
+        if position is None:
+            position = batch.positions[text] = len(batch.texts)
+            batch.texts.append(text)
+        else:
+            self.deduplicated += 1
+
+        future: "asyncio.Future[Dict[str, Any]]" = asyncio.get_running_loop().create_future()
+        batch.waiters.append((position, future))
+        self.requests += 1
+        if len(batch.texts) >= self.max_batch_size:
+            self._flush(group)
+        return await future
+
+    def _flush(self, group: str) -> None:
+        batch = self._pending.pop(group, None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: _PendingBatch) -> None:
+        if all(future.done() for _, future in batch.waiters):
+            return  # every caller went away before the flush
+        self.batches += 1
+        self.texts_sent += len(batch.texts)
+        try:
+            response = await self._send(batch.model, batch.texts, batch.kwargs)
+            parts = split_embedding_response(response, len(batch.texts))
+        except Exception as e:
+            for _, future in batch.waiters:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for position, future in batch.waiters:
+            if not future.done():
+                future.set_result(parts[position])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "deduplicated": self.deduplicated,
+            "avg_batch_size": self.texts_sent / self.batches if self.batches else 0.0,
+        }
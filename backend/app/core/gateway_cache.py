@@ -0,0 +1,154 @@
+"""
+Response Cache for the Cloudflare AI Gateway Client
+
+Exact-match cache for non-streaming gateway responses. Requests are keyed on
+a canonical hash of their JSON payload, so two calls with the same model,
+messages and parameters share one upstream response.
+
+The cache has two tiers:
+  - an in-process LRU bounded by entry count and total serialized bytes
+  - an optional Redis tier shared between workers
+
+Both tiers honour the same TTL. Redis failures are logged and treated as
+misses so the cache can never take the gateway down with it.
+"""
+
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover - redis is optional
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+
+def canonical_json(payload: Dict[str, Any]) -> str:
+    """Serialize a payload deterministically (sorted keys, no whitespace)."""
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def payload_key(payload: Dict[str, Any], namespace: str = "") -> str:
+    """
+    Build a stable cache key for a request payload.
+
+    Args:
+        payload: JSON-serializable request body
+        namespace: Prefix separating different endpoints (e.g. "chat", "embeddings")
+
+    Returns:
+        Hex SHA-256 digest of the canonical payload, prefixed by the namespace
+    """
+    digest = hashlib.sha256(canonical_json(payload).encode("utf-8")).hexdigest()
+    return f"{namespace}:{digest}" if namespace else digest
+
+
+class ResponseCache:
+    """Two-tier (LRU + optional Redis) cache for gateway JSON responses."""
+
+    def __init__(
+        self,
+        ttl: float = 300.0,
+        max_entries: int = 1024,
+        max_bytes: int = 64 * 1024 * 1024,
+        redis_url: Optional[str] = None,
+        redis_prefix: str = "cua:ai-cache:",
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.redis_prefix = redis_prefix
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._bytes = 0
+        self._redis = None
+        if redis_url:
+            if aioredis is None:
+                logger.warning("redis package not installed; AI response cache runs in-process only")
+            else:
+                self._redis = aioredis.from_url(redis_url)
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a fresh copy of the cached response, or None on a miss."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, blob = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(blob)
+            self._discard(key)
+            self.expirations += 1
+
+        if self._redis is not None:
+            try:
+                blob = await self._redis.get(self.redis_prefix + key)
+            except Exception as e:
+                logger.warning(f"AI response cache Redis lookup failed: {e}")
+                blob = None
+            if blob is not None:
+                blob = blob.decode("utf-8") if isinstance(blob, bytes) else blob
+                self._store_local(key, blob)
+                self.redis_hits += 1
+                return json.loads(blob)
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Store a response in every configured tier."""
+        blob = json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+        self._store_local(key, blob)
+        if self._redis is not None:
+            try:
+                await self._redis.set(self.redis_prefix + key, blob, ex=max(1, int(self.ttl)))
+            except Exception as e:
+                logger.warning(f"AI response cache Redis write failed: {e}")
+
+    def _store_local(self, key: str, blob: str) -> None:
+        size = len(blob)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._discard(key)
+        self._entries[key] = (time.monotonic() + self.ttl, blob)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+            self.evictions += 1
+
+    def _discard(self, key: str) -> None:
+        _, blob = self._entries.pop(key)
+        self._bytes -= len(blob)
+
+    def clear(self) -> None:
+        """Drop every in-process entry (the Redis tier is left untouched)."""
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.redis_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": (self.hits + self.redis_hits) / lookups if lookups else 0.0,
+        }
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
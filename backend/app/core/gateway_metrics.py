@@ -0,0 +1,216 @@
+"""
+Prometheus Instrumentation for the Cloudflare AI Gateway Client
+
+Metrics are module-level singletons on the default Prometheus registry, so
+any number of gateway instances in a process report into the same series.
+Labels are kept to bounded sets: request kind, model, endpoint name and a
+coarse outcome. Model names come from client requests, so they pass through
+`MODEL_LABELS` first: only configured models (or, without a configured
+list, the first `limit` models seen) keep their name, the rest are
+reported as "other".
+
+Besides request-level histograms, `GatewayStatsCollector` exports the
+counters kept by the client's caches, coalescing, hedging and scheduling
+layers at scrape time.
+"""
+
+import weakref
+from typing import Any, Iterable, Iterator, Optional, Set
+
+import httpx
+from prometheus_client import REGISTRY, Counter, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+_GAP_BUCKETS = (0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+_RATE_BUCKETS = (5, 10, 20, 40, 60, 80, 120, 200, 400)
+_TOKEN_BUCKETS = (64, 256, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+
+REQUEST_LATENCY = Histogram(
+    "ai_gateway_request_duration_seconds",
+    "Latency of upstream request attempts (failed streams included).",
+    ["kind", "model", "endpoint", "outcome"],
+    buckets=_LATENCY_BUCKETS,
+)
+TIME_TO_FIRST_TOKEN = Histogram(
+    "ai_gateway_time_to_first_token_seconds",
+    "Time from sending a streaming request to its first event.",
+    ["model", "endpoint"],
+    buckets=_LATENCY_BUCKETS,
+)
+INTER_TOKEN_GAP = Histogram(
+    "ai_gateway_inter_token_seconds",
+    "Gap between consecutive events of a stream.",
+    ["model", "endpoint"],
+    buckets=_GAP_BUCKETS,
+)
+STREAM_TOKENS_PER_SECOND = Histogram(
+    "ai_gateway_stream_tokens_per_second",
+    "Streaming throughput after the first token (one event counted as one token).",
+    ["model", "endpoint"],
+    buckets=_RATE_BUCKETS,
+)
+PROMPT_TOKENS = Histogram(
+    "ai_gateway_prompt_tokens",
+    "Prompt size of chat completions, counted locally.",
+    ["model"],
+    buckets=_TOKEN_BUCKETS,
+)
+ERRORS = Counter(
+    "ai_gateway_errors_total",
+    "Failed gateway requests.",
+    ["kind", "model", "endpoint", "reason"],
+)
+TIMEOUTS = Counter(
+    "ai_gateway_timeouts_total",
+    "Gateway requests that timed out (per attempt) or ran out of latency budget (per call).",
+    ["kind", "model", "cause"],
+)
+
+
+OTHER_MODEL = "other"
+
+
+class ModelLabels:
+    """Maps client-supplied model names onto a bounded set of label values."""
+
+    def __init__(self, limit: int = 64):
+        self.limit = limit
+        self.allow_list = False
+        self._known: Set[str] = set()
+
+    def configure(self, models: Iterable[str] = (), allow_list: bool = False, limit: Optional[int] = None) -> None:
+        """
+        Args:
+            models: Models that always keep their own label
+            allow_list: Only `models` keep their name; everything else is "other"
+            limit: Distinct model labels at most, when not restricted to `models`
+        """
+        self._known.update(models)
+        self.allow_list = allow_list
+        if limit is not None:
+            self.limit = limit
+
+    def __call__(self, model: str) -> str:
+        if model in self._known:
+            return model
+        if self.allow_list or len(self._known) >= self.limit:
+            return OTHER_MODEL
+        self._known.add(model)
+        return model
+
+
+MODEL_LABELS = ModelLabels()
+
+
+def error_reason(exc: BaseException) -> str:
+    """Coarse, bounded label for a failed request."""
+    if isinstance(exc, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(exc, httpx.HTTPStatusError):
+        return f"http_{exc.response.status_code}"
+    if isinstance(exc, httpx.TransportError):
+        return "transport"
+    return type(exc).__name__
+
+
+def observe_attempt(kind: str, model: str, endpoint: str, seconds: float, exc: Optional[BaseException]) -> None:
+    """Record one upstream attempt: its latency, and the failure reason if it failed."""
+    if exc is None:
+        REQUEST_LATENCY.labels(kind, model, endpoint, "ok").observe(seconds)
+        return
+    reason = error_reason(exc)
+    REQUEST_LATENCY.labels(kind, model, endpoint, "error").observe(seconds)
+    ERRORS.labels(kind, model, endpoint, reason).inc()
+    if reason == "timeout":
+        TIMEOUTS.labels(kind, model, "request").inc()
+
+
+def observe_budget_exceeded(kind: str, model: str) -> None:
+    TIMEOUTS.labels(kind, model, "latency_budget").inc()
+
+
+class StreamTimer:
+    """TTFT, inter-token gaps and throughput of one stream; label children are resolved once."""
+
+    __slots__ = ("started", "first", "last", "events", "_ttft", "_gap", "_rate")
+
+    def __init__(self, model: str, endpoint: str, started: float):
+        self.started = started
+        self.first = 0.0
+        self.last = 0.0
+        self.events = 0
+        self._ttft = TIME_TO_FIRST_TOKEN.labels(model, endpoint)
+        self._gap = INTER_TOKEN_GAP.labels(model, endpoint)
+        self._rate = STREAM_TOKENS_PER_SECOND.labels(model, endpoint)
+
+    def event(self, now: float) -> None:
+        if self.events == 0:
+            self.first = now
+            self._ttft.observe(now - self.started)
+        else:
+            self._gap.observe(now - self.last)
+        self.last = now
+        self.events += 1
+
+    def finish(self) -> None:
+        duration = self.last - self.first
+        if self.events > 1 and duration > 0:
+            self._rate.observe((self.events - 1) / duration)
+
+
+class GatewayStatsCollector:
+    """Exports the in-process counters of registered gateway clients at scrape time."""
+
+    def __init__(self):
+        self._gateways: "weakref.WeakSet[Any]" = weakref.WeakSet()
+
+    def add(self, gateway: Any) -> None:
+        self._gateways.add(gateway)
+
+    def collect(self) -> Iterator[Any]:
+        cache_hits = CounterMetricFamily("ai_gateway_cache_hits", "Response cache hits.", labels=["cache"])
+        cache_misses = CounterMetricFamily("ai_gateway_cache_misses", "Response cache misses.", labels=["cache"])
+        coalesced = CounterMetricFamily("ai_gateway_coalesced_requests", "Requests that joined an in-flight call.")
+        hedges = CounterMetricFamily("ai_gateway_hedges", "Hedged requests.", labels=["result"])
+        retries = CounterMetricFamily("ai_gateway_retries", "Retried attempts.")
+        queue_depth = GaugeMetricFamily("ai_gateway_queue_depth", "Requests waiting for a slot.", labels=["lane"])
+        active = GaugeMetricFamily("ai_gateway_active_requests", "Requests holding a slot.")
+
+        totals = {
+            "hits": {}, "misses": {}, "coalesced": 0, "fired": 0, "won": 0,
+            "retries": 0, "queued": {}, "active": 0,
+        }
+        for gateway in list(self._gateways):
+            for name, cache in (("exact", gateway.cache), ("semantic", gateway.semantic_cache)):
+                if cache is not None:
+                    stats = cache.stats()
+                    totals["hits"][name] = totals["hits"].get(name, 0) + stats["hits"] + stats.get("redis_hits", 0)
+                    totals["misses"][name] = totals["misses"].get(name, 0) + stats["misses"]
+            if gateway.singleflight is not None:
+                totals["coalesced"] += gateway.singleflight.followers
+            executor = gateway.executor.stats()
+            totals["fired"] += executor["hedges_fired"]
+            totals["won"] += executor["hedges_won"]
+            totals["retries"] += executor["retries"]
+            scheduler = gateway.scheduler.stats()
+            totals["active"] += scheduler["active"]
+            for lane, stats in scheduler["lanes"].items():
+                totals["queued"][lane] = totals["queued"].get(lane, 0) + stats["queue_depth"]
+
+        for name, value in totals["hits"].items():
+            cache_hits.add_metric([name], value)
+        for name, value in totals["misses"].items():
+            cache_misses.add_metric([name], value)
+        coalesced.add_metric([], totals["coalesced"])
+        hedges.add_metric(["fired"], totals["fired"])
+        hedges.add_metric(["won"], totals["won"])
+        retries.add_metric([], totals["retries"])
+        for lane, value in totals["queued"].items():
+            queue_depth.add_metric([lane], value)
+        active.add_metric([], totals["active"])
+        yield from (cache_hits, cache_misses, coalesced, hedges, retries, queue_depth, active)
+
+
+STATS_COLLECTOR = GatewayStatsCollector()
+REGISTRY.register(STATS_COLLECTOR)
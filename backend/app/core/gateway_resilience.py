@@ -0,0 +1,210 @@
+"""
+Retries, Hedging and Latency Budgets for Gateway Calls
+
+`RequestExecutor` runs one logical upstream call as a sequence of attempts:
+  - retryable failures (transport errors, 408/425/429/5xx) are retried with
+    full-jitter exponential backoff, honouring `Retry-After`
+  - an attempt that is slower than the observed latency percentile for its
+    route gets a hedge: a duplicate attempt; the first successful response
+    wins and the other one is cancelled
+  - everything stays inside the caller's latency budget (a deadline on the
+    event loop clock); no attempt or backoff may run past it
+
+The deadline is carried in a context variable so that it reaches the
+executor through caches, coalescing and batching layers unchanged.
+"""
+
+import asyncio
+import contextvars
+import random
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, Optional
+
+import httpx
+
+RETRYABLE_STATUS = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "gateway_deadline", default=None
+)
+
+
+class LatencyBudgetExceeded(TimeoutError):
+    """The call did not complete within its latency budget."""
+
+
+@contextmanager
+def latency_budget(seconds: Optional[float]) -> Iterator[None]:
+    """Run the enclosed gateway calls under a deadline `seconds` from now."""
+    if seconds is None:
+        yield
+        return
+    deadline = asyncio.get_running_loop().time() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRYABLE_STATUS
+    return isinstance(exc, httpx.TransportError)
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    if isinstance(exc, httpx.HTTPStatusError):
+        value = exc.response.headers.get("retry-after")
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                return None
+    return None
+
+
+class LatencyTracker:
+    """Rolling window of successful attempt latencies per route."""
+
+    def __init__(self, window: int = 256):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, route: str, seconds: float) -> None:
+        samples = self._samples.get(route)
+        if samples is None:
+            samples = self._samples[route] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def percentile(self, route: str, pct: float) -> Optional[float]:
+        samples = self._samples.get(route)
+        if not samples or len(samples) < 10:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100.0))]
+
+
+class RequestExecutor:
+    """Executes gateway attempts with retries, hedging and deadlines."""
+
+    def __init__(
+        self,
+        max_retries: int = 2,
+        backoff_base: float = 0.2,
+        backoff_max: float = 5.0,
+        hedge_enabled: bool = False,
+        hedge_percentile: float = 95.0,
+        hedge_min_delay: float = 0.05,
+        hedge_initial_delay: float = 2.0,
+    ):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_initial_delay = hedge_initial_delay
+        self.latency = LatencyTracker()
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        self.budget_exceeded = 0
+
+    async def run(self, route: str, attempt: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run `attempt` until it succeeds, retries are exhausted or the budget runs out.
+
+        Args:
+            route: Latency class of the call (e.g. "chat:openai/gpt-4")
+            attempt: Coroutine factory performing a single upstream request
+
+        Returns:
+            The result of the first successful attempt
+
+        Raises:
+            LatencyBudgetExceeded: When the deadline passes first
+            Exception: The last attempt's error once retries are exhausted
+        """
+        loop = asyncio.get_running_loop()
+        deadline = _deadline.get()
+        self.calls += 1
+        retry = 0
+        while True:
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                self.budget_exceeded += 1
+                raise LatencyBudgetExceeded(f"latency budget exhausted after {retry} retries")
+            try:
+                return await asyncio.wait_for(self._hedged(route, attempt), remaining)
+            except asyncio.TimeoutError:
+                self.budget_exceeded += 1
+                raise LatencyBudgetExceeded(f"latency budget exhausted after {retry} retries") from None
+            except Exception as e:
+                if retry >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** retry)))
+                if deadline is not None and loop.time() + delay >= deadline:
+                    raise
+                retry += 1
+                self.retries += 1
+                await asyncio.sleep(delay)
+
+    async def _timed(self, route: str, attempt: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        self.attempts += 1
+        result = await attempt()
+        self.latency.record(route, loop.time() - started)
+        return result
+
+    def _hedge_delay(self, route: str) -> float:
+        observed = self.latency.percentile(route, self.hedge_percentile)
+        if observed is None:
+            return self.hedge_initial_delay
+        return max(self.hedge_min_delay, observed)
+
+    async def _hedged(self, route: str, attempt: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.hedge_enabled:
+            return await self._timed(route, attempt)
+
+        primary = asyncio.ensure_future(self._timed(route, attempt))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self._hedge_delay(route))
+            if not done:
+                hedge = asyncio.ensure_future(self._timed(route, attempt))
+                tasks.add(hedge)
+                self.hedges_fired += 1
+
+            error: Optional[BaseException] = None
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tasks.discard(task)
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedges_won += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "hedges_fired": self.hedges_fired,
+            "hedges_won": self.hedges_won,
+            "hedge_win_rate": self.hedges_won / self.hedges_fired if self.hedges_fired else 0.0,
+            "budget_exceeded": self.budget_exceeded,
+        }
@@ -0,0 +1,186 @@
+"""
+Latency-Aware Endpoint Routing
+
+Spreads gateway calls over a pool of endpoints (regions, gateways or
+accounts). Every call reports its latency and outcome; the router keeps an
+exponentially weighted moving average (EWMA) of both per endpoint and model
+and sends the next call to the endpoint with the lowest expected cost:
+
+    cost = ewma_latency * (1 + in_flight) * (1 + error_penalty * ewma_error_rate)
+
+Endpoints that keep failing trip a circuit breaker and receive no traffic
+until `reset_timeout` has passed; then a single probe call decides whether
+the breaker closes again. Endpoints without samples yet, or whose samples
+are older than `probe_interval`, are tried first so that a recovered
+endpoint wins its traffic back.
+"""
+
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class GatewayEndpoint(BaseModel):
+    """One upstream gateway. `api_token` overrides the client-wide token (e.g. another account)."""
+    name: str
+    base_url: str
+    api_token: Optional[str] = None
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probing = False
+
+    def allows(self, now: float) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and now - self.opened_at >= self.reset_timeout:
+            self.state = HALF_OPEN
+            self._probing = False
+        return self.state == HALF_OPEN and not self._probing
+
+    def on_dispatch(self) -> None:
+        if self.state == HALF_OPEN:
+            self._probing = True
+
+    def abandon_probe(self) -> None:
+        """The probe call ended without an outcome (e.g. cancelled); allow another."""
+        self._probing = False
+
+    def on_success(self) -> None:
+        self.state = CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def on_failure(self, now: float) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.trips += 1
+            self.state = OPEN
+            self.opened_at = now
+            self._probing = False
+
+
+class _RouteStats:
+    __slots__ = ("latency", "error_rate", "samples", "updated")
+
+    def __init__(self):
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.samples = 0
+        self.updated = 0.0
+
+
+class EndpointRouter:
+    """Chooses an endpoint per call from EWMA latency/error stats and breaker state."""
+
+    def __init__(
+        self,
+        endpoints: List[GatewayEndpoint],
+        alpha: float = 0.2,
+        error_penalty: float = 4.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        probe_interval: float = 10.0,
+    ):
+        if not endpoints:
+            raise ValueError("EndpointRouter needs at least one endpoint")
+        self.endpoints = endpoints
+        self.alpha = alpha
+        self.error_penalty = error_penalty
+        self.probe_interval = probe_interval
+        self.breakers = {e.name: CircuitBreaker(failure_threshold, reset_timeout) for e in endpoints}
+        self.in_flight = {e.name: 0 for e in endpoints}
+        self._stats: Dict[Tuple[str, str], _RouteStats] = {}
+
+    def _cost(self, endpoint: GatewayEndpoint, model: str, now: float) -> float:
+        stats = self._stats.get((endpoint.name, model))
+        if stats is None or stats.samples == 0 or now - stats.updated > self.probe_interval:
+            return -1.0  # unexplored or stale: try it first
+        return stats.latency * (1 + self.in_flight[endpoint.name]) * (1 + self.error_penalty * stats.error_rate)
+
+    def choose(self, model: str, exclude: Iterable[str] = ()) -> GatewayEndpoint:
+        """
+        Pick the endpoint for the next call and mark it in flight.
+
+        Args:
+            model: Model of the call (stats are kept per endpoint and model)
+            exclude: Endpoint names to avoid, e.g. ones this call already tried
+
+        Returns:
+            The chosen endpoint; call `release()` when the request finishes
+        """
+        if len(self.endpoints) == 1:
+            endpoint = self.endpoints[0]
+        else:
+            now = time.monotonic()
+            excluded = set(exclude)
+            candidates = [e for e in self.endpoints if e.name not in excluded] or self.endpoints
+            allowed = [e for e in candidates if self.breakers[e.name].allows(now)]
+            if allowed:
+                endpoint = min(allowed, key=lambda e: self._cost(e, model, now))
+            else:
+                # Everything is tripped: fail open towards the breaker due to reset first.
+                endpoint = min(candidates, key=lambda e: self.breakers[e.name].opened_at)
+        self.breakers[endpoint.name].on_dispatch()
+        self.in_flight[endpoint.name] += 1
+        return endpoint
+
+    def release(self, endpoint: GatewayEndpoint) -> None:
+        """Mark a call finished. A half-open probe that never reported is given back."""
+        self.in_flight[endpoint.name] -= 1
+        breaker = self.breakers[endpoint.name]
+        if breaker.state == HALF_OPEN:
+            breaker.abandon_probe()
+
+    def record(self, endpoint: GatewayEndpoint, model: str, latency: float, ok: bool) -> None:
+        """Report the outcome of a call; failures count towards the endpoint's breaker."""
+        stats = self._stats.get((endpoint.name, model))
+        if stats is None:
+            stats = self._stats[(endpoint.name, model)] = _RouteStats()
+        if stats.samples == 0:
+            stats.latency = latency
+            stats.error_rate = 0.0 if ok else 1.0
+        else:
+            stats.latency += self.alpha * (latency - stats.latency)
+            stats.error_rate += self.alpha * ((0.0 if ok else 1.0) - stats.error_rate)
+        stats.samples += 1
+        stats.updated = time.monotonic()
+
+        breaker = self.breakers[endpoint.name]
+        if ok:
+            breaker.on_success()
+        else:
+            breaker.on_failure(stats.updated)
+
+    def stats(self) -> Dict[str, Any]:
+        routes = {}
+        for (name, model), stats in self._stats.items():
+            routes.setdefault(name, {})[model] = {
+                "ewma_latency": stats.latency,
+                "ewma_error_rate": stats.error_rate,
+                "samples": stats.samples,
+            }
+        return {
+            name: {
+                "breaker": breaker.state,
+                "trips": breaker.trips,
+                "in_flight": self.in_flight[name],
+                "models": routes.get(name, {}),
+            }
+            for name, breaker in self.breakers.items()
+        }
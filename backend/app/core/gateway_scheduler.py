@@ -0,0 +1,242 @@
+"""
+Priority Scheduler and Rate Limiter for Gateway Calls
+
+Every upstream request takes a slot from `GatewayScheduler` first. The
+scheduler enforces:
+  - a global cap on concurrent upstream requests
+  - token-bucket rate limits per model and per account (endpoint)
+  - priority lanes: "interactive" requests (chat) and "background" requests
+    (bulk embedding jobs), served by weighted round robin so interactive
+    traffic goes first without starving background work
+
+Within a lane requests are served first come, first served. The priority of
+a call travels in a context variable, like the latency budget, so the
+public client methods can set it once for everything they trigger.
+"""
+
+import asyncio
+import contextvars
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, Optional
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+LANES = (INTERACTIVE, BACKGROUND)
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("gateway_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def request_priority(priority: Optional[str]) -> Iterator[None]:
+    """Run the enclosed gateway calls in the given priority lane."""
+    if priority is None:
+        yield
+        return
+    if priority not in LANES:
+        raise ValueError(f"Unknown priority {priority!r}; expected one of {LANES}")
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, at most `burst` stored."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def delay(self, now: float) -> float:
+        """Seconds until one token is available (0 if available now)."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1.0 else (1.0 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1.0
+
+
+class _Waiter:
+    __slots__ = ("future", "model", "account", "enqueued", "deferred")
+
+    def __init__(self, future: "asyncio.Future[None]", model: str, account: str, enqueued: float):
+        self.future = future
+        self.model = model
+        self.account = account
+        self.enqueued = enqueued
+        self.deferred = False  # held back by a rate limit at least once
+
+
+class _LaneStats:
+    __slots__ = ("granted", "total_wait", "max_wait")
+
+    def __init__(self):
+        self.granted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+class GatewayScheduler:
+    """Grants upstream request slots by priority, concurrency and rate limits."""
+
+    def __init__(
+        self,
+        max_concurrency: int = 64,
+        model_rate: Optional[float] = None,
+        model_rates: Optional[Dict[str, float]] = None,
+        account_rate: Optional[float] = None,
+        interactive_weight: int = 4,
+    ):
+        self.max_concurrency = max_concurrency
+        self.model_rate = model_rate
+        self.model_rates = model_rates or {}
+        self.account_rate = account_rate
+        self.weights = {INTERACTIVE: max(1, interactive_weight), BACKGROUND: 1}
+        self._credits = dict(self.weights)
+        self._lanes: Dict[str, Deque[_Waiter]] = {lane: deque() for lane in LANES}
+        self._model_buckets: Dict[str, TokenBucket] = {}
+        self._account_buckets: Dict[str, TokenBucket] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_at = 0.0
+        self.active = 0
+        self.rate_limited = 0
+        self._stats = {lane: _LaneStats() for lane in LANES}
+
+    @asynccontextmanager
+    async def slot(self, model: str, account: str, priority: Optional[str] = None) -> AsyncIterator[float]:
+        """
+        Hold one upstream request slot for the duration of the block.
+
+        Args:
+            model: Model the request is for (per-model rate limit)
+            account: Endpoint/account the request goes to (per-account rate limit)
+            priority: Lane to queue in; defaults to the current request priority
+
+        Yields:
+            Seconds spent waiting in the queue
+        """
+        waited = await self.acquire(model, account, priority)
+        try:
+            yield waited
+        finally:
+            self.release()
+
+    async def acquire(self, model: str, account: str, priority: Optional[str] = None) -> float:
+        lane = priority or _priority.get()
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(loop.create_future(), model, account, loop.time())
+        self._lanes[lane].append(waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release()  # granted just before the caller gave up
+            else:
+                try:
+                    self._lanes[lane].remove(waiter)
+                except ValueError:
+                    pass
+            raise
+        waited = loop.time() - waiter.enqueued
+        stats = self._stats[lane]
+        stats.granted += 1
+        stats.total_wait += waited
+        stats.max_wait = max(stats.max_wait, waited)
+        return waited
+
+    def release(self) -> None:
+        self.active -= 1
+        self._dispatch()
+
+    def _bucket(self, buckets: Dict[str, TokenBucket], key: str, rate: Optional[float]) -> Optional[TokenBucket]:
+        if rate is None:
+            return None
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(rate)
+        return bucket
+
+    def _dispatch(self) -> None:
+        now = time.monotonic()
+        retry_in: Optional[float] = None
+        while self.active < self.max_concurrency:
+            granted = False
+            for lane in self._lane_order():
+                queue = self._lanes[lane]
+                while queue and queue[0].future.done():
+                    queue.popleft()  # cancelled while queued
+                if not queue:
+                    continue
+                waiter = queue[0]
+                model_bucket = self._bucket(
+                    self._model_buckets, waiter.model, self.model_rates.get(waiter.model, self.model_rate)
+                )
+                account_bucket = self._bucket(self._account_buckets, waiter.account, self.account_rate)
+                delay = max(
+                    model_bucket.delay(now) if model_bucket else 0.0,
+                    account_bucket.delay(now) if account_bucket else 0.0,
+                )
+                if delay > 0:
+                    if not waiter.deferred:  # count requests, not dispatch passes
+                        waiter.deferred = True
+                        self.rate_limited += 1
+                    retry_in = delay if retry_in is None else min(retry_in, delay)
+                    continue
+                if model_bucket:
+                    model_bucket.take()
+                if account_bucket:
+                    account_bucket.take()
+                queue.popleft()
+                self._credits[lane] -= 1
+                self.active += 1
+                waiter.future.set_result(None)
+                granted = True
+                break
+            if not granted:
+                break
+        if retry_in is not None:
+            self._schedule(retry_in)
+
+    def _lane_order(self):
+        """Weighted round robin: lanes with credit left first, refilling once all are spent."""
+        waiting = [lane for lane in LANES if self._lanes[lane]]
+        if waiting and all(self._credits[lane] <= 0 for lane in waiting):
+            self._credits = dict(self.weights)
+        return sorted(LANES, key=lambda lane: self._credits[lane] <= 0)
+
+    def _schedule(self, delay: float) -> None:
+        loop = asyncio.get_running_loop()
+        at = loop.time() + delay
+        if self._timer is not None and self._timer_at <= at:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer_at = at
+        self._timer = loop.call_at(at, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "rate_limited": self.rate_limited,
+            "lanes": {
+                lane: {
+                    "queue_depth": sum(1 for w in self._lanes[lane] if not w.future.done()),
+                    "granted": stats.granted,
+                    "avg_wait": stats.total_wait / stats.granted if stats.granted else 0.0,
+                    "max_wait": stats.max_wait,
+                }
+                for lane, stats in self._stats.items()
+            },
+        }
@@ -0,0 +1,74 @@
+"""
+Single-Flight Request Coalescing
+
+Concurrent callers asking for the same key share one in-flight upstream call
+instead of each opening their own. The upstream call runs in its own task, so
+a caller that disconnects (is cancelled) only withdraws itself; the shared
+call is cancelled only once every waiting caller has gone.
+
+Results are shared between callers and must be treated as read-only.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task[Any]"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls that share a key."""
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.cancelled = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run `fn` once for all concurrent callers using the same key.
+
+        Args:
+            key: Identity of the call (e.g. a payload hash)
+            fn: Zero-argument coroutine factory performing the upstream call
+
+        Returns:
+            The result of the shared call
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.leaders += 1
+        else:
+            self.followers += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Last interested caller left: stop the upstream call.
+                flight.task.cancel()
+                self._forget(key, flight)
+                self.cancelled += 1
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "cancelled": self.cancelled,
+        }
@@ -0,0 +1,297 @@
+"""
+Prompt Token Budgeting
+
+Counts prompt tokens locally before a chat completion goes out and trims
+the conversation to a configured budget, so oversized prompts are cut (or
+rejected) without paying for a full round trip first.
+
+Tokenizers are resolved once per encoding and cached; per-text counts are
+memoised too (keyed by a digest of the text), since chat histories resend
+the same turns on every call. Loading an encoding may download its BPE
+file, so `fit` loads it in a worker thread (and `PromptBudgeter.preload`
+does so at startup) rather than on the event loop. When `tiktoken` (or its
+encoding files) is unavailable, a conservative characters-per-token
+estimate is used instead, and the load is retried after a backoff.
+
+Trimming keeps every system message and the final message, and drops the
+oldest remaining turns first (an assistant tool call is dropped together
+with its tool results). An optional summarizer can replace the dropped
+turns with a short summary message.
+"""
+
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - falls back to an estimate
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# OpenAI chat formatting overhead (per message, and for priming the reply).
+_TOKENS_PER_MESSAGE = 3
+_TOKENS_PER_NAME = 1
+_REPLY_PRIMING = 3
+_CHARS_PER_TOKEN = 3.5
+
+Summarizer = Callable[[List[Dict[str, Any]]], Awaitable[str]]
+
+
+class PromptTooLarge(ValueError):
+    """The prompt cannot be trimmed to fit its token budget."""
+
+
+class PromptBudgetReport(BaseModel):
+    """Token accounting for one outgoing prompt."""
+    model: str
+    tokenizer: str
+    original_tokens: int
+    final_tokens: int
+    budget: Optional[int] = None
+    dropped_messages: int = 0
+    summarized: bool = False
+
+
+_DEFAULT_ENCODING = "cl100k_base"
+_LOAD_RETRY = 300.0  # seconds before a failed encoding load is tried again
+_COUNT_CACHE_SIZE = 8192
+
+_ENCODINGS: Dict[str, Any] = {}  # loaded encodings by name
+_LOAD_FAILED: Dict[str, float] = {}  # encoding name -> time.monotonic() of its last failed load
+_LOAD_LOCK = threading.Lock()  # one load at a time, so concurrent first calls share it
+_COUNTS: "OrderedDict[Tuple[str, bytes], int]" = OrderedDict()  # least recently used first
+
+
+@lru_cache(maxsize=1024)
+def _encoding_name(model: str) -> Optional[str]:
+    """Encoding name for a gateway model such as "openai/gpt-4o" (no I/O); None means estimate."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_name_for_model(model.split("/")[-1])
+    except KeyError:
+        return _DEFAULT_ENCODING
+
+
+def _needs_load(name: str) -> bool:
+    failed = _LOAD_FAILED.get(name)
+    return name not in _ENCODINGS and (failed is None or time.monotonic() - failed >= _LOAD_RETRY)
+
+
+def _load_encoding(name: str):
+    """Load an encoding, which may download its BPE file: call it off the event loop."""
+    with _LOAD_LOCK:
+        if _needs_load(name):
+            try:
+                _ENCODINGS[name] = tiktoken.get_encoding(name)
+                _LOAD_FAILED.pop(name, None)
+            except Exception as e:  # encoding files could not be loaded (e.g. offline)
+                logger.warning(f"No tokenizer {name}, estimating token counts for {_LOAD_RETRY:.0f}s: {e}")
+                _LOAD_FAILED[name] = time.monotonic()
+    return _ENCODINGS.get(name)
+
+
+async def load_tokenizer(model: str) -> None:
+    """Make sure the model's encoding is loaded, loading it in a worker thread if not."""
+    name = _encoding_name(model)
+    if name is not None and _needs_load(name):
+        await asyncio.to_thread(_load_encoding, name)
+
+
+def _encoding_for(model: str):
+    """Tokenizer for a model; None means estimate. Loads the encoding inline on first use only."""
+    name = _encoding_name(model)
+    if name is None:
+        return None
+    if name in _ENCODINGS or name in _LOAD_FAILED:
+        # Retrying a failed load is left to load_tokenizer, which runs it off the event loop.
+        return _ENCODINGS.get(name)
+    return _load_encoding(name)
+
+
+def _count_text(encoding_name: str, text: str) -> int:
+    # Keyed by a digest so the cache holds no prompt text, however long the turns are.
+    key = (encoding_name, hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest())
+    count = _COUNTS.get(key)
+    if count is not None:
+        _COUNTS.move_to_end(key)
+        return count
+    encoding = _ENCODINGS.get(encoding_name)
+    if encoding is None:
+        count = int(len(text) / _CHARS_PER_TOKEN) + 1
+    else:
+        count = len(encoding.encode(text, disallowed_special=()))
+    _COUNTS[key] = count
+    if len(_COUNTS) > _COUNT_CACHE_SIZE:
+        _COUNTS.popitem(last=False)
+    return count
+
+
+def tokenizer_name(model: str) -> str:
+    encoding = _encoding_for(model)
+    return encoding.name if encoding is not None else "estimate"
+
+
+def message_text(message: Dict[str, Any]) -> str:
+    """Plain text of a message: string content, text parts and tool call arguments."""
+    content = message.get("content")
+    if isinstance(content, str):
+        text = content
+    elif isinstance(content, list):
+        text = "".join(
+            part.get("text", "") for part in content if isinstance(part, dict) and part.get("type") == "text"
+        )
+    else:
+        text = ""
+    for call in message.get("tool_calls") or []:
+        function = call.get("function") or {}
+        text += function.get("name", "") + function.get("arguments", "")
+    return text
+
+
+def count_message_tokens(model: str, message: Dict[str, Any]) -> int:
+    encoding = tokenizer_name(model)
+    tokens = _TOKENS_PER_MESSAGE + _count_text(encoding, message.get("role", ""))
+    tokens += _count_text(encoding, message_text(message))
+    if message.get("name"):
+        tokens += _TOKENS_PER_NAME + _count_text(encoding, message["name"])
+    return tokens
+
+
+def count_prompt_tokens(model: str, messages: List[Dict[str, Any]]) -> int:
+    """Tokens the messages will occupy in the model's context window."""
+    return _REPLY_PRIMING + sum(count_message_tokens(model, m) for m in messages)
+
+
+def _droppable_groups(messages: List[Dict[str, Any]]) -> List[List[int]]:
+    """Indexes of droppable turns, oldest first; tool results stay with their call."""
+    # The final message is always kept; if it is a tool result, so is the call it answers.
+    keep_from = len(messages) - 1
+    while keep_from > 0 and messages[keep_from].get("role") == "tool":
+        keep_from -= 1
+
+    groups: List[List[int]] = []
+    for i, message in enumerate(messages[:keep_from]):
+        role = message.get("role")
+        if role == "system":
+            continue
+        if role == "tool" and groups and i - 1 in groups[-1]:
+            groups[-1].append(i)
+            continue
+        groups.append([i])
+    return groups
+
+
+class PromptBudgeter:
+    """Fits chat prompts to a token budget before they are sent."""
+
+    def __init__(
+        self,
+        budget: Optional[int] = None,
+        summarizer: Optional[Summarizer] = None,
+        summary_tokens: int = 256
+    ):
+        self.budget = budget
+        self.summarizer = summarizer
+        self.summary_tokens = summary_tokens
+        self.prompts = 0
+        self.prompt_tokens = 0
+        self.trimmed = 0
+        self.dropped_messages = 0
+
+    async def preload(self, models: List[str] = ()) -> None:
+        """Load the default encoding and those of `models` ahead of the first prompt."""
+        if tiktoken is None:
+            return
+        names = {_DEFAULT_ENCODING, *(n for n in map(_encoding_name, models) if n)}
+        await asyncio.gather(*(asyncio.to_thread(_load_encoding, name) for name in names))
+
+    async def fit(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        budget: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], PromptBudgetReport]:
+        """
+        Trim messages to the token budget.
+
+        Args:
+            model: Model the prompt is for (selects the tokenizer)
+            messages: Conversation in OpenAI format (not modified)
+            budget: Token budget; defaults to the budgeter's budget. None only counts.
+
+        Returns:
+            The messages to send and the token report
+
+        Raises:
+            PromptTooLarge: If the system messages and final message alone exceed the budget
+        """
+        budget = budget if budget is not None else self.budget
+        await load_tokenizer(model)
+        counts = [count_message_tokens(model, m) for m in messages]
+        original = _REPLY_PRIMING + sum(counts)
+        report = PromptBudgetReport(
+            model=model,
+            tokenizer=tokenizer_name(model),
+            original_tokens=original,
+            final_tokens=original,
+            budget=budget,
+        )
+        self.prompts += 1
+
+        if budget is None or original <= budget:
+            self.prompt_tokens += original
+            return messages, report
+
+        # Leave room for the summary note when turns are going to be summarized.
+        target = budget - (self.summary_tokens if self.summarizer is not None else 0)
+        total = original
+        dropped: List[int] = []
+        for group in _droppable_groups(messages):
+            if total <= target:
+                break
+            dropped.extend(group)
+            total -= sum(counts[i] for i in group)
+
+        dropped_set = set(dropped)
+        kept = [m for i, m in enumerate(messages) if i not in dropped_set]
+        if dropped and self.summarizer is not None:
+            try:
+                summary = await self.summarizer([messages[i] for i in dropped])
+                note = {"role": "system", "content": f"Summary of the earlier conversation: {summary}"}
+                note_tokens = count_message_tokens(model, note)
+                if total + note_tokens <= budget:
+                    position = next((i for i, m in enumerate(kept) if m.get("role") != "system"), len(kept))
+                    kept.insert(position, note)
+                    total += note_tokens
+                    report.summarized = True
+            except Exception as e:
+                logger.warning(f"Prompt summarization failed, dropping turns instead: {e}")
+
+        if total > budget:
+            raise PromptTooLarge(f"Prompt needs {total} tokens after trimming; budget is {budget}")
+
+        report.final_tokens = total
+        report.dropped_messages = len(dropped)
+        self.prompt_tokens += total
+        self.trimmed += 1
+        self.dropped_messages += len(dropped)
+        return kept, report
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "prompts": self.prompts,
+            "prompt_tokens": self.prompt_tokens,
+            "avg_prompt_tokens": self.prompt_tokens / self.prompts if self.prompts else 0.0,
+            "trimmed": self.trimmed,
+            "dropped_messages": self.dropped_messages,
+        }
@@ -0,0 +1,276 @@
+"""
+Semantic Cache for Chat Completions
+
+Serves a stored completion when a new prompt is close enough (by cosine
+similarity of prompt embeddings) to one answered before. Entries live in an
+in-process NumPy index, one per namespace (the chat model plus a hash of
+the rest of the prompt context), so answers are never shared across models,
+system prompts or sampling parameters.
+
+Each namespace index is a fixed-capacity ring of L2-normalised float32
+vectors: once full, the oldest entry is overwritten. At most
+`max_namespaces` indexes and `max_total_entries` entries are kept across
+all of them; the least recently used namespaces are dropped to make room.
+Lookups are a single matrix-vector product while the index is small; past
+`ivf_threshold` entries the index is partitioned with k-means (IVF) and
+only the `nprobe` closest partitions are scanned. k-means runs in a worker
+thread and the partitions are swapped in when it finishes, so training
+never stalls the event loop.
+"""
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+
+
+class _NamespaceIndex:
+    """Ring buffer of prompt vectors and their answers for one namespace."""
+
+    def __init__(self, dim: int, capacity: int):
+        self.dim = dim
+        self.capacity = capacity
+        # Start small: there can be many namespaces, most with few entries.
+        self.vectors = np.zeros((min(capacity, 64), dim), dtype=np.float32)
+        self.answers: List[Optional[str]] = []
+        self.created: List[float] = []
+        self.next_slot = 0
+        self.size = 0
+        # IVF state (only populated once the index is partitioned)
+        self.centroids: Optional[np.ndarray] = None
+        self.slot_list: Optional[np.ndarray] = None
+        self.lists: List[Set[int]] = []
+        self.trained_at = 0
+        self.training = False
+        self._written: Set[int] = set()  # slots written while training; reassigned on install
+
+    def add(self, vector: np.ndarray, answer: str, now: float) -> bool:
+        """Insert an entry; returns True when an older entry was evicted."""
+        slot = self.next_slot
+        self.next_slot = (slot + 1) % self.capacity
+        if slot >= self.vectors.shape[0]:
+            grown = np.zeros((min(self.capacity, self.vectors.shape[0] * 2), self.dim), dtype=np.float32)
+            grown[:self.vectors.shape[0]] = self.vectors
+            self.vectors = grown
+
+        evicted = slot < self.size
+        if evicted:
+            self.answers[slot] = answer
+            self.created[slot] = now
+        else:
+            self.answers.append(answer)
+            self.created.append(now)
+            self.size += 1
+        self.vectors[slot] = vector
+        if self.training:
+            self._written.add(slot)
+
+        if self.centroids is not None:
+            if evicted:
+                self.lists[self.slot_list[slot]].discard(slot)
+            target = int(np.argmax(self.centroids @ vector))
+            self.slot_list[slot] = target
+            self.lists[target].add(slot)
+        return evicted
+
+    def search(self, query: np.ndarray, nprobe: int) -> tuple:
+        """Return (slot, similarity) of the closest entry, or (-1, -1.0)."""
+        if self.size == 0:
+            return -1, -1.0
+        if self.centroids is None:
+            scores = self.vectors[:self.size] @ query
+            slot = int(np.argmax(scores))
+            return slot, float(scores[slot])
+
+        probe = np.argsort(self.centroids @ query)[-nprobe:]
+        candidates = [slot for p in probe for slot in self.lists[p]]
+        if not candidates:
+            return -1, -1.0
+        slots = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        scores = self.vectors[slots] @ query
+        best = int(np.argmax(scores))
+        return int(slots[best]), float(scores[best])
+
+    def train(self, nlist: int) -> None:
+        """Partition the current entries with spherical k-means (blocking)."""
+        self.install(*_kmeans(self.vectors[:self.size], nlist), trained_at=self.size)
+
+    def snapshot(self) -> np.ndarray:
+        """Copy the current entries for training off the event loop; marks the index as training."""
+        self.training = True
+        self._written.clear()
+        return self.vectors[:self.size].copy()
+
+    def install(self, centroids: np.ndarray, assign: np.ndarray, trained_at: int) -> None:
+        """Swap in partitions trained on a snapshot, reassigning slots written since it was taken."""
+        self.centroids = centroids
+        self.slot_list = np.full(self.capacity, -1, dtype=np.int64)
+        self.slot_list[:len(assign)] = assign
+        for slot in self._written:
+            self.slot_list[slot] = int(np.argmax(centroids @ self.vectors[slot]))
+        self.lists = [set() for _ in range(len(centroids))]
+        for slot, target in enumerate(self.slot_list[:self.size].tolist()):
+            self.lists[target].add(slot)
+        self.trained_at = trained_at
+        self.training = False
+        self._written.clear()
+
+
+def _kmeans(data: np.ndarray, nlist: int, iterations: int = 10, sample: int = 65536) -> tuple:
+    """Spherical k-means over `data`; returns (centroids, partition of each row)."""
+    size = len(data)
+    rng = np.random.default_rng(0)
+    nlist = max(1, min(nlist, size))
+    picked = data[rng.choice(size, size=min(sample, size), replace=False)]
+    centroids = picked[rng.choice(len(picked), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(picked @ centroids.T, axis=1)
+        for c in range(nlist):
+            members = picked[assign == c]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[c] = centroid / (np.linalg.norm(centroid) or 1.0)
+
+    assign = np.empty(size, dtype=np.int64)
+    for start in range(0, size, 65536):
+        block = data[start:start + 65536]
+        assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return centroids, assign
+
+
+class SemanticCache:
+    """Cosine-similarity cache of chat completions, namespaced per model and prompt context."""
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        max_entries: int = 10000,
+        ttl: float = 3600.0,
+        ivf_threshold: int = 100000,
+        nprobe: int = 8,
+        max_namespaces: int = 1024,
+        max_total_entries: int = 1000000,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.max_namespaces = max_namespaces
+        self.max_total_entries = max_total_entries
+        self.entries = 0  # across all namespaces
+        self._training: Set[asyncio.Task] = set()
+        self._indexes: "OrderedDict[str, _NamespaceIndex]" = OrderedDict()  # least recently used first
+        # Per-namespace counters live as long as the namespace's index; totals are kept for good.
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._totals = {"hits": 0, "misses": 0, "inserts": 0, "evictions": 0, "dropped_namespaces": 0}
+
+    def _count(self, namespace: str, name: str) -> None:
+        self._totals[name] += 1
+        counters = self._stats.get(namespace)
+        if counters is not None:
+            counters[name] += 1
+
+    @staticmethod
+    def _normalise(vector: Any) -> Optional[np.ndarray]:
+        array = np.asarray(vector, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(array))
+        return array / norm if norm else None
+
+    def lookup(self, namespace: str, vector: Any) -> Optional[Dict[str, Any]]:
+        """
+        Find a stored answer for a prompt embedding.
+
+        Args:
+            namespace: Cache namespace (the model and the rest of the prompt context)
+            vector: Embedding of the prompt
+
+        Returns:
+            A copy of the stored response when the best match is at or above
+            the similarity threshold and not expired, otherwise None
+        """
+        index = self._indexes.get(namespace)
+        query = self._normalise(vector)
+        if index is None or query is None or query.shape[0] != index.dim:
+            self._count(namespace, "misses")
+            return None
+        self._indexes.move_to_end(namespace)
+        slot, score = index.search(query, self.nprobe)
+        if slot < 0 or score < self.threshold or index.created[slot] + self.ttl < time.monotonic():
+            self._count(namespace, "misses")
+            return None
+        self._count(namespace, "hits")
+        return json.loads(index.answers[slot])
+
+    def add(self, namespace: str, vector: Any, response: Dict[str, Any]) -> None:
+        """Remember the response for a prompt embedding."""
+        query = self._normalise(vector)
+        if query is None:
+            return
+        index = self._indexes.get(namespace)
+        if index is None or index.dim != query.shape[0]:
+            if index is not None:
+                self.entries -= index.size
+            index = self._indexes[namespace] = _NamespaceIndex(query.shape[0], self.max_entries)
+            self._stats[namespace] = {"hits": 0, "misses": 0, "inserts": 0, "evictions": 0}
+        self._indexes.move_to_end(namespace)
+        if index.add(query, json.dumps(response, separators=(",", ":")), time.monotonic()):
+            self._count(namespace, "evictions")
+        else:
+            self.entries += 1
+        self._count(namespace, "inserts")
+        while len(self._indexes) > 1 and (
+            len(self._indexes) > self.max_namespaces or self.entries > self.max_total_entries
+        ):
+            self._drop_oldest()
+
+        if index.size >= self.ivf_threshold and index.size >= 2 * index.trained_at and not index.training:
+            self._train(index, nlist=int(np.sqrt(index.size)))
+
+    def _drop_oldest(self) -> None:
+        dropped, index = self._indexes.popitem(last=False)
+        self.entries -= index.size
+        self._stats.pop(dropped, None)
+        self._totals["dropped_namespaces"] += 1
+
+    def _train(self, index: _NamespaceIndex, nlist: int) -> None:
+        """Partition the index in a worker thread; inline when there is no event loop."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            index.train(nlist)
+            return
+        task = loop.create_task(self._train_off_loop(index, index.snapshot(), nlist))
+        self._training.add(task)
+        task.add_done_callback(self._training.discard)
+
+    @staticmethod
+    async def _train_off_loop(index: _NamespaceIndex, data: np.ndarray, nlist: int) -> None:
+        try:
+            centroids, assign = await asyncio.to_thread(_kmeans, data, nlist)
+        except BaseException:
+            index.training = False
+            raise
+        index.install(centroids, assign, trained_at=len(data))
+
+    def stats(self) -> Dict[str, Any]:
+        namespaces = {}
+        for namespace, counters in self._stats.items():
+            index = self._indexes.get(namespace)
+            lookups = counters["hits"] + counters["misses"]
+            namespaces[namespace] = {
+                **counters,
+                "entries": index.size if index else 0,
+                "partitioned": bool(index is not None and index.centroids is not None),
+                "hit_rate": counters["hits"] / lookups if lookups else 0.0,
+            }
+        hits, misses = self._totals["hits"], self._totals["misses"]
+        return {
+            **self._totals,
+            "entries": self.entries,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "namespaces": namespaces,
+        }
@@ -0,0 +1,231 @@
+"""Warm Pool of Pre-Provisioned E2B Sandboxes
+
+Provisioning a sandbox (a desktop, a working directory) is the slow part
+of creating a session. `SessionPool` keeps sandboxes provisioned ahead of
+time, so `POST /e2b/session` only has to activate one, which registers the
+session and starts its TTL:
+
+  - at least `min_size` idle sandboxes are kept ready; a background task
+    tops the pool up after every hand-out, a few at a time
+  - every miss (an empty pool, so a cold start) raises the target by one,
+    up to `max_size`, so the pool grows with bursty demand
+  - sandboxes idle for longer than `idle_ttl` are released; above
+    `min_size` they are not replaced, so the pool shrinks back once demand
+    drops, and those at `min_size` are replaced with fresh ones
+
+Pooled sandboxes are not sessions yet: they are not in the session store,
+do not expire, and are not listed. Each worker process keeps its own pool.
+
+Configured with E2B_POOL_MIN, E2B_POOL_MAX (0 disables the pool),
+E2B_POOL_IDLE_TTL and E2B_POOL_REFILL_CONCURRENCY.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Set, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from .e2b_local import SandboxBackend
+
+logger = logging.getLogger(__name__)
+
+_STARTUP_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+POOL_ACQUIRES = Counter(
+    "e2b_pool_acquires_total",
+    "Sessions handed out by the warm pool, by outcome (hit: pre-provisioned, miss: cold start).",
+    ["outcome"],
+)
+COLD_START_LATENCY = Histogram(
+    "e2b_pool_cold_start_seconds",
+    "Time to create a session when the warm pool was empty.",
+    buckets=_STARTUP_BUCKETS,
+)
+PROVISION_LATENCY = Histogram(
+    "e2b_pool_provision_seconds",
+    "Time to provision a sandbox in the background.",
+    buckets=_STARTUP_BUCKETS,
+)
+POOL_IDLE = Gauge(
+    "e2b_pool_idle_sandboxes",
+    "Provisioned sandboxes waiting in the warm pool.",
+    multiprocess_mode="livesum",
+)
+POOL_RECYCLED = Counter(
+    "e2b_pool_recycled_total",
+    "Pooled sandboxes released after sitting idle too long.",
+)
+
+
+class SessionPool:
+    """Pre-provisioned sandboxes handed out as new sessions."""
+
+    def __init__(
+        self,
+        backend: SandboxBackend,
+        min_size: int = 2,
+        max_size: Optional[int] = None,
+        idle_ttl: float = 600.0,
+        refill_concurrency: int = 4,
+        interval: float = 5.0,
+    ):
+        """
+        Args:
+            backend: Backend that provisions, activates and releases sandboxes
+            min_size: Idle sandboxes always kept ready
+            max_size: Idle sandboxes the pool may grow to under demand
+            idle_ttl: Seconds a pooled sandbox may wait before it is recycled
+            refill_concurrency: Sandboxes provisioned at the same time
+            interval: Seconds between background checks when nothing happens
+        """
+        self.backend = backend
+        self.min_size = min_size
+        self.max_size = max(max_size if max_size is not None else min_size, min_size)
+        self.idle_ttl = idle_ttl
+        self.refill_concurrency = refill_concurrency
+        self.interval = interval
+        self._idle: Deque[Tuple[str, float]] = deque()  # (session id, provisioned at), oldest first
+        self._target = min_size
+        self._provisioning: Set["asyncio.Task[None]"] = set()
+        self._releasing: Set["asyncio.Task[None]"] = set()
+        self._wake = asyncio.Event()
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._closed = False
+        self._stats = {"hits": 0, "misses": 0, "provisioned": 0, "recycled": 0, "failed": 0}
+        self._cold_start_total = 0.0
+
+    async def acquire(self, user_id: Optional[str] = None) -> Dict[str, Any]:
+        """A new session, on a pooled sandbox if one is ready, else cold-started."""
+        if self._idle:
+            session_id, _ = self._idle.popleft()
+            POOL_IDLE.set(len(self._idle))
+            self._stats["hits"] += 1
+            POOL_ACQUIRES.labels("hit").inc()
+            self._wake.set()
+            # The sandbox has left the pool: free it if no session ends up owning it.
+            try:
+                return await self.backend.activate(session_id, user_id)
+            except asyncio.CancelledError:
+                self._track(self._releasing, self.backend.release(session_id))
+                raise
+            except Exception:
+                await self.backend.release(session_id)
+                raise
+
+        self._stats["misses"] += 1
+        POOL_ACQUIRES.labels("miss").inc()
+        self._target = min(self.max_size, self._target + 1)
+        self._wake.set()
+        started = time.monotonic()
+        sess = await self.backend.create_session(user_id)
+        elapsed = time.monotonic() - started
+        self._cold_start_total += elapsed
+        COLD_START_LATENCY.observe(elapsed)
+        return sess
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Stop replenishing and release every pooled sandbox."""
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # Let in-flight provisions finish so their sandboxes are released below rather than leaked.
+        if self._provisioning:
+            _, pending = await asyncio.wait(set(self._provisioning), timeout=timeout)
+            for task in pending:
+                task.cancel()
+        await asyncio.gather(*self._provisioning, *self._releasing, return_exceptions=True)
+        idle = [session_id for session_id, _ in self._idle]
+        self._idle.clear()
+        POOL_IDLE.set(0)
+        await asyncio.gather(*(self.backend.release(session_id) for session_id in idle), return_exceptions=True)
+
+    async def _run(self) -> None:
+        while not self._closed:
+            self._wake.clear()
+            try:
+                self._recycle()
+                self._refill()
+            except Exception as e:
+                logger.warning(f"e2b session pool maintenance failed: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _recycle(self) -> None:
+        cutoff = time.monotonic() - self.idle_ttl
+        while self._idle and self._idle[0][1] < cutoff:
+            session_id, _ = self._idle.popleft()
+            self._stats["recycled"] += 1
+            POOL_RECYCLED.inc()
+            if self._target > self.min_size:
+                self._target -= 1  # demand dropped: shrink back instead of replacing it
+            self._track(self._releasing, self.backend.release(session_id))
+        POOL_IDLE.set(len(self._idle))
+
+    def _refill(self) -> None:
+        missing = self._target - len(self._idle) - len(self._provisioning)
+        for _ in range(min(missing, self.refill_concurrency - len(self._provisioning))):
+            self._track(self._provisioning, self._provision())
+
+    def _track(self, tasks: Set["asyncio.Task[None]"], coro) -> None:
+        task = asyncio.ensure_future(coro)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    async def _provision(self) -> None:
+        started = time.monotonic()
+        try:
+            session_id = await self.backend.provision()
+        except Exception as e:
+            # Not retried until the next tick, so a failing backend is not hammered.
+            self._stats["failed"] += 1
+            logger.warning(f"Provisioning a pooled e2b sandbox failed: {e}")
+            return
+        if self._closed:
+            await self.backend.release(session_id)
+            return
+        PROVISION_LATENCY.observe(time.monotonic() - started)
+        self._stats["provisioned"] += 1
+        self._idle.append((session_id, time.monotonic()))
+        POOL_IDLE.set(len(self._idle))
+        self._wake.set()
+
+    def stats(self) -> Dict[str, Any]:
+        hits, misses = self._stats["hits"], self._stats["misses"]
+        return {
+            "idle": len(self._idle),
+            "provisioning": len(self._provisioning),
+            "target": self._target,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            **self._stats,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "avg_cold_start_ms": round(self._cold_start_total / misses * 1000, 3) if misses else 0.0,
+        }
+
+
+def create_session_pool(backend: SandboxBackend) -> Optional[SessionPool]:
+    """The pool configured by E2B_POOL_*, or None when it is disabled."""
+    min_size = int(os.getenv("E2B_POOL_MIN", "0"))
+    max_size = int(os.getenv("E2B_POOL_MAX", str(min_size)))
+    if max(min_size, max_size) <= 0:
+        return None
+    return SessionPool(
+        backend,
+        min_size=min_size,
+        max_size=max_size,
+        idle_ttl=float(os.getenv("E2B_POOL_IDLE_TTL", "600")),
+        refill_concurrency=int(os.getenv("E2B_POOL_REFILL_CONCURRENCY", "4")),
+    )
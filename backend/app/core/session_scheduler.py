@@ -0,0 +1,153 @@
+"""Fair Command Scheduling for E2B Sessions
+
+Commands and file writes of one session run strictly in submission order,
+one at a time; different sessions run in parallel up to a global
+concurrency cap. When more work is queued than the cap allows, free slots
+go round-robin across users (and, within a user, across that user's
+sessions), so one user with many queued commands or sessions cannot
+starve the others. Sessions without a user share one turn.
+
+    async with scheduler.slot(session_id, user_id) as timing:
+        ...  # run the command
+    timing.queued_ms, timing.run_ms
+
+A caller cancelled while queued gives up its place; the scheduler skips
+it when its turn comes.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Set
+
+
+class SlotTiming:
+    """How long a command waited for its turn and how long it held it."""
+
+    __slots__ = ("enqueued", "started", "ended")
+
+    def __init__(self):
+        self.enqueued = time.monotonic()
+        self.started: Optional[float] = None
+        self.ended: Optional[float] = None
+
+    @property
+    def queued_ms(self) -> float:
+        return round(((self.started or time.monotonic()) - self.enqueued) * 1000, 3)
+
+    @property
+    def run_ms(self) -> float:
+        if self.started is None:
+            return 0.0
+        return round(((self.ended or time.monotonic()) - self.started) * 1000, 3)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {"queued_ms": self.queued_ms, "run_ms": self.run_ms}
+
+
+class _Waiter:
+    __slots__ = ("session_id", "user_id", "future", "timing")
+
+    def __init__(self, session_id: str, user_id: Optional[str]):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.future: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        self.timing = SlotTiming()
+
+
+class SessionScheduler:
+    """Per-session FIFO queues with a global concurrency cap and round-robin across users."""
+
+    def __init__(self, max_concurrency: int = 8):
+        self.max_concurrency = max_concurrency
+        self._queues: Dict[str, Deque[_Waiter]] = {}
+        self._busy: Set[str] = set()  # sessions with a command running
+        # user -> that user's sessions that have queued work and nothing running, in turn order
+        self._ready: "OrderedDict[Optional[str], Deque[str]]" = OrderedDict()
+        self._running = 0
+        self._queued = 0
+        self._stats = {"completed": 0, "abandoned": 0, "queued_ms_total": 0.0, "run_ms_total": 0.0}
+
+    @asynccontextmanager
+    async def slot(self, session_id: str, user_id: Optional[str] = None) -> AsyncIterator[SlotTiming]:
+        """Wait for this session's next turn; the body runs while holding it."""
+        waiter = _Waiter(session_id, user_id)
+        queue = self._queues.get(session_id)
+        if queue is None:
+            queue = self._queues[session_id] = deque()
+        queue.append(waiter)
+        self._queued += 1
+        if len(queue) == 1 and session_id not in self._busy:
+            self._mark_ready(session_id, user_id)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(waiter)  # granted just as the caller was cancelled
+            else:
+                self._queued -= 1  # skipped when its turn comes
+                self._stats["abandoned"] += 1
+            raise
+        try:
+            yield waiter.timing
+        finally:
+            self._release(waiter)
+
+    def _mark_ready(self, session_id: str, user_id: Optional[str]) -> None:
+        sessions = self._ready.get(user_id)
+        if sessions is None:
+            sessions = self._ready[user_id] = deque()  # a newly waiting user goes last
+        sessions.append(session_id)
+
+    def _dispatch(self) -> None:
+        while self._running < self.max_concurrency and self._ready:
+            user_id, sessions = self._ready.popitem(last=False)
+            session_id = sessions.popleft()
+            if sessions:
+                self._ready[user_id] = sessions  # the user's other sessions wait for the next round
+            waiter = self._next_waiter(session_id)
+            if waiter is None:
+                continue
+            self._busy.add(session_id)
+            self._running += 1
+            waiter.timing.started = time.monotonic()
+            waiter.future.set_result(None)
+
+    def _next_waiter(self, session_id: str) -> Optional[_Waiter]:
+        queue = self._queues.get(session_id)
+        while queue:
+            waiter = queue.popleft()
+            if not waiter.future.cancelled():
+                self._queued -= 1
+                if not queue:
+                    del self._queues[session_id]
+                return waiter
+        self._queues.pop(session_id, None)
+        return None
+
+    def _release(self, waiter: _Waiter) -> None:
+        waiter.timing.ended = time.monotonic()
+        self._busy.discard(waiter.session_id)
+        self._running -= 1
+        self._stats["completed"] += 1
+        self._stats["queued_ms_total"] += waiter.timing.queued_ms
+        self._stats["run_ms_total"] += waiter.timing.run_ms
+        if waiter.session_id in self._queues:
+            self._mark_ready(waiter.session_id, waiter.user_id)
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        completed = self._stats["completed"]
+        return {
+            "max_concurrency": self.max_concurrency,
+            "running": self._running,
+            "queued": self._queued,
+            "waiting_users": len(self._ready),
+            "completed": completed,
+            "abandoned": self._stats["abandoned"],
+            "avg_queued_ms": round(self._stats["queued_ms_total"] / completed, 3) if completed else 0.0,
+            "avg_run_ms": round(self._stats["run_ms_total"] / completed, 3) if completed else 0.0,
+        }
@@ -0,0 +1,617 @@
+"""Session Store Backends for the E2B Session Layer
+
+`e2b_stub` keeps its sessions behind the small `SessionStore` interface, so
+the backend can run with several uvicorn workers (or several nodes) sharing
+one store:
+  - MemorySessionStore: a process-local dict of compact `SessionRecord`s
+    (single worker only)
+  - RedisSessionStore: one Redis hash per session plus a capped command
+    list, written and read with pipelines
+
+Store methods are coroutines: the Redis store uses the asyncio client, so
+no store call blocks the event loop (the memory store never suspends).
+
+Command logs keep a bounded ring of recent entries; older entries spill to
+compressed logs (see command_log.py), on disk for the memory store and in
+Redis for the Redis store, and are read back by cursor.
+
+Sessions are listed in creation order and paged by cursor through
+secondary indexes by user and by status, so listing one user's sessions
+never scans the whole table. Listing "expired" sessions also walks the
+"active" index, since sessions past their TTL keep that status until they
+are next read.
+
+Every session carries an eviction time. `due()` hands out sessions whose
+time has passed, in O(log n) per session: a min-heap in memory, a sorted
+set in Redis.
+
+The store is chosen with E2B_SESSION_STORE=memory|redis; the Redis store
+connects to E2B_REDIS_URL (falling back to REDIS_URL).
+"""
+from __future__ import annotations
+
+import heapq
+import json
+import os
+import sys
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .command_log import DEFAULT_RING_SIZE, DEFAULT_SPILL_DIR, CommandLog, RedisSpillLog, page_range, paginate
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover - redis is optional
+    aioredis = None
+
+
+class SessionStore(ABC):
+    """Storage contract for E2B session records and their command logs."""
+
+    @abstractmethod
+    async def put(self, session: Dict[str, Any], evict_at: float) -> None:
+        """Insert or replace a session record, evicted at `evict_at`."""
+
+    @abstractmethod
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """The session record (with `command_count`), or None."""
+
+    @abstractmethod
+    async def update(self, session_id: str, fields: Dict[str, Any], evict_at: Optional[float] = None) -> None:
+        """Set some fields of an existing session, optionally moving its eviction time."""
+
+    @abstractmethod
+    async def append_command(self, session_id: str, entry: Dict[str, Any]) -> int:
+        """Append an entry to the session's command log; returns its sequence number."""
+
+    @abstractmethod
+    async def command_page(
+        self, session_id: str, cursor: Optional[int] = None, limit: int = 50, descending: bool = False
+    ) -> Dict[str, Any]:
+        """One page of the session's command log (see `command_log.paginate`)."""
+
+    @abstractmethod
+    def sessions(self) -> AsyncIterator[Dict[str, Any]]:
+        """All session records (an async iterator)."""
+
+    @abstractmethod
+    async def page(
+        self,
+        cursor: Optional[int] = None,
+        limit: int = 100,
+        user_id: Optional[str] = None,
+        status: Optional[str] = None,
+        now: Optional[float] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        Sessions in creation order, after `cursor`, optionally filtered.
+
+        With `now`, sessions still stored as "active" but past `expires_at`
+        match status "expired" rather than "active" (expiry is only written
+        back lazily, so the status indexes alone would miss them).
+
+        Returns:
+            Up to `limit` session records and the cursor of the next page (None on the last)
+        """
+
+    @abstractmethod
+    async def count(self) -> int:
+        """Number of stored sessions."""
+
+    @abstractmethod
+    async def due(self, now: float, limit: int = 1000) -> List[str]:
+        """Claim up to `limit` sessions whose eviction time has passed."""
+
+    @abstractmethod
+    async def delete(self, session_ids: Iterable[str]) -> None:
+        """Remove sessions and their command logs."""
+
+
+DESKTOP_URL_TEMPLATE = "wss://pending-e2b-endpoint/session/{session_id}"  # placeholder
+
+
+def _status_filter(status: Optional[str], now: Optional[float]) -> Tuple[List[str], Any]:
+    """Status indexes to walk for a listing, and the predicate on (status, expires_at) they must pass."""
+    if status is None:
+        return [], lambda current, expires_at: True
+    if now is None:
+        return [status], lambda current, expires_at: current == status
+    if status == "expired":
+        return ["expired", "active"], lambda current, expires_at: (
+            current == "expired" or (current == "active" and expires_at < now)
+        )
+    if status == "active":
+        return ["active"], lambda current, expires_at: current == "active" and expires_at >= now
+    return [status], lambda current, expires_at: current == status
+
+
+class SessionRecord:
+    """
+    Compact in-memory session: slots instead of a dict, interned status and user id.
+
+    `desktop_url` is derived from the id, and `seq`/`evict_at` are store
+    bookkeeping; `to_dict()` builds the API representation.
+    """
+
+    __slots__ = ("session_id", "user_id", "created_at", "expires_at", "status", "closed_at", "seq", "evict_at")
+
+    def __init__(
+        self,
+        session_id: str,
+        user_id: Optional[str],
+        created_at: float,
+        expires_at: float,
+        status: str = "active",
+        closed_at: Optional[float] = None,
+    ):
+        self.session_id = session_id
+        self.user_id = sys.intern(user_id) if user_id is not None else None
+        self.created_at = created_at
+        self.expires_at = expires_at
+        self.status = sys.intern(status)
+        self.closed_at = closed_at
+        self.seq = 0
+        self.evict_at: Optional[float] = None
+
+    @classmethod
+    def from_dict(cls, session: Dict[str, Any]) -> "SessionRecord":
+        return cls(
+            session["session_id"],
+            session.get("user_id"),
+            session["created_at"],
+            session["expires_at"],
+            session.get("status", "active"),
+            session.get("closed_at"),
+        )
+
+    def set(self, fields: Dict[str, Any]) -> None:
+        for name, value in fields.items():
+            if name in ("status", "user_id") and value is not None:
+                value = sys.intern(value)
+            setattr(self, name, value)
+
+    def to_dict(self, command_count: int = 0) -> Dict[str, Any]:
+        data = {
+            "session_id": self.session_id,
+            "user_id": self.user_id,
+            "desktop_url": DESKTOP_URL_TEMPLATE.format(session_id=self.session_id),
+            "created_at": self.created_at,
+            "expires_at": self.expires_at,
+            "status": self.status,
+            "command_count": command_count,
+        }
+        if self.closed_at is not None:
+            data["closed_at"] = self.closed_at
+        return data
+
+
+class _OrderedIndex:
+    """Creation seqs of a set of sessions in ascending order; removals are lazy and compacted in bulk."""
+
+    __slots__ = ("order", "members")
+
+    def __init__(self):
+        self.order: List[int] = []
+        self.members: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def add(self, seq: int, session_id: str) -> None:
+        if seq in self.members:
+            return
+        self.members[seq] = session_id
+        if not self.order or seq > self.order[-1]:
+            self.order.append(seq)
+            return
+        i = bisect_left(self.order, seq)
+        if i == len(self.order) or self.order[i] != seq:  # else: a lazily removed entry comes back
+            self.order.insert(i, seq)
+
+    def discard(self, seq: int) -> None:
+        if self.members.pop(seq, None) is not None and len(self.order) > max(64, 2 * len(self.members)):
+            self.order = [s for s in self.order if s in self.members]
+
+    def after(self, cursor: Optional[int]) -> Iterator[Tuple[int, str]]:
+        order, members = self.order, self.members
+        i = bisect_right(order, cursor) if cursor is not None else 0
+        while i < len(order):
+            session_id = members.get(order[i])
+            if session_id is not None:
+                yield order[i], session_id
+            i += 1
+
+
+class MemorySessionStore(SessionStore):
+    """Process-local store of `SessionRecord`s; sessions are not shared between workers."""
+
+    def __init__(self, ring_size: int = DEFAULT_RING_SIZE, spill_dir: str = DEFAULT_SPILL_DIR):
+        self.ring_size = ring_size
+        self.spill_dir = spill_dir
+        self._sessions: Dict[str, SessionRecord] = {}
+        self._commands: Dict[str, CommandLog] = {}  # only sessions that ran commands
+        self._heap: List[Tuple[float, str]] = []
+        self._seq = 0
+        self._all = _OrderedIndex()
+        self._by_user: Dict[str, _OrderedIndex] = {}
+        self._by_status: Dict[str, _OrderedIndex] = {}
+
+    def _schedule(self, record: SessionRecord, at: float) -> None:
+        # Later times are not pushed: `due()` re-queues an entry that turns out early.
+        previous = record.evict_at
+        record.evict_at = at
+        if previous is None or at < previous:
+            heapq.heappush(self._heap, (at, record.session_id))
+
+    def _index(self, indexes: Dict[str, _OrderedIndex], value: Any, record: SessionRecord, add: bool) -> None:
+        if value is None:
+            return  # e.g. anonymous sessions are not indexed by user
+        index = indexes.get(value)
+        if add:
+            if index is None:
+                index = indexes[value] = _OrderedIndex()
+            index.add(record.seq, record.session_id)
+        elif index is not None:
+            index.discard(record.seq)
+            if not index:
+                del indexes[value]
+
+    def _reindex(self, record: SessionRecord, add: bool) -> None:
+        self._index(self._by_user, record.user_id, record, add)
+        self._index(self._by_status, record.status, record, add)
+
+    def _command_count(self, session_id: str) -> int:
+        log = self._commands.get(session_id)
+        return log.count if log is not None else 0
+
+    async def put(self, session: Dict[str, Any], evict_at: float) -> None:
+        record = SessionRecord.from_dict(session)
+        previous = self._sessions.get(record.session_id)
+        if previous is not None:
+            self._reindex(previous, add=False)
+            record.seq, record.evict_at = previous.seq, previous.evict_at
+        else:
+            self._seq += 1
+            record.seq = self._seq
+            self._all.add(record.seq, record.session_id)
+        self._sessions[record.session_id] = record
+        self._reindex(record, add=True)
+        self._schedule(record, evict_at)
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        record = self._sessions.get(session_id)
+        if record is None:
+            return None
+        return record.to_dict(self._command_count(session_id))
+
+    async def update(self, session_id: str, fields: Dict[str, Any], evict_at: Optional[float] = None) -> None:
+        record = self._sessions[session_id]
+        reindex = "status" in fields or "user_id" in fields
+        if reindex:
+            self._reindex(record, add=False)
+        record.set(fields)
+        if reindex:
+            self._reindex(record, add=True)
+        if evict_at is not None:
+            self._schedule(record, evict_at)
+
+    async def append_command(self, session_id: str, entry: Dict[str, Any]) -> int:
+        log = self._commands.get(session_id)
+        if log is None:
+            if session_id not in self._sessions:
+                raise KeyError(session_id)
+            log = self._commands[session_id] = CommandLog(session_id, self.ring_size, self.spill_dir)
+        return log.append(entry)
+
+    async def command_page(
+        self, session_id: str, cursor: Optional[int] = None, limit: int = 50, descending: bool = False
+    ) -> Dict[str, Any]:
+        log = self._commands.get(session_id)
+        if log is None:
+            return paginate(lambda lo, hi: [], 0, cursor, limit, descending)
+        return paginate(log.read, log.count, cursor, limit, descending)
+
+    async def sessions(self) -> AsyncIterator[Dict[str, Any]]:
+        for session_id, record in self._sessions.items():
+            yield record.to_dict(self._command_count(session_id))
+
+    async def page(
+        self,
+        cursor: Optional[int] = None,
+        limit: int = 100,
+        user_id: Optional[str] = None,
+        status: Optional[str] = None,
+        now: Optional[float] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        statuses, matches = _status_filter(status, now)
+        if user_id is not None:
+            indexes = [self._by_user.get(user_id)]
+        elif statuses:
+            indexes = [self._by_status.get(name) for name in statuses]
+        else:
+            indexes = [self._all]
+        indexes = [index for index in indexes if index is not None]
+        items: List[Dict[str, Any]] = []
+        last_seq = None
+        for seq, session_id in heapq.merge(*(index.after(cursor) for index in indexes)):
+            record = self._sessions[session_id]
+            if not matches(record.status, record.expires_at):
+                continue
+            if len(items) == limit:
+                return items, last_seq
+            items.append(record.to_dict(self._command_count(session_id)))
+            last_seq = seq
+        return items, None
+
+    async def count(self) -> int:
+        return len(self._sessions)
+
+    async def due(self, now: float, limit: int = 1000) -> List[str]:
+        claimed: List[str] = []
+        heap = self._heap
+        while heap and heap[0][0] <= now and len(claimed) < limit:
+            at, session_id = heapq.heappop(heap)
+            record = self._sessions.get(session_id)
+            current = record.evict_at if record is not None else None
+            if current is None or current < at:
+                continue  # already claimed or deleted, or superseded by an earlier entry
+            if current > at:
+                heapq.heappush(heap, (current, session_id))  # extended since it was queued
+                continue
+            record.evict_at = None
+            claimed.append(session_id)
+        return claimed
+
+    async def delete(self, session_ids: Iterable[str]) -> None:
+        for session_id in session_ids:
+            record = self._sessions.pop(session_id, None)
+            if record is not None:
+                self._reindex(record, add=False)
+                self._all.discard(record.seq)
+            log = self._commands.pop(session_id, None)
+            if log is not None:
+                log.spill.remove()
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Redis-backed store shared by all workers.
+
+    Layout (with the default prefix):
+      cua:e2b:session:<id>           hash of JSON-encoded session fields
+      cua:e2b:session:<id>:commands  list of the most recent JSON-encoded command entries
+      cua:e2b:session:<id>:spill     sorted set of older command entries, compressed (see RedisSpillLog)
+      cua:e2b:sessions               sorted set of all session ids by creation seq
+      cua:e2b:user:<user_id>         sorted set of the user's session ids by creation seq
+      cua:e2b:status:<status>        sorted set of session ids with that status, by creation seq
+      cua:e2b:expiry                 sorted set of session ids by eviction time
+      cua:e2b:seq                    creation seq counter
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        prefix: str = "cua:e2b:",
+        client: Any = None,
+        ring_size: int = DEFAULT_RING_SIZE,
+    ):
+        if client is None:
+            if aioredis is None:
+                raise RuntimeError("redis package is required for the Redis session store")
+            client = aioredis.from_url(url or "redis://localhost:6379", decode_responses=True)
+        self.redis = client
+        self.prefix = prefix
+        self.ring_size = ring_size
+        self._index = f"{prefix}sessions"
+        self._expiry = f"{prefix}expiry"
+        self._seq = f"{prefix}seq"
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.prefix}session:{session_id}"
+
+    @staticmethod
+    def _encode(fields: Dict[str, Any]) -> Dict[str, str]:
+        return {k: json.dumps(v) for k, v in fields.items()}
+
+    @staticmethod
+    def _decode(raw: Dict[str, str]) -> Dict[str, Any]:
+        return {k: json.loads(v) for k, v in raw.items()}
+
+    def _index_keys(self, user_id: Any, status: Any) -> List[str]:
+        keys = []
+        if isinstance(user_id, str):
+            keys.append(f"{self.prefix}user:{user_id}")
+        if isinstance(status, str):
+            keys.append(f"{self.prefix}status:{status}")
+        return keys
+
+    async def put(self, session: Dict[str, Any], evict_at: float) -> None:
+        session_id = session["session_id"]
+        key = self._key(session_id)
+        seq = await self.redis.incr(self._seq)
+        pipe = self.redis.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, mapping=self._encode(session))
+        for index in [self._index] + self._index_keys(session.get("user_id"), session.get("status")):
+            pipe.zadd(index, {session_id: seq})
+        pipe.zadd(self._expiry, {session_id: evict_at})
+        await pipe.execute()
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        raw = await self.redis.hgetall(self._key(session_id))
+        return self._decode(raw) if raw else None
+
+    async def update(self, session_id: str, fields: Dict[str, Any], evict_at: Optional[float] = None) -> None:
+        key = self._key(session_id)
+
+        # WATCH the hash so a session evicted by another worker is never recreated as an orphan.
+        async def apply(pipe: Any) -> None:
+            if not await pipe.exists(key):
+                raise KeyError(session_id)
+            old_status = await pipe.hget(key, "status") if "status" in fields else None
+            seq = await pipe.zscore(self._index, session_id) if old_status is not None else None
+            pipe.multi()
+            pipe.hset(key, mapping=self._encode(fields))
+            if seq is not None and json.loads(old_status) != fields["status"]:
+                pipe.zrem(f"{self.prefix}status:{json.loads(old_status)}", session_id)
+                pipe.zadd(f"{self.prefix}status:{fields['status']}", {session_id: seq})
+            if evict_at is not None:
+                pipe.zadd(self._expiry, {session_id: evict_at}, xx=True)
+
+        await self.redis.transaction(apply, key)
+
+    async def append_command(self, session_id: str, entry: Dict[str, Any]) -> int:
+        key = self._key(session_id)
+        commands = f"{key}:commands"
+
+        # WATCH the hash: it also serialises concurrent appends, which bump its command_count.
+        # An overflowing ring is spilled in the same transaction, so no entry is ever in neither place.
+        async def apply(pipe: Any) -> int:
+            if not await pipe.exists(key):
+                raise KeyError(session_id)
+            seq = int(await pipe.hget(key, "command_count") or 0) + 1
+            spilled = []
+            if await pipe.llen(commands) >= self.ring_size:
+                spilled = await pipe.lrange(commands, 0, max(1, self.ring_size // 2) - 1)
+            pipe.multi()
+            pipe.hset(key, "command_count", seq)
+            pipe.rpush(commands, json.dumps({"seq": seq, **entry}))
+            if spilled:
+                member, first = RedisSpillLog.member(spilled)
+                pipe.ltrim(commands, len(spilled), -1)
+                pipe.zadd(f"{key}:spill", {member: first})
+            return seq
+
+        return await self.redis.transaction(apply, key, value_from_callable=True)
+
+    async def command_page(
+        self, session_id: str, cursor: Optional[int] = None, limit: int = 50, descending: bool = False
+    ) -> Dict[str, Any]:
+        key = self._key(session_id)
+        pipe = self.redis.pipeline()
+        pipe.hget(key, "command_count")
+        pipe.lrange(f"{key}:commands", 0, -1)
+        count, ring = await pipe.execute()
+        count = int(count or 0)
+        ring = [json.loads(e) for e in ring]
+        lo, hi, next_cursor = page_range(count, cursor, limit, descending)
+        items: List[Dict[str, Any]] = []
+        if lo <= hi:
+            ring_first = ring[0]["seq"] if ring else hi + 1
+            if lo < ring_first:
+                items = await RedisSpillLog(self.redis, f"{key}:spill").read(lo, min(hi, ring_first - 1))
+            items.extend(e for e in ring if lo <= e["seq"] <= hi)
+        return {"items": items[::-1] if descending else items, "next_cursor": next_cursor, "total": count}
+
+    async def sessions(self, batch_size: int = 500) -> AsyncIterator[Dict[str, Any]]:
+        batch: List[str] = []
+        async for session_id, _ in self.redis.zscan_iter(self._index, count=batch_size):
+            batch.append(session_id)
+            if len(batch) >= batch_size:
+                for session in await self._fetch(batch):
+                    yield session
+                batch = []
+        if batch:
+            for session in await self._fetch(batch):
+                yield session
+
+    async def _fetch(self, session_ids: List[str]) -> List[Dict[str, Any]]:
+        pipe = self.redis.pipeline()
+        for session_id in session_ids:
+            pipe.hgetall(self._key(session_id))
+        return [self._decode(raw) for raw in await pipe.execute() if raw]
+
+    async def page(
+        self,
+        cursor: Optional[int] = None,
+        limit: int = 100,
+        user_id: Optional[str] = None,
+        status: Optional[str] = None,
+        now: Optional[float] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        statuses, matches = _status_filter(status, now)
+        if user_id is not None:
+            indexes = [f"{self.prefix}user:{user_id}"]
+        elif statuses:
+            indexes = [f"{self.prefix}status:{name}" for name in statuses]
+        else:
+            indexes = [self._index]
+        # Filtering happens after the indexes, so a page may take several batches.
+        items: List[Dict[str, Any]] = []
+        seqs: List[int] = []
+        while True:
+            low = f"({cursor}" if cursor is not None else "-inf"
+            pipe = self.redis.pipeline()
+            for index in indexes:
+                pipe.zrangebyscore(index, low, "+inf", start=0, num=limit + 1, withscores=True)
+            batches = await pipe.execute()
+            # Past the end of a full batch, that index may hold entries not fetched yet.
+            bound = min((batch[-1][1] for batch in batches if len(batch) > limit), default=None)
+            batch = sorted(
+                (entry for entries in batches for entry in entries if bound is None or entry[1] <= bound),
+                key=lambda entry: entry[1],
+            )
+            if not batch:
+                return items, None
+            pipe = self.redis.pipeline()
+            for session_id, _ in batch:
+                pipe.hgetall(self._key(session_id))
+            for (session_id, seq), raw in zip(batch, await pipe.execute()):
+                if not raw:
+                    continue  # evicted between the two reads
+                session = self._decode(raw)
+                if not matches(session.get("status"), session.get("expires_at", 0)):
+                    continue
+                if len(items) == limit:
+                    return items, seqs[-1]
+                items.append(session)
+                seqs.append(int(seq))
+            if bound is None:
+                return items, None
+            cursor = int(bound)
+
+    async def count(self) -> int:
+        return await self.redis.zcard(self._index)
+
+    async def due(self, now: float, limit: int = 1000) -> List[str]:
+        candidates = await self.redis.zrangebyscore(self._expiry, "-inf", now, start=0, num=limit)
+        if not candidates:
+            return []
+        # ZREM is the claim: when several workers reap at once, each session goes to one of them.
+        pipe = self.redis.pipeline()
+        for session_id in candidates:
+            pipe.zrem(self._expiry, session_id)
+        return [sid for sid, removed in zip(candidates, await pipe.execute()) if removed]
+
+    async def delete(self, session_ids: Iterable[str]) -> None:
+        session_ids = list(session_ids)
+        if not session_ids:
+            return
+        pipe = self.redis.pipeline()
+        for session_id in session_ids:
+            pipe.hmget(self._key(session_id), "user_id", "status")
+        indexed = await pipe.execute()
+        pipe = self.redis.pipeline()
+        for session_id, (user_id, status) in zip(session_ids, indexed):
+            key = self._key(session_id)
+            pipe.delete(key, f"{key}:commands", f"{key}:spill")
+            for index in self._index_keys(
+                json.loads(user_id) if user_id else None, json.loads(status) if status else None
+            ):
+                pipe.zrem(index, session_id)
+        pipe.zrem(self._index, *session_ids)
+        pipe.zrem(self._expiry, *session_ids)
+        await pipe.execute()
+
+
+def create_session_store() -> SessionStore:
+    """Session store selected by E2B_SESSION_STORE (default: memory)."""
+    backend = os.getenv("E2B_SESSION_STORE", "memory").lower()
+    ring_size = int(os.getenv("E2B_COMMAND_LOG_RING", str(DEFAULT_RING_SIZE)))
+    if backend == "redis":
+        return RedisSessionStore(os.getenv("E2B_REDIS_URL") or os.getenv("REDIS_URL"), ring_size=ring_size)
+    if backend != "memory":
+        raise ValueError(f"Unknown E2B_SESSION_STORE {backend!r}; expected 'memory' or 'redis'")
+    spill_dir = os.getenv("E2B_COMMAND_LOG_DIR") or DEFAULT_SPILL_DIR
+    return MemorySessionStore(ring_size=ring_size, spill_dir=spill_dir)
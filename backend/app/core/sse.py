@@ -0,0 +1,189 @@
+"""
+Incremental Server-Sent Events Parser
+
+Bytes-level SSE parser for gateway streams. Network chunks are fed in as
+they arrive; complete events are returned as soon as their terminating
+blank line has been seen, regardless of how frames were split across
+chunks. Multi-line `data:` fields are joined with newlines as the SSE spec
+requires, and all three line endings (LF, CRLF, CR) are accepted.
+
+Events keep their raw bytes, so a proxy can forward them without decoding.
+`StreamAccumulator` folds decoded chat completion chunks into the final
+message for callers that want the whole answer as well as the stream.
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+try:
+    import orjson
+
+    loads = orjson.loads
+except ImportError:  # pragma: no cover - orjson is an optional speedup
+    loads = json.loads
+
+DONE = b"[DONE]"
+
+
+class SSEEvent:
+    """One dispatched event. `raw` is the normalised wire frame, ending in a blank line."""
+
+    __slots__ = ("data", "event", "id", "raw")
+
+    def __init__(self, data: bytes, raw: bytes, event: Optional[bytes] = None, id: Optional[bytes] = None):
+        self.data = data
+        self.raw = raw
+        self.event = event
+        self.id = id
+
+    @property
+    def is_done(self) -> bool:
+        return self.data.strip() == DONE
+
+    def json(self) -> Any:
+        return loads(self.data)
+
+
+class SSEParser:
+    """Incremental parser: feed() bytes, get back every completed event."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._pending_cr = False
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        if self._pending_cr:
+            chunk = b"\r" + chunk
+            self._pending_cr = False
+        if chunk.endswith(b"\r"):
+            # Might be the first half of a CRLF split across chunks.
+            chunk = chunk[:-1]
+            self._pending_cr = True
+        if b"\r" in chunk:
+            chunk = chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+        self._buffer += chunk
+
+        events = []
+        buffer = self._buffer
+        start = 0
+        while True:
+            end = buffer.find(b"\n\n", start)
+            if end < 0:
+                break
+            event = _parse_block(bytes(buffer[start:end]))
+            start = end + 2
+            if event is not None:
+                events.append(event)
+        if start:
+            del buffer[:start]
+        return events
+
+    def flush(self) -> List[SSEEvent]:
+        """Dispatch whatever is left once the stream has ended."""
+        events = self.feed(b"\n\n")
+        self._buffer.clear()
+        return events
+
+
+def _parse_block(block: bytes) -> Optional[SSEEvent]:
+    # Fast path: the overwhelmingly common single-line "data: ..." event.
+    if block.startswith(b"data: ") and b"\n" not in block:
+        return SSEEvent(block[6:], block + b"\n\n")
+
+    data_lines = []
+    event = None
+    event_id = None
+    for line in block.split(b"\n"):
+        if not line or line.startswith(b":"):
+            continue
+        field, _, value = line.partition(b":")
+        if value.startswith(b" "):
+            value = value[1:]
+        if field == b"data":
+            data_lines.append(value)
+        elif field == b"event":
+            event = value
+        elif field == b"id":
+            event_id = value
+    if not data_lines:
+        return None
+    return SSEEvent(b"\n".join(data_lines), block + b"\n\n", event, event_id)
+
+
+class StreamAccumulator:
+    """Folds OpenAI-style chat completion chunks into one completion response."""
+
+    def __init__(self):
+        self.id: Optional[str] = None
+        self.model: Optional[str] = None
+        self.created: Optional[int] = None
+        self.usage: Optional[Dict[str, Any]] = None
+        self.chunks = 0
+        self._choices: Dict[int, Dict[str, Any]] = {}
+
+    def add(self, chunk: Dict[str, Any]) -> None:
+        self.chunks += 1
+        self.id = chunk.get("id", self.id)
+        self.model = chunk.get("model", self.model)
+        self.created = chunk.get("created", self.created)
+        if chunk.get("usage"):
+            self.usage = chunk["usage"]
+        for choice in chunk.get("choices") or []:
+            state = self._choices.setdefault(
+                choice.get("index", 0),
+                {"role": "assistant", "content": [], "tool_calls": {}, "finish_reason": None},
+            )
+            delta = choice.get("delta") or {}
+            if delta.get("role"):
+                state["role"] = delta["role"]
+            if delta.get("content"):
+                state["content"].append(delta["content"])
+            for call in delta.get("tool_calls") or []:
+                slot = state["tool_calls"].setdefault(
+                    call.get("index", 0),
+                    {"id": None, "type": "function", "function": {"name": "", "arguments": []}},
+                )
+                if call.get("id"):
+                    slot["id"] = call["id"]
+                function = call.get("function") or {}
+                if function.get("name"):
+                    slot["function"]["name"] += function["name"]
+                if function.get("arguments"):
+                    slot["function"]["arguments"].append(function["arguments"])
+            if choice.get("finish_reason"):
+                state["finish_reason"] = choice["finish_reason"]
+
+    @property
+    def text(self) -> str:
+        state = self._choices.get(0)
+        return "".join(state["content"]) if state else ""
+
+    def result(self) -> Dict[str, Any]:
+        """The accumulated stream as a non-streaming chat completion response."""
+        choices = []
+        for index in sorted(self._choices):
+            state = self._choices[index]
+            message: Dict[str, Any] = {"role": state["role"], "content": "".join(state["content"])}
+            if state["tool_calls"]:
+                message["tool_calls"] = [
+                    {
+                        "id": call["id"],
+                        "type": call["type"],
+                        "function": {
+                            "name": call["function"]["name"],
+                            "arguments": "".join(call["function"]["arguments"]),
+                        },
+                    }
+                    for _, call in sorted(state["tool_calls"].items())
+                ]
+            choices.append({"index": index, "message": message, "finish_reason": state["finish_reason"]})
+        response = {
+            "id": self.id,
+            "object": "chat.completion",
+            "created": self.created,
+            "model": self.model,
+            "choices": choices,
+        }
+        if self.usage is not None:
+            response["usage"] = self.usage
+        return response
@@ -0,0 +1,143 @@
+"""
+Shared Streaming Fan-Out
+
+Identical streaming requests that overlap in time (a reopened tab, several
+UI panes showing the same generation) share one upstream stream. The first
+subscriber starts a producer task that reads the upstream stream into a
+replay buffer; every subscriber reads the buffer with its own cursor, so a
+late joiner first catches up from the first item and then follows live.
+
+The buffer is bounded. Once it is full, the oldest item is dropped as soon
+as every subscriber has read it, and the stream stops accepting new
+subscribers (they could no longer replay it from the start). Until then
+the producer waits, so upstream is read no faster than the slowest
+subscriber consumes. The upstream stream is cancelled when its last
+subscriber leaves.
+"""
+
+import asyncio
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional
+
+
+class _Broadcast:
+    __slots__ = ("key", "items", "base", "done", "error", "cursors", "task", "_changed", "_consumed")
+
+    def __init__(self, key: str):
+        self.key = key
+        self.items: Deque[Any] = deque()  # trimmed from the left, so O(1) per dropped item
+        self.base = 0  # absolute index of items[0]
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.cursors: Dict[object, int] = {}  # subscriber -> absolute index of its next item
+        self.task: Optional["asyncio.Task[None]"] = None
+        self._changed = asyncio.Event()
+        self._consumed = asyncio.Event()
+
+    def notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def oldest_read(self) -> bool:
+        """Whether every subscriber is past the oldest buffered item."""
+        return all(cursor > self.base for cursor in self.cursors.values())
+
+
+class StreamHub:
+    """Publishes each upstream stream to every subscriber of the same key."""
+
+    def __init__(self, max_buffer: int = 4096):
+        self.max_buffer = max_buffer
+        self._streams: Dict[str, _Broadcast] = {}
+        self.upstreams = 0
+        self.joined = 0
+        self.cancelled = 0
+
+    async def subscribe(self, key: str, source: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """
+        Iterate the stream for `key`, starting it with `source()` if none is live.
+
+        Args:
+            key: Identity of the stream (e.g. a hash of the request payload)
+            source: Factory for the upstream async iterator
+
+        Yields:
+            Every item of the stream, from the first one
+
+        Raises:
+            Exception: Whatever the upstream stream raised
+        """
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = self._start(key, source)
+        else:
+            self.joined += 1
+        token = object()
+        broadcast.cursors[token] = 0
+        try:
+            while True:
+                cursor = broadcast.cursors[token]
+                if cursor < broadcast.base + len(broadcast.items):
+                    item = broadcast.items[cursor - broadcast.base]
+                    broadcast.cursors[token] = cursor + 1
+                    if cursor == broadcast.base:
+                        broadcast._consumed.set()
+                    yield item
+                    continue
+                if broadcast.done:
+                    if broadcast.error is not None:
+                        raise broadcast.error
+                    return
+                await broadcast._changed.wait()
+        finally:
+            del broadcast.cursors[token]
+            broadcast._consumed.set()
+            if not broadcast.cursors and not broadcast.done:
+                self.cancelled += 1
+                self._forget(broadcast)
+                broadcast.task.cancel()
+
+    def _start(self, key: str, source: Callable[[], AsyncIterator[Any]]) -> _Broadcast:
+        broadcast = _Broadcast(key)
+        self._streams[key] = broadcast
+        self.upstreams += 1
+        # The task copies the current context, so the first subscriber's priority applies upstream.
+        broadcast.task = asyncio.ensure_future(self._pump(broadcast, source))
+        return broadcast
+
+    async def _pump(self, broadcast: _Broadcast, source: Callable[[], AsyncIterator[Any]]) -> None:
+        stream = source()
+        try:
+            async for item in stream:
+                while len(broadcast.items) >= self.max_buffer:
+                    if broadcast.oldest_read():
+                        broadcast.items.popleft()
+                        broadcast.base += 1
+                        self._forget(broadcast)  # no longer replayable from the start
+                    else:
+                        broadcast._consumed.clear()
+                        await broadcast._consumed.wait()
+                broadcast.items.append(item)
+                broadcast.notify()
+        except Exception as e:
+            broadcast.error = e
+        finally:
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            broadcast.done = True
+            self._forget(broadcast)
+            broadcast.notify()
+
+    def _forget(self, broadcast: _Broadcast) -> None:
+        if self._streams.get(broadcast.key) is broadcast:
+            del self._streams[broadcast.key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "live_streams": len(self._streams),
+            "subscribers": sum(len(b.cursors) for b in self._streams.values()),
+            "upstreams": self.upstreams,
+            "joined": self.joined,
+            "cancelled": self.cancelled,
+        }
@@ -0,0 +1,267 @@
+"""
+AI Gateway Client Benchmarks
+
+Runs `CloudflareAIGateway` against the local mock gateway and measures
+throughput and latency percentiles for the completion, streaming and
+embedding paths. Results can be saved as a baseline and later runs compared
+against it; a regression beyond the tolerance makes the run exit non-zero.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_gateway --save-baseline benchmarks/baseline.json
+    python -m benchmarks.bench_gateway --baseline benchmarks/baseline.json --tolerance 0.15
+    python -m benchmarks.bench_gateway --cassette recorded.jsonl --scenarios completion,streaming
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import platform
+import socket
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.core.cloudflare_ai_gateway import CloudflareAIGateway, CloudflareAIGatewayConfig
+from benchmarks.mock_gateway import MockGatewayConfig, create_mock_gateway
+
+SCENARIOS = ("completion", "streaming", "embedding", "embeddings_bulk")
+
+# Metric name -> True when higher is better.
+_DIRECTION = {
+    "throughput": True,
+    "p50": False,
+    "p99": False,
+    "ttft_p50": False,
+    "ttft_p99": False,
+}
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100.0))]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _serve(config: MockGatewayConfig, port: int) -> None:
+    import uvicorn
+    uvicorn.run(create_mock_gateway(config), host="127.0.0.1", port=port, log_level="warning")
+
+
+def start_mock_gateway(config: MockGatewayConfig, port: int, timeout: float = 15.0) -> multiprocessing.Process:
+    """Run the mock gateway in a separate process, so it does not share the client's event loop."""
+    process = multiprocessing.get_context("spawn").Process(target=_serve, args=(config, port), daemon=True)
+    process.start()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return process
+        except OSError:
+            time.sleep(0.05)
+    process.terminate()
+    raise RuntimeError(f"mock gateway did not start on port {port}")
+
+
+async def run_scenario(
+    call: Callable[[int], Awaitable[Optional[float]]],
+    requests: int,
+    concurrency: int,
+) -> Dict[str, Any]:
+    """
+    Issue `requests` calls with at most `concurrency` in flight.
+
+    `call(i)` performs request i and may return its time to first token.
+    """
+    latencies: List[float] = []
+    ttfts: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                ttft = await call(i)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            if ttft is not None:
+                ttfts.append(ttft)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "requests": requests,
+        "errors": errors,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+    }
+    if ttfts:
+        result["ttft_p50"] = percentile(ttfts, 50)
+        result["ttft_p99"] = percentile(ttfts, 99)
+    return result
+
+
+def _scenario_calls(gateway: CloudflareAIGateway, model: str, embedding_model: str, bulk_size: int):
+    async def completion(i: int) -> None:
+        await gateway.chat_completion(model, [{"role": "user", "content": f"benchmark prompt {i}"}], use_cache=False)
+
+    async def streaming(i: int) -> float:
+        started = time.perf_counter()
+        ttft = None
+        stream = await gateway.chat_completion(model, [{"role": "user", "content": f"benchmark stream {i}"}], stream=True)
+        async for _ in stream:
+            if ttft is None:
+                ttft = time.perf_counter() - started
+        return ttft if ttft is not None else time.perf_counter() - started
+
+    async def embedding(i: int) -> None:
+        await gateway.embedding(embedding_model, f"benchmark text {i}")
+
+    async def embeddings_bulk(i: int) -> None:
+        await gateway.embeddings(embedding_model, [f"benchmark bulk {i}-{j}" for j in range(bulk_size)])
+
+    return {
+        "completion": completion,
+        "streaming": streaming,
+        "embedding": embedding,
+        "embeddings_bulk": embeddings_bulk,
+    }
+
+
+async def run_benchmarks(args: argparse.Namespace, base_url: str) -> Dict[str, Dict[str, Any]]:
+    config = CloudflareAIGatewayConfig(
+        account_id="benchmark",
+        api_token="benchmark",
+        gateway_url=base_url,
+        max_retries=0,
+        max_concurrency=args.concurrency,
+        embedding_batch_enabled=args.embedding_batching,
+    )
+    results: Dict[str, Dict[str, Any]] = {}
+    async with CloudflareAIGateway(config) as gateway:
+        await gateway.warmup()
+        calls = _scenario_calls(gateway, args.model, args.embedding_model, args.bulk_size)
+        for name in args.scenarios:
+            # Short warm-up pass so connection setup is not measured.
+            await run_scenario(calls[name], min(args.concurrency, args.requests), args.concurrency)
+            results[name] = await run_scenario(calls[name], args.requests, args.concurrency)
+    return results
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    """Print the comparison table; returns the regressions beyond `tolerance`."""
+    regressions = []
+    print(f"\n{'scenario':<16} {'metric':<10} {'baseline':>12} {'current':>12} {'change':>9}")
+    for scenario, metrics in results.items():
+        for metric, higher_is_better in _DIRECTION.items():
+            if metric not in metrics or metric not in baseline.get(scenario, {}):
+                continue
+            before, after = baseline[scenario][metric], metrics[metric]
+            change = (after - before) / before if before else 0.0
+            worse = -change if higher_is_better else change
+            flag = "  REGRESSION" if worse > tolerance else ""
+            if flag:
+                regressions.append(f"{scenario} {metric}: {before:.4g} -> {after:.4g} ({change:+.1%})")
+            print(f"{scenario:<16} {metric:<10} {before:>12.4g} {after:>12.4g} {change:>+9.1%}{flag}")
+    return regressions
+
+
+def print_results(results: Dict[str, Dict[str, Any]]) -> None:
+    print(f"{'scenario':<16} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'ttft p50':>10} {'errors':>7}")
+    for name, r in results.items():
+        ttft = f"{r['ttft_p50'] * 1000:>10.1f}" if "ttft_p50" in r else f"{'-':>10}"
+        print(f"{name:<16} {r['throughput']:>10.1f} {r['p50'] * 1000:>10.1f} {r['p99'] * 1000:>10.1f} {ttft} {r['errors']:>7}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the AI gateway client against the mock gateway")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated subset of {SCENARIOS}")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--model", default="openai/gpt-4o-mini")
+    parser.add_argument("--embedding-model", default="openai/text-embedding-3-small")
+    parser.add_argument("--bulk-size", type=int, default=16, help="texts per embeddings_bulk request")
+    parser.add_argument("--embedding-batching", action="store_true", help="enable client-side embedding micro-batching")
+    parser.add_argument("--latency", type=float, default=0.02, help="mock latency before the first byte (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--tokens-per-second", type=float, default=400.0)
+    parser.add_argument("--completion-tokens", type=int, default=32)
+    parser.add_argument("--embedding-dim", type=int, default=256)
+    parser.add_argument("--cassette", help="replay this cassette instead of synthetic responses")
+    parser.add_argument("--gateway-url", help="benchmark an already running gateway instead of starting the mock")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write the results as a baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="compare the results against this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression (0.10 = 10%%)")
+    args = parser.parse_args()
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {sorted(unknown)}")
+
+    process = None
+    base_url = args.gateway_url
+    if base_url is None:
+        port = _free_port()
+        process = start_mock_gateway(MockGatewayConfig(
+            latency=args.latency,
+            jitter=args.jitter,
+            tokens_per_second=args.tokens_per_second,
+            completion_tokens=args.completion_tokens,
+            embedding_dim=args.embedding_dim,
+            cassette=args.cassette,
+        ), port)
+        base_url = f"http://127.0.0.1:{port}"
+
+    try:
+        results = asyncio.run(run_benchmarks(args, base_url))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.join(5)
+
+    print_results(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "meta": {
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "requests": args.requests,
+                    "concurrency": args.concurrency,
+                    "latency": args.latency,
+                    "tokens_per_second": args.tokens_per_second,
+                },
+                "results": results,
+            }, f, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions beyond {args.tolerance:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+E2B Session Store Benchmarks
+
+Measures the memory held per session and the create/get throughput of the
+session store, at several session counts. The in-memory store is compared
+in two ways: the records alone ("record" vs "legacy-dict", the previous
+free-form dict per session with its command list and eviction-time dict),
+and the whole store ("store"), which adds the user, status and expiry
+indexes on top of the records.
+
+Memory is measured with tracemalloc in its own pass; throughput is
+measured without it, since tracing slows allocation down several times.
+The session API is async, so store layouts are driven one call at a time
+on a private event loop (its per-call overhead is included in their rates).
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_sessions
+    python -m benchmarks.bench_sessions --sizes 10000,100000 --json results.json
+    python -m benchmarks.bench_sessions --store redis --redis-url redis://localhost:6379/15
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import sys
+import time
+import tracemalloc
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, TypeVar
+
+from app.core import e2b_stub
+from app.core.session_store import MemorySessionStore, RedisSessionStore, SessionRecord, SessionStore
+
+T = TypeVar("T")
+_LOOP = asyncio.new_event_loop()
+
+
+def _sync(coro: Awaitable[T]) -> T:
+    return _LOOP.run_until_complete(coro)
+
+
+class _LegacyStore:
+    """The session layout before compact records: a dict per session, plus eviction times."""
+
+    def __init__(self):
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._evict_at: Dict[str, float] = {}
+
+    def create(self, user_id: str) -> str:
+        session_id = str(uuid.uuid4())
+        now = time.time()
+        self._sessions[session_id] = {
+            "session_id": session_id,
+            "user_id": user_id,
+            "desktop_url": f"wss://pending-e2b-endpoint/session/{session_id}",
+            "created_at": now,
+            "expires_at": now + 1800,
+            "status": "active",
+            "commands": [],
+        }
+        self._evict_at[session_id] = now + 2100
+        return session_id
+
+    def get(self, session_id: str) -> Dict[str, Any]:
+        return self._sessions[session_id]
+
+
+class _RecordStore:
+    """Bare `SessionRecord`s keyed by id: the record layout without the store's indexes."""
+
+    def __init__(self):
+        self._sessions: Dict[str, SessionRecord] = {}
+
+    def create(self, user_id: str) -> str:
+        session_id = str(uuid.uuid4())
+        now = time.time()
+        self._sessions[session_id] = SessionRecord(session_id, user_id, now, now + 1800)
+        return session_id
+
+    def get(self, session_id: str) -> Dict[str, Any]:
+        return self._sessions[session_id].to_dict()
+
+
+def _users(count: int) -> List[str]:
+    # A realistic spread: many sessions per user, user ids built at runtime (not literals).
+    return [f"user-{i}" for i in range(max(1, count // 20))]
+
+
+def _stub_create(store: SessionStore) -> Callable[[str], str]:
+    e2b_stub.set_store(store)
+    return lambda user_id: _sync(e2b_stub.create_session(user_id))["session_id"]
+
+
+def _measure_memory(make: Callable[[], Any], create: Callable[[Any], Callable[[str], str]], count: int) -> float:
+    users = _users(count)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    target = make()
+    add = create(target)
+    for i in range(count):
+        add(users[i % len(users)])
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del target, add
+    gc.collect()
+    return used / count
+
+
+def _measure_throughput(make: Callable[[], Any], create: Callable[[Any], Callable[[str], str]], get: Callable[[Any, str], Any], count: int) -> Dict[str, float]:
+    users = _users(count)
+    target = make()
+    add = create(target)
+    started = time.perf_counter()
+    ids = [add(users[i % len(users)]) for i in range(count)]
+    create_elapsed = time.perf_counter() - started
+    started = time.perf_counter()
+    for session_id in ids:
+        get(target, session_id)
+    get_elapsed = time.perf_counter() - started
+    return {
+        "create_per_s": count / create_elapsed if create_elapsed else 0.0,
+        "get_per_s": count / get_elapsed if get_elapsed else 0.0,
+    }
+
+
+def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    layouts = []
+    if args.store == "memory":
+        layouts.append(("store", MemorySessionStore, _stub_create, lambda _, sid: _sync(e2b_stub.get_session(sid))))
+        layouts.append(("record", _RecordStore, lambda s: s.create, lambda s, sid: s.get(sid)))
+        layouts.append(("legacy-dict", _LegacyStore, lambda s: s.create, lambda s, sid: s.get(sid)))
+    else:
+        def make_redis() -> RedisSessionStore:
+            return RedisSessionStore(args.redis_url, prefix=f"bench:{uuid.uuid4().hex[:8]}:")
+        layouts.append(("redis", make_redis, _stub_create, lambda _, sid: _sync(e2b_stub.get_session(sid))))
+
+    results = []
+    for size in args.sizes:
+        for name, make, create, get in layouts:
+            row: Dict[str, Any] = {"layout": name, "sessions": size}
+            if name != "redis":
+                # Redis memory lives in the server; see INFO memory there instead.
+                row["bytes_per_session"] = _measure_memory(make, create, size)
+            row.update(_measure_throughput(make, create, get, size))
+            results.append(row)
+            e2b_stub.set_store(MemorySessionStore())
+            gc.collect()
+    return results
+
+
+def print_results(results: List[Dict[str, Any]]) -> None:
+    print(f"{'layout':<12} {'sessions':>10} {'bytes/sess':>11} {'create/s':>11} {'get/s':>11}")
+    for r in results:
+        per_session = f"{r['bytes_per_session']:>11.0f}" if "bytes_per_session" in r else f"{'-':>11}"
+        print(f"{r['layout']:<12} {r['sessions']:>10} {per_session} {r['create_per_s']:>11.0f} {r['get_per_s']:>11.0f}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark session memory and throughput of the e2b session store")
+    parser.add_argument("--sizes", default="100000,1000000", help="comma-separated session counts")
+    parser.add_argument("--store", choices=("memory", "redis"), default="memory")
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    args = parser.parse_args()
+    args.sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+
+    results = run(args)
+    print_results(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,290 @@
+"""
+Mock Cloudflare AI Gateway
+
+A local stand-in for the gateway's OpenAI-compatible API, for benchmarking
+`CloudflareAIGateway` without calling the paid service. It serves:
+  - POST /chat/completions (JSON, or SSE when `"stream": true`)
+  - POST /embeddings
+  - HEAD on any path (connection warmup)
+
+Synthetic responses follow a simple latency model: every request waits
+`latency` seconds (plus uniform `jitter`) before the first byte, and
+streams emit tokens at `tokens_per_second`.
+
+Cassettes make the mock replay real traffic. A cassette is a JSONL file of
+recorded interactions keyed by the canonical request payload. In record
+mode (`upstream` set), requests missing from the cassette are forwarded to
+the real gateway and appended to it; replays keep the recorded latency and
+SSE frames unless `replay_timing` is off.
+
+Run standalone:
+    python -m benchmarks.mock_gateway --port 8787 --latency 0.05 --tokens-per-second 80
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from app.core.gateway_cache import payload_key
+
+class MockGatewayConfig:
+    """Latency model and cassette settings of the mock gateway."""
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        jitter: float = 0.0,
+        tokens_per_second: float = 80.0,
+        completion_tokens: int = 32,
+        embedding_dim: int = 1536,
+        embedding_latency: Optional[float] = None,
+        cassette: Optional[str] = None,
+        upstream: Optional[str] = None,
+        replay_timing: bool = True,
+        strict: bool = False,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.embedding_dim = embedding_dim
+        self.embedding_latency = embedding_latency if embedding_latency is not None else latency
+        self.cassette = cassette
+        self.upstream = upstream.rstrip("/") if upstream else None
+        self.replay_timing = replay_timing
+        self.strict = strict
+
+
+class Cassette:
+    """Recorded interactions, keyed by endpoint path and canonical request payload."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[self.key(entry["path"], entry["request"])] = entry
+
+    @staticmethod
+    def key(path: str, payload: Dict[str, Any]) -> str:
+        return payload_key(payload, namespace=path)
+
+    def get(self, path: str, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return self.entries.get(self.key(path, payload))
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        self.entries[self.key(entry["path"], entry["request"])] = entry
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+def _delay(config: MockGatewayConfig, base: float) -> float:
+    return base + (random.uniform(0, config.jitter) if config.jitter else 0.0)
+
+
+def _completion_id(payload: Dict[str, Any]) -> str:
+    return "chatcmpl-mock-" + hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def _tokens(count: int) -> List[str]:
+    return [f"tok{i} " for i in range(count)]
+
+
+def _completion_body(payload: Dict[str, Any], config: MockGatewayConfig) -> Dict[str, Any]:
+    text = "".join(_tokens(config.completion_tokens))
+    return {
+        "id": _completion_id(payload),
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": payload.get("model"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": text},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": sum(len(str(m.get("content", ""))) // 4 for m in payload.get("messages", [])),
+            "completion_tokens": config.completion_tokens,
+            "total_tokens": config.completion_tokens,
+        },
+    }
+
+
+def _chunk_frame(completion_id: str, model: Any, delta: Dict[str, Any], finish: Optional[str] = None) -> bytes:
+    chunk = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+    }
+    return b"data: " + json.dumps(chunk).encode() + b"\n\n"
+
+
+async def _synthetic_stream(payload: Dict[str, Any], config: MockGatewayConfig) -> AsyncIterator[bytes]:
+    completion_id = _completion_id(payload)
+    model = payload.get("model")
+    interval = 1.0 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+    yield _chunk_frame(completion_id, model, {"role": "assistant", "content": ""})
+    for token in _tokens(config.completion_tokens):
+        if interval:
+            await asyncio.sleep(interval)
+        yield _chunk_frame(completion_id, model, {"content": token})
+    yield _chunk_frame(completion_id, model, {}, finish="stop")
+    yield b"data: [DONE]\n\n"
+
+
+def _embedding_vector(text: str, dim: int) -> List[float]:
+    # Deterministic per text, so repeated runs (and caches) see identical vectors.
+    rng = random.Random(hashlib.sha1(text.encode()).digest())
+    return [rng.uniform(-1.0, 1.0) for _ in range(dim)]
+
+
+def _embeddings_body(payload: Dict[str, Any], config: MockGatewayConfig) -> Dict[str, Any]:
+    inputs = payload.get("input")
+    texts = inputs if isinstance(inputs, list) else [inputs]
+    dim = int(payload.get("dimensions") or config.embedding_dim)
+    return {
+        "object": "list",
+        "model": payload.get("model"),
+        "data": [
+            {"object": "embedding", "index": i, "embedding": _embedding_vector(str(text), dim)}
+            for i, text in enumerate(texts)
+        ],
+        "usage": {"prompt_tokens": sum(len(str(t)) // 4 for t in texts), "total_tokens": 0},
+    }
+
+
+async def _replay_stream(entry: Dict[str, Any], config: MockGatewayConfig) -> AsyncIterator[bytes]:
+    previous = 0.0
+    for offset, frame in entry["frames"]:
+        if config.replay_timing and offset > previous:
+            await asyncio.sleep(offset - previous)
+        previous = offset
+        yield frame.encode()
+
+
+async def _frames(entry: Dict[str, Any]) -> AsyncIterator[bytes]:
+    for _, frame in entry["frames"]:
+        yield frame.encode()
+
+
+def create_mock_gateway(config: Optional[MockGatewayConfig] = None) -> FastAPI:
+    """Build the mock gateway app."""
+    config = config or MockGatewayConfig()
+    cassette = Cassette(config.cassette) if config.cassette else None
+    app = FastAPI(title="Mock AI Gateway")
+    app.state.config = config
+    app.state.requests = 0
+
+    async def record(request: Request, path: str, payload: Dict[str, Any]) -> Response:
+        # The upstream response is read in full (streams too) before it is passed on.
+        headers = {"Authorization": request.headers.get("authorization", "")}
+        started = time.monotonic()
+        async with httpx.AsyncClient(timeout=120.0) as client:
+            if payload.get("stream"):
+                frames: List[List[Any]] = []
+                async with client.stream("POST", f"{config.upstream}{path}", json=payload, headers=headers) as upstream:
+                    status = upstream.status_code
+                    buffer = b""
+                    async for data in upstream.aiter_bytes():
+                        buffer += data
+                        while b"\n\n" in buffer:
+                            frame, buffer = buffer.split(b"\n\n", 1)
+                            frames.append([time.monotonic() - started, frame.decode() + "\n\n"])
+                entry = {"path": path, "request": payload, "status": status, "frames": frames,
+                         "latency": frames[0][0] if frames else 0.0}
+            else:
+                upstream = await client.post(f"{config.upstream}{path}", json=payload, headers=headers)
+                entry = {"path": path, "request": payload, "status": upstream.status_code,
+                         "response": upstream.json(), "latency": time.monotonic() - started}
+        if entry["status"] < 400:
+            cassette.add(entry)
+        return await replay(entry, timed=False)
+
+    async def replay(entry: Dict[str, Any], timed: bool = True) -> Response:
+        if "frames" in entry:
+            return StreamingResponse(_replay_stream(entry, config) if timed else _frames(entry),
+                                     status_code=entry["status"], media_type="text/event-stream")
+        if timed and config.replay_timing:
+            await asyncio.sleep(entry.get("latency", 0.0))
+        return JSONResponse(entry["response"], status_code=entry["status"])
+
+    async def handle(request: Request, path: str) -> Response:
+        app.state.requests += 1
+        payload = await request.json()
+        if cassette is not None:
+            entry = cassette.get(path, payload)
+            if entry is not None:
+                return await replay(entry)
+            if config.upstream:
+                return await record(request, path, payload)
+            if config.strict:
+                raise HTTPException(status_code=404, detail="request not in cassette")
+        if path == "/embeddings":
+            await asyncio.sleep(_delay(config, config.embedding_latency))
+            return JSONResponse(_embeddings_body(payload, config))
+        await asyncio.sleep(_delay(config, config.latency))
+        if payload.get("stream"):
+            return StreamingResponse(_synthetic_stream(payload, config), media_type="text/event-stream")
+        return JSONResponse(_completion_body(payload, config))
+
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        return await handle(request, "/chat/completions")
+
+    @app.post("/embeddings")
+    async def embeddings(request: Request):
+        return await handle(request, "/embeddings")
+
+    @app.api_route("/{path:path}", methods=["HEAD"])
+    async def head(path: str):
+        return Response(status_code=200)
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the mock AI gateway")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds before the first byte")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra uniform random latency (seconds)")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--completion-tokens", type=int, default=32)
+    parser.add_argument("--embedding-dim", type=int, default=1536)
+    parser.add_argument("--cassette", help="JSONL cassette to replay (and record into)")
+    parser.add_argument("--upstream", help="real gateway base URL; record requests missing from the cassette")
+    parser.add_argument("--no-replay-timing", action="store_true", help="replay cassettes without recorded delays")
+    parser.add_argument("--strict", action="store_true", help="404 for requests missing from the cassette")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = MockGatewayConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        embedding_dim=args.embedding_dim,
+        cassette=args.cassette,
+        upstream=args.upstream,
+        replay_timing=not args.no_replay_timing,
+        strict=args.strict,
+    )
+    uvicorn.run(create_mock_gateway(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,24 +5,70 @@ This is the main FastAPI application that serves as the backend for the CUA proj
 It provides API endpoints for the Cloudflare AI Gateway integration and MCP orchestration.
 """
 
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, REGISTRY, generate_latest
+from prometheus_client import multiprocess
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Any, Dict, List, Literal, Optional
+import asyncio
+import httpx
+import json
 import os
-from app.core import e2b_stub
+from app.core import e2b_stub, gateway_metrics
+from app.core.e2b_local import SandboxBackend, create_sandbox_backend
+from app.core.session_pool import SessionPool, create_session_pool
+from app.core.cloudflare_ai_gateway import GATEWAY_OPTIONS, CloudflareAIGateway, create_cloudflare_ai_gateway
+from app.core.prompt_budget import PromptTooLarge
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_gateway: Optional[CloudflareAIGateway] = None
+_sandbox: SandboxBackend = create_sandbox_backend()
+_pool: Optional[SessionPool] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Own the shared AI gateway client, the e2b session reaper and warm pool for the app's lifetime."""
+    global _gateway, _pool
+    reaper = asyncio.create_task(e2b_stub.run_reaper(float(os.getenv("E2B_REAPER_INTERVAL", "30"))))
+    _pool = create_session_pool(_sandbox)
+    if _pool is not None:
+        _pool.start()
+        logger.info(f"e2b warm pool enabled ({_pool.min_size}-{_pool.max_size} sandboxes)")
+    try:
+        _gateway = create_cloudflare_ai_gateway()
+    except ValueError as e:
+        logger.warning(f"AI gateway disabled: {e}")
+    else:
+        warmed = await _gateway.warmup()
+        logger.info(f"AI gateway client ready ({warmed} warm connections)")
+    try:
+        yield
+    finally:
+        reaper.cancel()
+        if _pool is not None:
+            await _pool.stop()
+            _pool = None
+        if _gateway is not None:
+            await _gateway.close()
+            _gateway = None
+
+
 # Create FastAPI app instance
 app = FastAPI(
     title="CUA Backend API",
     description="Computer User Assistance Backend with Cloudflare AI Gateway integration",
     version="0.1.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -67,36 +113,277 @@ async def api_status():
         }
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint (gateway latency, TTFT, token rates, cache and queue stats)."""
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Several worker processes: aggregate their metric files instead. The gateway's
+        # cache/queue stats are read at scrape time, so they cover only the worker serving it.
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(gateway_metrics.STATS_COLLECTOR)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+# ---------------------- AI GATEWAY ENDPOINTS ----------------------
+def get_gateway() -> CloudflareAIGateway:
+    """Return the shared AI gateway client created in the application lifespan."""
+    if _gateway is None:
+        raise HTTPException(status_code=503, detail="ai_gateway_not_configured")
+    return _gateway
+
+
+def upstream_error(error: BaseException) -> Response:
+    """
+    HTTP response for a failed upstream call.
+
+    Upstream 4xx responses (bad request, unknown model, rate limited) are the
+    client's to handle, so they pass through with their status, body and
+    Retry-After; transport errors and upstream 5xx become 502.
+    """
+    # The gateway wraps httpx errors, so the status error may be a cause further down.
+    while error is not None and not isinstance(error, httpx.HTTPStatusError):
+        error = error.__cause__
+    if error is not None and 400 <= error.response.status_code < 500:
+        upstream = error.response
+        headers = {"Retry-After": upstream.headers["Retry-After"]} if "Retry-After" in upstream.headers else None
+        return Response(
+            upstream.content,
+            status_code=upstream.status_code,
+            headers=headers,
+            media_type=upstream.headers.get("Content-Type", "application/json")
+        )
+    return JSONResponse({"detail": "ai_gateway_error"}, status_code=502)
+
+
+class ChatCompletionRequest(BaseModel):
+    """OpenAI-compatible chat completion request; extra model parameters are passed through."""
+    model_config = ConfigDict(extra="allow")
+
+    model: str
+    messages: List[Dict[str, Any]]
+    stream: bool = False
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(body: ChatCompletionRequest):
+    """Proxy a chat completion through the Cloudflare AI Gateway (SSE when streaming)."""
+    gateway = get_gateway()
+    # Only model parameters pass through; gateway options are not the client's to set.
+    params = {k: v for k, v in (body.model_extra or {}).items() if k not in GATEWAY_OPTIONS}
+
+    if not body.stream:
+        try:
+            return await gateway.chat_completion(body.model, body.messages, **params)
+        except PromptTooLarge as e:
+            raise HTTPException(status_code=413, detail=f"prompt_too_large: {e}")
+        except Exception as e:
+            logger.error(f"Chat completion failed: {e}")
+            return upstream_error(e)
+
+    # Upstream SSE frames are forwarded as raw bytes, without re-encoding.
+    frames = gateway.stream_chat_completion_raw(body.model, body.messages, **params)
+    # Wait for the first frame so upstream failures still surface as a proper HTTP error.
+    try:
+        first = await frames.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except PromptTooLarge as e:
+        await frames.aclose()
+        raise HTTPException(status_code=413, detail=f"prompt_too_large: {e}")
+    except Exception as e:
+        await frames.aclose()
+        logger.error(f"Chat completion stream failed: {e}")
+        return upstream_error(e)
+
+    async def relay():
+        # Frames are pulled from upstream only as fast as the client consumes them;
+        # a client disconnect cancels this generator and the finally closes upstream.
+        try:
+            if first is not None:
+                yield first
+                async for frame in frames:
+                    yield frame
+            yield b"data: [DONE]\n\n"
+        except Exception as e:
+            logger.error(f"Chat completion stream aborted: {e}")
+            yield f"data: {json.dumps({'error': 'ai_gateway_error'})}\n\n".encode("utf-8")
+        finally:
+            await frames.aclose()
+
+    return StreamingResponse(
+        relay(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 # ---------------------- E2B STUB ENDPOINTS ----------------------
 @app.post("/e2b/session")
 async def e2b_create_session(user_id: str | None = None):
-    """Create a stub E2B desktop session (placeholder)."""
-    sess = e2b_stub.create_session(user_id=user_id)
+    """Create an E2B desktop session, from the warm pool when one is configured."""
+    if _pool is not None:
+        sess = await _pool.acquire(user_id=user_id)
+    else:
+        sess = await _sandbox.create_session(user_id=user_id)
     return {"session": sess}
 
 
 @app.get("/e2b/session/{session_id}")
 async def e2b_get_session(session_id: str):
     try:
-        sess = e2b_stub.get_session(session_id)
+        sess = await e2b_stub.get_session(session_id)
     except KeyError:
         raise HTTPException(status_code=404, detail="session_not_found")
     return {"session": sess}
 
 
 @app.post("/e2b/session/{session_id}/exec")
-async def e2b_exec(session_id: str, command: str):
+async def e2b_exec(session_id: str, command: str, timeout: Optional[float] = None):
+    """Run a command in the session; `timeout` (seconds) is capped by E2B_EXEC_TIMEOUT."""
     try:
-        result = e2b_stub.exec_command(session_id, command)
+        result = await _sandbox.exec_command(session_id, command, timeout=timeout)
     except KeyError:
         raise HTTPException(status_code=404, detail="session_not_found")
     return result
 
 
+@app.post("/e2b/session/{session_id}/exec/stream")
+async def e2b_exec_stream(session_id: str, command: str, timeout: Optional[float] = None):
+    """
+    Run a command and stream its output as Server-Sent Events.
+
+    `stdout` and `stderr` events carry {"data": text} chunks as the command
+    produces them; a final `exit` event carries the exit code and timings.
+    Disconnecting stops the command.
+    """
+    events = _sandbox.exec_stream(session_id, command, timeout=timeout)
+    # Pull the first event so a missing or inactive session is still a plain HTTP response.
+    try:
+        first = await events.__anext__()
+    except KeyError:
+        raise HTTPException(status_code=404, detail="session_not_found")
+    if first[0] == "exit" and "error" in first[1]:
+        await events.aclose()
+        return first[1]
+
+    async def relay():
+        try:
+            event, payload = first
+            while True:
+                body = payload if event == "exit" else {"data": payload}
+                yield f"event: {event}\ndata: {json.dumps(body)}\n\n".encode("utf-8")
+                if event == "exit":
+                    return
+                event, payload = await events.__anext__()
+        except Exception as e:
+            logger.error(f"e2b exec stream aborted: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': 'exec_failed'})}\n\n".encode("utf-8")
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        relay(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+class BatchStep(BaseModel):
+    """One step of a batch: run `command`, or write `content` to `path`."""
+    action: Literal["exec", "write"] = "exec"
+    command: Optional[str] = None
+    timeout: Optional[float] = None
+    path: Optional[str] = None
+    content: str = ""
+
+
+class BatchRequest(BaseModel):
+    steps: List[BatchStep] = Field(min_length=1, max_length=500)
+    on_error: Literal["stop", "continue"] = "stop"
+    stream: bool = True
+
+
+@app.post("/e2b/session/{session_id}/batch")
+async def e2b_batch(session_id: str, body: BatchRequest):
+    """
+    Run several commands and file writes in order, in one request.
+
+    With `stream` (default), each step's result is sent as a `step` event
+    as soon as it finishes, followed by a `done` summary; otherwise all
+    results are returned together. `on_error="stop"` skips the remaining
+    steps after a failed one (an error or a non-zero exit code).
+    """
+    for index, step in enumerate(body.steps):
+        if (step.command if step.action == "exec" else step.path) is None:
+            field = "command" if step.action == "exec" else "path"
+            raise HTTPException(status_code=422, detail=f"steps[{index}]: {step.action} needs a {field}")
+    events = _sandbox.run_batch(
+        session_id, [step.model_dump() for step in body.steps], stop_on_error=body.on_error == "stop"
+    )
+    try:
+        first = await events.__anext__()
+    except KeyError:
+        raise HTTPException(status_code=404, detail="session_not_found")
+    if first[1].get("error") == "session_inactive":
+        await events.aclose()
+        return {"error": "session_inactive", "status": first[1]["status"]}
+
+    if not body.stream:
+        results = [first[1]]
+        try:
+            async for event, payload in events:
+                if event == "done":
+                    return {**payload, "results": results}
+                results.append(payload)
+            else:
+                logger.error("e2b batch ended without a summary")
+                return JSONResponse({"error": "batch_incomplete", "results": results}, status_code=502)
+        except Exception as e:
+            # Steps that already ran have had their effects; report them with the failure.
+            logger.error(f"e2b batch aborted: {e}")
+            return JSONResponse({"error": "batch_failed", "results": results}, status_code=502)
+        finally:
+            await events.aclose()
+
+    async def relay():
+        try:
+            event, payload = first
+            while True:
+                yield f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode("utf-8")
+                if event == "done":
+                    return
+                event, payload = await events.__anext__()
+        except Exception as e:
+            logger.error(f"e2b batch aborted: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': 'batch_failed'})}\n\n".encode("utf-8")
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        relay(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/e2b/session/{session_id}/history")
+async def e2b_history(
+    session_id: str, cursor: Optional[int] = Query(None, ge=0), limit: int = 50, order: str = "asc"
+):
+    """Page through a session's commands; pass `next_cursor` back as `cursor` for the next page."""
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=422, detail="order must be 'asc' or 'desc'")
+    try:
+        return await e2b_stub.command_history(session_id, cursor=cursor, limit=max(1, min(limit, 500)), order=order)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="session_not_found")
+
+
 @app.post("/e2b/session/{session_id}/write")
 async def e2b_write(session_id: str, path: str, content: str):
     try:
-        result = e2b_stub.write_file(session_id, path, content)
+        result = await _sandbox.write_file(session_id, path, content)
     except KeyError:
         raise HTTPException(status_code=404, detail="session_not_found")
     return result
@@ -105,15 +392,30 @@ async def e2b_write(session_id: str, path: str, content: str):
 @app.post("/e2b/session/{session_id}/close")
 async def e2b_close(session_id: str):
     try:
-        result = e2b_stub.close_session(session_id)
+        result = await _sandbox.close_session(session_id)
     except KeyError:
         raise HTTPException(status_code=404, detail="session_not_found")
     return result
 
 
 @app.get("/e2b/sessions")
-async def e2b_list_sessions():
-    return e2b_stub.list_sessions()
+async def e2b_list_sessions(
+    user_id: Optional[str] = None,
+    status: Optional[str] = None,
+    cursor: Optional[int] = Query(None, ge=0),
+    limit: int = 100,
+):
+    """Sessions in creation order, filtered by user and/or status; page with `next_cursor`."""
+    return await e2b_stub.list_sessions(user_id=user_id, status=status, cursor=cursor, limit=max(1, min(limit, 1000)))
+
+
+@app.get("/e2b/stats")
+async def e2b_stats():
+    """Live session count, lifecycle counters (created, closed, evicted), execution and warm pool stats."""
+    stats = {**await e2b_stub.session_stats(), "execution": _sandbox.stats()}
+    if _pool is not None:
+        stats["pool"] = _pool.stats()
+    return stats
 
 if __name__ == "__main__":
     import uvicorn
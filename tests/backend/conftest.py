@@ -0,0 +1,24 @@
+"""Shared fixtures for the backend tests (run with `pytest` from the repository or backend/)."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+
+from app.core import e2b_stub  # noqa: E402
+from app.core.session_store import MemorySessionStore, RedisSessionStore  # noqa: E402
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request, tmp_path):
+    """A fresh session store of each kind, installed as the e2b stub's store."""
+    if request.param == "memory":
+        store = MemorySessionStore(ring_size=4, spill_dir=str(tmp_path))
+    else:
+        fakeredis = pytest.importorskip("fakeredis")
+        store = RedisSessionStore(client=fakeredis.aioredis.FakeRedis(decode_responses=True), ring_size=4)
+    previous = e2b_stub._STORE
+    e2b_stub.set_store(store)
+    yield store
+    e2b_stub.set_store(previous)
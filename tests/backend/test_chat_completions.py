@@ -0,0 +1,122 @@
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from app.core.cloudflare_ai_gateway import CloudflareAIGateway, CloudflareAIGatewayConfig
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+COMPLETION = {"id": "c1", "choices": [{"index": 0, "message": {"role": "assistant", "content": "hello"}}]}
+FRAMES = b'data: {"choices":[{"delta":{"content":"hel"}}]}\n\ndata: {"choices":[{"delta":{"content":"lo"}}]}\n\n'
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Requests seen upstream, and the response to give them (set `respond` to change it)."""
+    state = {"requests": [], "respond": None}
+
+    def handler(request):
+        body = json.loads(request.content)
+        state["requests"].append(body)
+        if state["respond"] is not None:
+            return state["respond"](request)
+        if body.get("stream"):
+            headers = {"Content-Type": "text/event-stream"}
+            return httpx.Response(200, content=FRAMES + b"data: [DONE]\n\n", headers=headers)
+        return httpx.Response(200, json=COMPLETION)
+
+    config = CloudflareAIGatewayConfig(account_id="acct", api_token="token", warmup_connections=0, max_retries=0)
+    gateway = CloudflareAIGateway(config, httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(main, "_gateway", gateway)
+    return state
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+def _post(client, stream, **extra):
+    body = {"model": "openai/gpt-4o", "messages": MESSAGES, "stream": stream, **extra}
+    return client.post("/v1/chat/completions", json=body)
+
+
+def test_completion_is_proxied(client, upstream):
+    response = _post(client, stream=False, temperature=0.2)
+
+    assert response.status_code == 200
+    assert response.json() == COMPLETION
+    assert upstream["requests"][0]["temperature"] == 0.2
+
+
+def test_stream_relays_upstream_frames(client, upstream):
+    response = _post(client, stream=True)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.content == FRAMES + b"data: [DONE]\n\n"
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_gateway_options_in_the_body_are_not_forwarded(client, upstream, stream):
+    response = _post(client, stream=stream, use_cache=False, priority="interactive", latency_budget=0.001, top_p=0.5)
+
+    assert response.status_code == 200
+    sent = upstream["requests"][0]
+    assert sent["top_p"] == 0.5
+    assert not {"use_cache", "priority", "latency_budget", "accumulator"} & set(sent)
+
+
+def test_gateway_not_configured_is_503(client, monkeypatch):
+    monkeypatch.setattr(main, "_gateway", None)
+
+    assert _post(client, stream=False).status_code == 503
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_upstream_rate_limit_passes_through_with_retry_after(client, upstream, stream):
+    upstream["respond"] = lambda request: httpx.Response(
+        429, json={"error": "rate limited"}, headers={"Retry-After": "7"}
+    )
+
+    response = _post(client, stream=stream)
+
+    assert response.status_code == 429
+    assert response.json() == {"error": "rate limited"}
+    assert response.headers["retry-after"] == "7"
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_upstream_client_error_passes_through(client, upstream, stream):
+    upstream["respond"] = lambda request: httpx.Response(400, json={"error": "unknown model"})
+
+    response = _post(client, stream=stream)
+
+    assert response.status_code == 400
+    assert response.json() == {"error": "unknown model"}
+    assert "retry-after" not in response.headers
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_upstream_server_error_is_502(client, upstream, stream):
+    upstream["respond"] = lambda request: httpx.Response(500, json={"error": "internal"})
+
+    response = _post(client, stream=stream)
+
+    assert response.status_code == 502
+    assert response.json() == {"detail": "ai_gateway_error"}
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_transport_error_is_502(client, upstream, stream):
+    def refuse(request):
+        raise httpx.ConnectError("connection refused", request=request)
+
+    upstream["respond"] = refuse
+
+    response = _post(client, stream=stream)
+
+    assert response.status_code == 502
+    assert response.json() == {"detail": "ai_gateway_error"}
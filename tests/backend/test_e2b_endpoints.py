@@ -0,0 +1,156 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from app.core import e2b_stub
+from app.core.e2b_local import StubSandboxBackend
+from app.core.session_store import MemorySessionStore
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.setattr(e2b_stub, "_STORE", MemorySessionStore(spill_dir=str(tmp_path)))
+    monkeypatch.setattr(main, "_sandbox", StubSandboxBackend(workers=2))
+    monkeypatch.setattr(main, "_pool", None)
+    return TestClient(main.app)
+
+
+def _create(client, user_id="alice"):
+    response = client.post("/e2b/session", params={"user_id": user_id})
+    assert response.status_code == 200
+    return response.json()["session"]["session_id"]
+
+
+def _events(response):
+    events = []
+    for frame in response.text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in frame.split("\n"))
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_session_lifecycle(client):
+    session_id = _create(client)
+
+    assert client.get(f"/e2b/session/{session_id}").json()["session"]["status"] == "active"
+    result = client.post(f"/e2b/session/{session_id}/exec", params={"command": "ls"}).json()
+    assert (result["seq"], result["exit_code"]) == (1, 0)
+    assert client.post(f"/e2b/session/{session_id}/write", params={"path": "a.txt", "content": "hi"}).json()["ok"]
+    assert client.post(f"/e2b/session/{session_id}/close").json()["status"] == "closed"
+    closed = client.post(f"/e2b/session/{session_id}/exec", params={"command": "ls"}).json()
+    assert (closed["error"], closed["status"]) == ("session_inactive", "closed")
+
+
+def test_unknown_session_is_404(client):
+    for response in (
+        client.get("/e2b/session/missing"),
+        client.post("/e2b/session/missing/exec", params={"command": "ls"}),
+        client.post("/e2b/session/missing/exec/stream", params={"command": "ls"}),
+        client.post("/e2b/session/missing/batch", json={"steps": [{"command": "ls"}]}),
+        client.get("/e2b/session/missing/history"),
+        client.post("/e2b/session/missing/close"),
+    ):
+        assert response.status_code == 404
+        assert response.json() == {"detail": "session_not_found"}
+
+
+def test_exec_stream_sends_output_then_exit(client):
+    session_id = _create(client)
+
+    response = client.post(f"/e2b/session/{session_id}/exec/stream", params={"command": "echo hi"})
+
+    events = _events(response)
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert events[-1][0] == "exit"
+    assert events[-1][1]["exit_code"] == 0
+
+
+def test_history_pages_by_cursor_and_rejects_negative_cursors(client):
+    session_id = _create(client)
+    for i in range(5):
+        client.post(f"/e2b/session/{session_id}/exec", params={"command": f"c{i}"})
+
+    first = client.get(f"/e2b/session/{session_id}/history", params={"limit": 3, "order": "desc"}).json()
+    rest = client.get(
+        f"/e2b/session/{session_id}/history", params={"limit": 3, "order": "desc", "cursor": first["next_cursor"]}
+    ).json()
+
+    assert [entry["seq"] for entry in first["items"] + rest["items"]] == [5, 4, 3, 2, 1]
+    assert rest["next_cursor"] is None
+    assert client.get(f"/e2b/session/{session_id}/history", params={"cursor": -1}).status_code == 422
+    assert client.get(f"/e2b/session/{session_id}/history", params={"order": "sideways"}).status_code == 422
+
+
+def test_sessions_listing_filters_and_pages(client):
+    alice = [_create(client, "alice") for _ in range(3)]
+    _create(client, "bob")
+    client.post(f"/e2b/session/{alice[1]}/close")
+
+    first = client.get("/e2b/sessions", params={"user_id": "alice", "limit": 2}).json()
+    params = {"user_id": "alice", "limit": 2, "cursor": first["next_cursor"]}
+    second = client.get("/e2b/sessions", params=params).json()
+    closed = client.get("/e2b/sessions", params={"status": "closed"}).json()
+
+    assert [s["session_id"] for s in first["items"] + second["items"]] == alice
+    assert first["count"] == 4
+    assert [s["session_id"] for s in closed["items"]] == [alice[1]]
+    assert client.get("/e2b/sessions", params={"cursor": -1}).status_code == 422
+
+
+def test_batch_streams_each_step_then_a_summary(client):
+    session_id = _create(client)
+    steps = [{"command": "ls"}, {"action": "write", "path": "a.txt", "content": "hi"}]
+
+    response = client.post(f"/e2b/session/{session_id}/batch", json={"steps": steps})
+
+    events = _events(response)
+    assert [event for event, _ in events] == ["step", "step", "done"]
+    assert [payload["index"] for _, payload in events[:2]] == [0, 1]
+    assert events[-1][1]["completed"] == 2
+
+
+def test_batch_without_streaming_returns_every_result(client):
+    session_id = _create(client)
+    steps = [{"command": "ls"}, {"command": "pwd"}]
+
+    result = client.post(f"/e2b/session/{session_id}/batch", json={"steps": steps, "stream": False}).json()
+
+    assert (result["steps"], result["completed"], result["failed"], result["stopped"]) == (2, 2, 0, False)
+    assert [step["command"] for step in result["results"]] == ["ls", "pwd"]
+
+
+def test_batch_step_missing_its_target_is_422(client):
+    session_id = _create(client)
+
+    response = client.post(f"/e2b/session/{session_id}/batch", json={"steps": [{"action": "write"}]})
+
+    assert response.status_code == 422
+    assert response.json()["detail"] == "steps[0]: write needs a path"
+
+
+def test_batch_failing_midway_keeps_the_completed_results(client, monkeypatch):
+    async def run_batch(session_id, steps, stop_on_error=True):
+        yield "step", {"index": 0, "ok": True}
+        raise RuntimeError("sandbox lost")
+
+    monkeypatch.setattr(main._sandbox, "run_batch", run_batch)
+
+    body = {"steps": [{"command": "a"}, {"command": "b"}], "stream": False}
+    response = client.post("/e2b/session/s/batch", json=body)
+
+    assert response.status_code == 502
+    assert response.json() == {"error": "batch_failed", "results": [{"index": 0, "ok": True}]}
+
+
+def test_batch_ending_without_a_summary_is_reported(client, monkeypatch):
+    async def run_batch(session_id, steps, stop_on_error=True):
+        yield "step", {"index": 0, "ok": True}
+
+    monkeypatch.setattr(main._sandbox, "run_batch", run_batch)
+
+    response = client.post("/e2b/session/s/batch", json={"steps": [{"command": "a"}], "stream": False})
+
+    assert response.status_code == 502
+    assert response.json() == {"error": "batch_incomplete", "results": [{"index": 0, "ok": True}]}
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from app.core.gateway_singleflight import SingleFlight
+
+
+class _Upstream:
+    """Upstream call that blocks until released and records how it ended."""
+
+    def __init__(self):
+        self.calls = 0
+        self.cancelled = False
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return {"answer": 42}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_call():
+    flight, upstream = SingleFlight(), _Upstream()
+
+    callers = [asyncio.ensure_future(flight.do("k", upstream)) for _ in range(3)]
+    await asyncio.sleep(0)
+    upstream.release.set()
+
+    assert await asyncio.gather(*callers) == [{"answer": 42}] * 3
+    assert upstream.calls == 1
+    assert flight.stats() == {"in_flight": 0, "leaders": 1, "followers": 2, "cancelled": 0}
+
+
+@pytest.mark.asyncio
+async def test_a_cancelled_caller_does_not_cancel_the_shared_call():
+    flight, upstream = SingleFlight(), _Upstream()
+
+    leader = asyncio.ensure_future(flight.do("k", upstream))
+    follower = asyncio.ensure_future(flight.do("k", upstream))
+    await asyncio.sleep(0)
+    leader.cancel()
+    await asyncio.sleep(0)
+    upstream.release.set()
+
+    assert await follower == {"answer": 42}
+    assert leader.cancelled()
+    assert not upstream.cancelled
+    assert flight.stats()["cancelled"] == 0
+
+
+@pytest.mark.asyncio
+async def test_the_shared_call_is_cancelled_when_every_caller_leaves():
+    flight, upstream = SingleFlight(), _Upstream()
+
+    callers = [asyncio.ensure_future(flight.do("k", upstream)) for _ in range(2)]
+    await asyncio.sleep(0)
+    for caller in callers:
+        caller.cancel()
+    await asyncio.gather(*callers, return_exceptions=True)
+    await asyncio.sleep(0)
+
+    assert upstream.cancelled
+    assert flight.stats() == {"in_flight": 0, "leaders": 1, "followers": 1, "cancelled": 1}
+
+    # The next caller starts a fresh call rather than joining the cancelled one.
+    upstream.release.set()
+    assert await flight.do("k", upstream) == {"answer": 42}
+    assert upstream.calls == 2
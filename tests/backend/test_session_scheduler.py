@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from app.core.session_scheduler import SessionScheduler
+
+
+async def _run(scheduler, order, session_id, user_id, label, hold=0.0):
+    async with scheduler.slot(session_id, user_id):
+        order.append(label)
+        await asyncio.sleep(hold)
+
+
+async def _queued(scheduler, count):
+    while scheduler.stats()["queued"] < count:
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_commands_of_one_session_run_one_at_a_time_in_order():
+    scheduler = SessionScheduler(max_concurrency=4)
+    order, running, overlap = [], 0, []
+
+    async def command(label, hold):
+        nonlocal running
+        async with scheduler.slot("s", "alice"):
+            running += 1
+            overlap.append(running)
+            order.append(label)
+            await asyncio.sleep(hold)
+            running -= 1
+
+    await asyncio.gather(*(command(i, 0.005 * (5 - i)) for i in range(5)))
+
+    assert order == [0, 1, 2, 3, 4]
+    assert max(overlap) == 1
+    assert scheduler.stats()["completed"] == 5
+
+
+@pytest.mark.asyncio
+async def test_free_slots_go_round_robin_across_users():
+    scheduler = SessionScheduler(max_concurrency=1)
+    order = []
+    release = asyncio.Event()
+
+    async def blocker():
+        async with scheduler.slot("x", "xavier"):
+            await release.wait()
+
+    tasks = [asyncio.ensure_future(blocker())]
+    await asyncio.sleep(0)
+    for session_id in ("a1", "a2", "a3"):
+        tasks.append(asyncio.ensure_future(_run(scheduler, order, session_id, "alice", session_id)))
+    tasks.append(asyncio.ensure_future(_run(scheduler, order, "b1", "bob", "b1")))
+    tasks.append(asyncio.ensure_future(_run(scheduler, order, "c1", "carol", "c1")))
+    await _queued(scheduler, 5)
+    release.set()
+    await asyncio.gather(*tasks)
+
+    assert order == ["a1", "b1", "c1", "a2", "a3"]
+
+
+@pytest.mark.asyncio
+async def test_a_command_cancelled_while_queued_gives_up_its_turn():
+    scheduler = SessionScheduler(max_concurrency=1)
+    order = []
+    release = asyncio.Event()
+
+    async def blocker():
+        async with scheduler.slot("s", "alice"):
+            await release.wait()
+
+    first = asyncio.ensure_future(blocker())
+    await asyncio.sleep(0)
+    cancelled = asyncio.ensure_future(_run(scheduler, order, "s", "alice", "cancelled"))
+    later = asyncio.ensure_future(_run(scheduler, order, "s", "alice", "later"))
+    await _queued(scheduler, 2)
+    cancelled.cancel()
+    release.set()
+    await asyncio.gather(first, later)
+
+    assert cancelled.cancelled()
+    assert order == ["later"]
+    stats = scheduler.stats()
+    assert (stats["abandoned"], stats["queued"], stats["running"]) == (1, 0, 0)
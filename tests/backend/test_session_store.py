@@ -0,0 +1,163 @@
+import asyncio
+
+import pytest
+
+from app.core import e2b_stub
+from app.core.command_log import page_range
+
+
+def _session(session_id, user_id=None, status="active", expires_at=2000.0):
+    return {
+        "session_id": session_id,
+        "user_id": user_id,
+        "created_at": 1000.0,
+        "expires_at": expires_at,
+        "status": status,
+    }
+
+
+async def _fill(store, count, users=("alice", "bob")):
+    for i in range(count):
+        await store.put(_session(f"s{i}", users[i % len(users)]), evict_at=3000.0)
+
+
+async def _all_pages(store, **filters):
+    pages, cursor = [], None
+    while True:
+        items, cursor = await store.page(cursor=cursor, **filters)
+        pages.append([item["session_id"] for item in items])
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.asyncio
+async def test_page_walks_sessions_in_creation_order(store):
+    await _fill(store, 7)
+
+    pages = await _all_pages(store, limit=3)
+
+    assert pages == [["s0", "s1", "s2"], ["s3", "s4", "s5"], ["s6"]]
+    assert await store.count() == 7
+
+
+@pytest.mark.asyncio
+async def test_page_filters_by_user_and_status(store):
+    await _fill(store, 6)
+    await store.update("s2", {"status": "closed"})
+    await store.update("s3", {"status": "closed"})
+
+    assert await _all_pages(store, limit=2, user_id="alice") == [["s0", "s2"], ["s4"]]
+    assert await _all_pages(store, limit=2, status="closed") == [["s2", "s3"]]
+    assert await _all_pages(store, limit=10, status="active") == [["s0", "s1", "s4", "s5"]]
+
+
+@pytest.mark.asyncio
+async def test_page_lists_sessions_past_their_ttl_as_expired(store):
+    await store.put(_session("fresh", expires_at=2000.0), evict_at=3000.0)
+    await store.put(_session("stale", expires_at=500.0), evict_at=3000.0)
+    await store.put(_session("marked", status="expired", expires_at=500.0), evict_at=3000.0)
+
+    expired = await _all_pages(store, limit=1, status="expired", now=1000.0)
+    active = await _all_pages(store, status="active", now=1000.0)
+
+    assert [ids for ids in expired if ids] == [["stale"], ["marked"]]
+    assert active == [["fresh"]]
+
+
+@pytest.mark.asyncio
+async def test_command_pages_read_through_the_spilled_log(store):
+    await store.put(_session("s"), evict_at=3000.0)
+    for i in range(11):
+        assert await store.append_command("s", {"command": f"c{i}"}) == i + 1
+
+    ascending, cursor = [], None
+    while True:
+        page = await store.command_page("s", cursor=cursor, limit=4)
+        ascending += [entry["seq"] for entry in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    newest = await store.command_page("s", limit=3, descending=True)
+    older = await store.command_page("s", cursor=newest["next_cursor"], limit=3, descending=True)
+
+    assert ascending == list(range(1, 12))
+    assert [entry["seq"] for entry in newest["items"]] == [11, 10, 9]
+    assert [entry["seq"] for entry in older["items"]] == [8, 7, 6]
+    assert newest["total"] == 11
+    assert (await store.get("s"))["command_count"] == 11
+
+
+@pytest.mark.asyncio
+async def test_writes_to_an_evicted_session_raise_key_error(store):
+    await store.put(_session("gone"), evict_at=3000.0)
+    await store.delete(["gone"])
+
+    with pytest.raises(KeyError):
+        await store.append_command("gone", {"command": "ls"})
+    with pytest.raises(KeyError):
+        await store.update("gone", {"status": "closed"})
+    assert await store.get("gone") is None
+    assert await store.count() == 0
+
+
+@pytest.mark.asyncio
+async def test_eviction_racing_writes_leaves_no_orphan_session(store):
+    await store.put(_session("s"), evict_at=3000.0)
+
+    results = await asyncio.gather(
+        *(store.append_command("s", {"command": str(i)}) for i in range(5)),
+        store.delete(["s"]),
+        *(store.update("s", {"status": "closed"}) for _ in range(3)),
+        return_exceptions=True,
+    )
+
+    assert all(result is None or isinstance(result, (int, KeyError)) for result in results)
+    assert await store.get("s") is None
+    assert await _all_pages(store) == [[]]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_appends_get_distinct_sequence_numbers(store):
+    await store.put(_session("s"), evict_at=3000.0)
+
+    seqs = await asyncio.gather(*(store.append_command("s", {"command": str(i)}) for i in range(20)))
+    page = await store.command_page("s", limit=50)
+
+    assert sorted(seqs) == list(range(1, 21))
+    assert [entry["seq"] for entry in page["items"]] == list(range(1, 21))
+
+
+@pytest.mark.asyncio
+async def test_due_claims_each_session_once_and_honours_extensions(store):
+    await store.put(_session("a"), evict_at=100.0)
+    await store.put(_session("b"), evict_at=100.0)
+    await store.update("b", {"expires_at": 2500.0}, evict_at=300.0)
+
+    assert sorted(await store.due(200.0)) == ["a"]
+    assert await store.due(200.0) == []
+    assert await store.due(400.0) == ["b"]
+
+
+@pytest.mark.asyncio
+async def test_reap_evicts_due_sessions_and_notifies_listeners(store, monkeypatch):
+    evicted = []
+    monkeypatch.setattr(e2b_stub, "_EVICTION_LISTENERS", [evicted.extend])
+    kept = await e2b_stub.create_session("alice")
+    closed = await e2b_stub.create_session("bob")
+    await e2b_stub.exec_command(closed["session_id"], "ls")
+    await e2b_stub.close_session(closed["session_id"])
+
+    reaped = await e2b_stub.reap(now=closed["created_at"] + e2b_stub._RETENTION + 1, batch_size=1)
+
+    assert reaped == 1
+    assert evicted == [closed["session_id"]]
+    assert await store.get(closed["session_id"]) is None
+    assert (await store.command_page(closed["session_id"]))["total"] == 0
+    assert (await e2b_stub.get_session(kept["session_id"]))["status"] == "active"
+
+
+def test_page_range_rejects_negative_cursors():
+    assert page_range(10, None, 4, descending=False) == (1, 4, 4)
+    assert page_range(10, None, 4, descending=True) == (7, 10, 7)
+    with pytest.raises(ValueError):
+        page_range(10, -1, 4, descending=False)
@@ -0,0 +1,88 @@
+import pytest
+
+from app.core.sse import SSEParser, StreamAccumulator
+
+STREAM = (
+    b'data: {"choices":[{"index":0,"delta":{"role":"assistant","content":"Hel"}}]}\n\n'
+    b": keep-alive\n\n"
+    b'data: {"choices":[{"index":0,"delta":{"content":"lo"}}]}\n\n'
+    b"event: note\nid: 7\ndata: first line\ndata: second line\n\n"
+    b"data: [DONE]\n\n"
+)
+
+
+def _feed(parser, chunks):
+    events = []
+    for chunk in chunks:
+        events += parser.feed(chunk)
+    return events + parser.flush()
+
+
+def _split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, len(STREAM)])
+def test_events_are_the_same_however_the_stream_is_chunked(size):
+    events = _feed(SSEParser(), _split(STREAM, size))
+
+    assert [event.data for event in events] == [
+        b'{"choices":[{"index":0,"delta":{"role":"assistant","content":"Hel"}}]}',
+        b'{"choices":[{"index":0,"delta":{"content":"lo"}}]}',
+        b"first line\nsecond line",
+        b"[DONE]",
+    ]
+    assert (events[2].event, events[2].id) == (b"note", b"7")
+    assert events[-1].is_done
+    assert b"".join(event.raw for event in events) == STREAM.replace(b": keep-alive\n\n", b"")
+
+
+@pytest.mark.parametrize("size", [1, 2, 5])
+def test_crlf_and_cr_line_endings_split_across_chunks(size):
+    stream = b"data: a\r\n\r\ndata: b\r\rdata: c\r\ndata: d\r\n\r\n"
+
+    events = _feed(SSEParser(), _split(stream, size))
+
+    assert [event.data for event in events] == [b"a", b"b", b"c\nd"]
+
+
+def test_an_event_completes_only_at_its_blank_line():
+    parser = SSEParser()
+
+    assert parser.feed(b"data: {\"a\"") == []
+    assert parser.feed(b": 1}\n") == []
+    events = parser.feed(b"\ndata: next")
+
+    assert [event.json() for event in events] == [{"a": 1}]
+    assert [event.data for event in parser.flush()] == [b"next"]
+
+
+def test_accumulator_rebuilds_the_completion_from_chunks():
+    accumulator = StreamAccumulator()
+    for event in _feed(SSEParser(), _split(STREAM, 5))[:2]:
+        accumulator.add(event.json())
+    accumulator.add({
+        "id": "c1",
+        "model": "m",
+        "choices": [{
+            "index": 0,
+            "delta": {"tool_calls": [{"index": 0, "id": "t1", "function": {"name": "run", "arguments": "{\"x\""}}]},
+        }],
+    })
+    accumulator.add({
+        "choices": [{
+            "index": 0,
+            "delta": {"tool_calls": [{"index": 0, "function": {"arguments": ": 1}"}}]},
+            "finish_reason": "tool_calls",
+        }],
+        "usage": {"total_tokens": 9},
+    })
+
+    result = accumulator.result()
+
+    assert accumulator.text == "Hello"
+    assert result["id"] == "c1" and result["usage"] == {"total_tokens": 9}
+    assert result["choices"][0]["finish_reason"] == "tool_calls"
+    assert result["choices"][0]["message"]["tool_calls"] == [
+        {"id": "t1", "type": "function", "function": {"name": "run", "arguments": "{\"x\": 1}"}}
+    ]